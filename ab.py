@@ -1,10 +1,13 @@
 #!/usr/bin/env python2
 
-from github import Github
+import callstats
 import config
+import ghclient
 import re
 
 import argparse
+import atexit
+import profiling
 import os
 #import sh
 import sys
@@ -72,8 +75,9 @@ def git_add(recipe):
 
     git_args = ['git', 'add', recipe]
 
-    process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
-    stdoutput, stderroutput = process.communicate()
+    with profiling.span('git', git_args[1]):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
     if 'fatal' in  stdoutput:
         print('git_add fatal')
 
@@ -81,16 +85,18 @@ def git_commit(commit_msg):
 
     git_args = ['git', 'commit', '-m', commit_msg]
 
-    process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
-    stdoutput, stderroutput = process.communicate()
+    with profiling.span('git', git_args[1]):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
     if 'fatal' in  stdoutput:
         print('git_commit fatal')
         
 def git_show(sha):
     git_args = ['git', 'show', sha]
 
-    process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
-    stdoutput, stderroutput = process.communicate()
+    with profiling.span('git', git_args[1]):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
     if 'fatal' in  stdoutput:
         print(stdoutput)
         print('git_show fatal %s' % sha)
@@ -101,8 +107,9 @@ def git_log(parms_array):
 
     git_args = ['git', 'log']+parms_array
 
-    process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
-    stdoutput, stderroutput = process.communicate()
+    with profiling.span('git', git_args[1]):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
 
     if 'fatal' in  stdoutput:
         print('fatal')
@@ -115,8 +122,9 @@ def find_recipes(i_args):
     
     git_args = ['git','--no-pager','grep','-l', '-e', '_URI', '--and', '-e', i_args.remote+'/'+i_args.org+'/'+i_args.project_name]
 
-    process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
-    stdoutput, stderroutput = process.communicate()
+    with profiling.span('git', 'grep'):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
     if 'fatal' in  stdoutput:
         print('fatal')
     else:
@@ -166,7 +174,9 @@ def find_and_process_bumps(args):
             else:
                 continue
 
-            l_commits = l_repo.compare(recipe_sha, project_sha).commits
+            with profiling.span('compare walk', project_name):
+                l_commits = ghclient.compare_commits(l_repo, recipe_sha,
+                                                     project_sha)
 
             # Go through all commits check for duplicates
             commit_msg_dict = dict()
@@ -237,6 +247,18 @@ Generate commit.
     l_parser.add_argument(
         '-o', '--org', default='ibm-openbmc', 
         help='set org value to scan for')
+    l_parser.add_argument(
+        '--profile', dest='profile', nargs='?', const='ab.prof',
+        default=None,
+        help='Profile the run: write the cProfile statistics to the given ' \
+             +'file (default ab.prof, read with python -m pstats) and the ' \
+             +'wall clock time of each phase (compare walk, git) to ' \
+             +'stderr and <file>.txt')
+    l_parser.add_argument(
+        '--stats', dest='stats', nargs='?', const='-', default=None,
+        help='At exit, report the GitHub calls made per endpoint (count, ' \
+             +'bytes, errors, latency percentiles), on stderr or as JSON ' \
+             +'to the given file')
 
     return l_parser.parse_args(i_args)
 
@@ -253,36 +275,15 @@ def rchop(thestring, ending):
     return thestring
 
 ###############################################################################
-# @brief Updates the repo under the given path or clones it from the
-#        uri if it doesn't yet exist
+# @brief Gets the GitHub repo for a URI from the registry shared by all
+#        tools, see ghclient.py
 #
-# @param i_uri  : The URI to the remote repo to clone
-# @param i_path : The file path to where the repo currently exists or
-#                 where it will be created
+# @param i_uri  : The URI of the remote repo
+#
+# @return The PyGithub Repository object
 ###############################################################################
 def get_repo(i_uri):
-
-    l_uri = i_uri.strip()
-    l_values = l_uri.split('/')
-
-    count = 0;
-    for l_value in l_values:
-        if 'github.ibm.com' in l_value:
-            l_repo_name = l_values[count+1] + "/" + rchop(l_values[count+2],'.git')
-            print l_repo_name
-            l_github = Github(login_or_token = config.py_ibm_token, base_url='https://github.ibm.com/api/v3')
-            l_repo = l_github.get_repo(l_repo_name)
-        
-        elif 'github.com' in l_value:
-            l_repo_name = l_values[count+1] + "/" + l_values[count+2]
-            l_repo_name = rreplace(l_repo_name, ".git", '', 1)
-            print l_repo_name
-            l_github = Github(login_or_token = config.py_token)
-            l_repo = l_github.get_repo(l_repo_name)
-        count += 1
-
-
-    return l_repo
+    return ghclient.get_repo(i_uri)
 
 def get_uri_info(recipe):
 
@@ -334,6 +335,12 @@ def main(i_args):
     # Parse the arguments
     l_args = parse_arguments(i_args)
 
+    if l_args.stats:
+        callstats.enable()
+        atexit.register(callstats.report, l_args.stats)
+    if l_args.profile:
+        profiling.start()
+        atexit.register(profiling.report, l_args.profile)
 
     digits = len(str(l_args.project_sha))
     if digits != 40:
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file crn_bench
+# @brief Record/replay benchmark of crn.py
+#
+# Record a real run once, with network access, into bench/fixtures/<name>.zip:
+#   bench/crn_bench.py record 57.9-57.10 -- fw1020.00-57.9 fw1020.00-57.10 -j 8
+#
+# A case is the bundle crn.py --export-bundle writes (see runbundle.py), so
+# it can also be read back with crn.py --from-bundle.
+#
+# Then measure it offline as often as needed. Every recorded case is run in
+# a fresh process against a local replay server, with fakes/cqcmd.pl and
+# fakes/ewm.py standing in for ClearQuest and EWM:
+#   bench/crn_bench.py run [name ...] [--repeat 3] [--json out.json]
+#                          [--baseline earlier.json]
+#
+# For each case it reports the wall time of crn.main, the number of HTTP
+# requests, the requests that weren't recorded (misses, a replay with misses
+# doesn't do the work of the recorded run) and the peak RSS. The commit
+# cache and the report store are off in both modes, so every run does the
+# full work. Record without --mirror-dir and --pr-index, the bundle doesn't
+# have what they would have fetched.
+###############################################################################
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+FAKES_DIR = os.path.join(REPO_DIR, 'fakes')
+DEFAULT_FIXTURES = os.path.join(BENCH_DIR, 'fixtures')
+
+sys.path.insert(0, REPO_DIR)
+
+import replayserver  # noqa: E402
+import runbundle  # noqa: E402
+
+# Added to the recorded arguments, so a replay doesn't skip work on the caches
+# either. The recording is a bundle run, which has them off
+FULL_RUN_ARGS = ['--no-cache', '--no-report-store']
+
+
+def record(i_args):
+    import crn
+
+    if not os.path.isdir(i_args.fixtures):
+        os.makedirs(i_args.fixtures)
+    # The bundle is written at exit
+    crn.main(i_args.crn_args + ['--export-bundle', case_file(
+        i_args.fixtures, i_args.name)])
+
+
+def case_file(i_fixtures, i_name):
+    return os.path.join(i_fixtures, i_name + '.zip')
+
+
+def load_args(i_case_file):
+    with zipfile.ZipFile(i_case_file) as l_zip:
+        return json.loads(l_zip.read(runbundle.INFO_FILE).decode(
+            'utf-8'))['args']
+
+
+###############################################################################
+# @brief Runs one replay, in the process crn_bench.py run starts for it
+###############################################################################
+def replay(i_args):
+    import crn
+
+    replayserver.replay_to(i_args.server)
+    l_cqcmd = os.path.join(FAKES_DIR, 'cqcmd.pl')
+
+    l_start = time.time()
+    crn.main(load_args(i_args.case) + FULL_RUN_ARGS + ['--cqcmd', l_cqcmd])
+    l_wall = time.time() - l_start
+
+    with open(i_args.result, 'w') as l_file:
+        json.dump({'wall': l_wall,
+                   'peak_kb': resource.getrusage(
+                       resource.RUSAGE_SELF).ru_maxrss}, l_file)
+
+
+def run_case(i_case_file, i_bundle, i_server, i_show_output):
+    l_env = dict(os.environ)
+    l_env['PYTHONPATH'] = os.pathsep.join(
+        [FAKES_DIR, REPO_DIR] + [l_path for l_path in
+                                 [os.environ.get('PYTHONPATH')] if l_path])
+    l_env['PATH'] = FAKES_DIR + os.pathsep + os.environ.get('PATH', '')
+    l_env.pop('CQCMD_FAKE_DATA', None)
+
+    l_output = None if i_show_output else subprocess.DEVNULL
+    with tempfile.TemporaryDirectory(prefix='crn-bench-') as l_work_dir:
+        # fakes/cqcmd.pl and fakes/ewm.py read their part of the bundle
+        l_env['CQCMD_FAKE_REPLAY'] = i_bundle.extract(runbundle.CQCMD_FILE,
+                                                      l_work_dir)
+        l_env['EWM_FAKE_DATA'] = i_bundle.extract(runbundle.EWM_FILE,
+                                                  l_work_dir)
+        l_result_file = os.path.join(l_work_dir, 'result.json')
+        # Outputs crn.py writes relative to the current directory land in
+        # the scratch directory
+        l_status = subprocess.call(
+            [sys.executable, os.path.abspath(__file__), 'replay',
+             '--case', i_case_file, '--server', i_server.url,
+             '--result', l_result_file],
+            cwd=l_work_dir, env=l_env, stdout=l_output, stderr=l_output)
+        if l_status or not os.path.exists(l_result_file):
+            return None
+        with open(l_result_file) as l_file:
+            return json.load(l_file)
+
+
+def run(i_args):
+    l_names = i_args.names
+    if not l_names and os.path.isdir(i_args.fixtures):
+        l_names = sorted(l_name[:-len('.zip')]
+                         for l_name in os.listdir(i_args.fixtures)
+                         if l_name.endswith('.zip'))
+    if not l_names:
+        print('No recorded cases in {}, see crn_bench.py record'.format(
+            i_args.fixtures))
+        return 1
+
+    l_baseline = dict()
+    if i_args.baseline:
+        with open(i_args.baseline) as l_file:
+            l_baseline = json.load(l_file)
+
+    print('{:<24} {:>9} {:>9} {:>7} {:>10}'.format(
+        'case', 'wall s', 'requests', 'misses', 'peak MB'))
+    l_results = dict()
+    l_failed = 0
+    for l_name in l_names:
+        l_case_file = case_file(i_args.fixtures, l_name)
+        l_bundle = runbundle.BundleReader(l_case_file)
+        l_server = replayserver.ReplayServer(l_bundle)
+        l_server.start()
+        try:
+            l_runs = []
+            for l_count in range(i_args.repeat):
+                l_server.reset()
+                l_run = run_case(l_case_file, l_bundle, l_server,
+                                 i_args.show_output)
+                if l_run is None:
+                    break
+                l_run['requests'] = l_server.requests
+                l_run['misses'] = len(l_server.misses)
+                l_runs.append(l_run)
+        finally:
+            l_server.stop()
+            l_bundle.close()
+
+        if len(l_runs) < i_args.repeat:
+            print('{:<24} failed, see --show-output'.format(l_name))
+            l_failed += 1
+            continue
+        # Best wall time of the repeats, the other numbers don't vary
+        l_result = min(l_runs, key=lambda i_run: i_run['wall'])
+        l_results[l_name] = l_result
+        print('{:<24} {:>9.2f} {:>9} {:>7} {:>10.1f}{}'.format(
+            l_name, l_result['wall'], l_result['requests'],
+            l_result['misses'], l_result['peak_kb'] / 1024.0,
+            compare(l_result, l_baseline.get(l_name))))
+
+    if i_args.json:
+        with open(i_args.json, 'w') as l_file:
+            json.dump(l_results, l_file, indent=1, sort_keys=True)
+    return 1 if l_failed else 0
+
+
+def compare(i_result, i_baseline):
+    if not i_baseline:
+        return ''
+    return '   wall {:+.0%} requests {:+d} peak {:+.0%}'.format(
+        i_result['wall'] / i_baseline['wall'] - 1,
+        i_result['requests'] - i_baseline['requests'],
+        float(i_result['peak_kb']) / i_baseline['peak_kb'] - 1)
+
+
+def parse_arguments(i_args):
+    l_parser = argparse.ArgumentParser(
+        description='Record/replay benchmark of crn.py')
+    l_parser.add_argument(
+        '--fixtures', default=DEFAULT_FIXTURES,
+        help='Directory of the recorded cases (default bench/fixtures)')
+    l_subparsers = l_parser.add_subparsers(dest='command')
+    l_subparsers.required = True
+
+    l_record = l_subparsers.add_parser(
+        'record', help='Run crn.py for real and record it as a bundle')
+    l_record.add_argument('name', help='Name of the case')
+    l_record.add_argument('crn_args', nargs=argparse.REMAINDER,
+                          help='-- followed by the crn.py arguments')
+
+    l_run = l_subparsers.add_parser(
+        'run', help='Replay recorded cases and report their cost')
+    l_run.add_argument('names', nargs='*',
+                       help='Cases to run (default all)')
+    l_run.add_argument('--repeat', type=int, default=1,
+                       help='Runs per case, the fastest one is reported')
+    l_run.add_argument('--json', default=None,
+                       help='Write the results to this file')
+    l_run.add_argument('--baseline', default=None,
+                       help='Results file of an earlier run to compare with')
+    l_run.add_argument('--show-output', action='store_true',
+                       help='Let the crn.py output through')
+
+    l_replay = l_subparsers.add_parser('replay')
+    l_replay.add_argument('--case', required=True)
+    l_replay.add_argument('--server', required=True)
+    l_replay.add_argument('--result', required=True)
+
+    l_args = l_parser.parse_args(i_args)
+    if l_args.command == 'record':
+        if l_args.crn_args[0:1] == ['--']:
+            l_args.crn_args = l_args.crn_args[1:]
+        if not l_args.crn_args:
+            l_parser.error('record needs the crn.py arguments after --')
+    return l_args
+
+
+def main(i_args):
+    l_args = parse_arguments(i_args)
+    if l_args.command == 'record':
+        return record(l_args)
+    if l_args.command == 'run':
+        return run(l_args)
+    return replay(l_args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file replayserver
+# @brief Replays the GitHub answers of a bundle (see runbundle.py) from a
+#        local HTTP server, see crn_bench.py
+#
+# crn.py --from-bundle answers its requests inside the process. The bench
+# sends them over HTTP instead: the ghclient sessions send the requests of
+# every GitHub host to a ReplayServer, through the token pool scheduling and
+# connection pools as usual, so the replay pays for the network path too.
+# The URLs crn.py sees stay the recorded ones.
+###############################################################################
+
+import collections
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import config
+import ghclient
+import ratelimit
+from runbundle import (DEFAULT_PORTS, exchange_key, to_bytes, to_text,
+                       url_origin)
+
+
+###############################################################################
+# @class ReplayServer
+# @brief Local HTTP server answering with the recorded answers
+#
+# Requests come in as /<recorded netloc>/<recorded path>. A request sent
+# several times gets the answers the bundle has for it in order, then the
+# last one again, as with --from-bundle. Requests that weren't recorded get
+# a 404 and are counted as misses.
+###############################################################################
+class ReplayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, i_bundle, i_address='127.0.0.1'):
+        ThreadingHTTPServer.__init__(self, (i_address, 0), ReplayHandler)
+        self.answers = i_bundle.answers()
+        self.served = collections.Counter()
+        self.requests = 0
+        self.misses = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(*self.server_address[0:2])
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def reset(self):
+        with self._lock:
+            self.served.clear()
+            self.requests = 0
+            self.misses = []
+
+    def answer(self, i_method, i_path, i_body):
+        l_url = urlsplit(i_path)
+        l_netloc, l_sep, l_path = l_url.path[1:].partition('/')
+        l_key = exchange_key(i_method, l_netloc, '/' + l_path, l_url.query,
+                             i_body)
+        with self._lock:
+            self.requests += 1
+            l_answers = self.answers.get(l_key)
+            if not l_answers:
+                self.misses.append(l_key)
+                return None
+            l_count = self.served[l_key]
+            self.served[l_key] += 1
+        return l_answers[min(l_count, len(l_answers) - 1)]
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes, without this every answer
+    # waits for the delayed ACK of the client
+    disable_nagle_algorithm = True
+
+    def replay(self):
+        l_length = int(self.headers.get('Content-Length') or 0)
+        l_body = to_text(self.rfile.read(l_length)) if l_length else None
+        l_answer = self.server.answer(self.command, self.path, l_body)
+        if l_answer is None:
+            l_status = 404
+            l_headers = {'Content-Type': 'application/json'}
+            l_content = json.dumps({'message': 'Not Found',
+                                    'documentation_url': 'not recorded'})
+        else:
+            l_status = l_answer['status']
+            l_headers = l_answer['headers']
+            l_content = l_answer['content']
+        l_data = to_bytes(l_content or '')
+        self.send_response(l_status)
+        for l_name, l_value in l_headers.items():
+            self.send_header(l_name, l_value)
+        self.send_header('Content-Length', str(len(l_data)))
+        self.end_headers()
+        self.wfile.write(l_data)
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = replay
+
+    def log_message(self, *args):
+        pass
+
+
+###############################################################################
+# @class ForwardAdapter
+# @brief Scheduled transport adapter sending the requests of a recorded
+#        origin to a ReplayServer
+###############################################################################
+class ForwardAdapter(ratelimit.SchedulerAdapter):
+    def __init__(self, i_pool, i_origin, i_target, **kwargs):
+        super(ForwardAdapter, self).__init__(i_pool, **kwargs)
+        self.origin = i_origin
+        self.target = i_target + '/' + urlsplit(i_origin).netloc
+
+    def send(self, request, **kwargs):
+        if url_origin(request.url) != self.origin:
+            return super(ForwardAdapter, self).send(request, **kwargs)
+        l_url = urlsplit(request.url)
+        l_forwarded = request.copy()
+        l_forwarded.url = self.target + request.url[
+            len(l_url.scheme) + 3 + len(l_url.netloc):]
+        l_response = super(ForwardAdapter, self).send(l_forwarded, **kwargs)
+        # To the caller the answer comes from the recorded origin
+        l_response.request = request
+        l_response.url = request.url
+        return l_response
+
+
+###############################################################################
+# @brief Sends the requests of every GitHub host to a ReplayServer, has to be
+#        called before the first request
+#
+# @param i_url : URL of the ReplayServer
+###############################################################################
+def replay_to(i_url):
+    for l_host, (l_base_url, l_token_name) in ghclient.HOSTS.items():
+        # The replay server takes any token, replays don't need credentials
+        if not getattr(config, l_token_name, None):
+            setattr(config, l_token_name, 'replay')
+        l_session = ghclient.get_session(l_host)
+        for l_origin in sorted(set([url_origin(l_base_url), url_origin(
+                ghclient.GRAPHQL_URLS[l_host])])):
+            l_adapter = ForwardAdapter(
+                ghclient.get_pool(l_host), l_origin, i_url,
+                pool_connections=1, pool_maxsize=ghclient.pool_size,
+                max_retries=3)
+            l_session.mount(l_origin + '/', l_adapter)
+            l_url = urlsplit(l_origin)
+            if l_url.port is None and l_url.scheme in DEFAULT_PORTS:
+                l_session.mount('{}:{}/'.format(
+                    l_origin, DEFAULT_PORTS[l_url.scheme]), l_adapter)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file report_memory
+# @brief Memory taken by CommitReport trees
+#
+# Builds a synthetic release range, a few thousand top level commits of
+# which some bump a subrepo, one of them the kernel with a large number of
+# commits, once with CommitReport and once with a plain __dict__ class laid
+# out like CommitReport used to be, and prints what each tree takes.
+#
+# Usage: bench/report_memory.py [--commits N] [--kernel N]
+###############################################################################
+
+import argparse
+import hashlib
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir))
+
+from commitreport import CommitReport  # noqa: E402
+
+AUTHORS = ['Author {}'.format(l_count) for l_count in range(300)]
+REPOS = ['git://github.com/openbmc/repo{}'.format(l_count)
+         for l_count in range(50)]
+
+
+###############################################################################
+# @class DictReport
+# @brief CommitReport as it was before __slots__: one __dict__ and three
+#        lists per report, its own copy of every string
+###############################################################################
+class DictReport:
+    def __init__(self, i_repo_uri, i_repo_name, i_sha, i_nice_name,
+                 i_author_name, i_summary, i_insertions, i_deletions,
+                 i_closed_issues, i_notes, i_stgDefects):
+        self.repo_uri = i_repo_uri
+        self.repo_name = i_repo_name
+        self.sha = i_sha
+        self.nice_name = i_nice_name
+        self.author_name = i_author_name
+        self.summary = i_summary
+        self.insertions = i_insertions
+        self.deletions = i_deletions
+        self.closed_issues = i_closed_issues
+        self.notes = i_notes
+        self.stgDefects = i_stgDefects
+        self.subreports = []
+
+    def add_subreports(self, i_reports):
+        self.subreports.extend(i_reports)
+
+
+def make_report(i_class, i_count, i_repo_uri):
+    # Strings are built the way the API answers come in, a new object each
+    l_sha = hashlib.sha1(str(i_count).encode()).hexdigest()
+    l_issues = []
+    l_stgDefects = []
+    if i_count % 20 == 0:
+        l_issues = ['SW{}'.format(500000 + i_count)]
+        l_stgDefects = [str(300000 + i_count)]
+    return i_class(''.join(i_repo_uri), i_repo_uri.split('/')[-1],
+                   l_sha, l_sha[0:7], ''.join(AUTHORS[i_count % len(AUTHORS)]),
+                   'subsystem: change number {}'.format(i_count),
+                   i_count % 50, i_count % 7, l_issues, [], l_stgDefects)
+
+
+def build_tree(i_class, i_commits, i_kernel):
+    l_reports = []
+    l_count = 0
+    for l_commit in range(i_commits):
+        l_report = make_report(i_class, l_count, 'github.ibm.com/openbmc/openbmc')
+        l_count += 1
+        if l_commit == 0:
+            l_bumped = i_kernel
+            l_uri = 'git://github.com/openbmc/linux'
+        elif l_commit % 10 == 0:
+            l_bumped = 5
+            l_uri = REPOS[l_commit % len(REPOS)]
+        else:
+            l_bumped = 0
+        l_subreports = []
+        for l_sub in range(l_bumped):
+            l_subreports.append(make_report(i_class, l_count, l_uri))
+            l_count += 1
+        l_report.add_subreports(l_subreports)
+        l_reports.append(l_report)
+    return l_reports, l_count
+
+
+def measure(i_class, i_commits, i_kernel):
+    tracemalloc.start()
+    l_before = tracemalloc.get_traced_memory()[0]
+    l_reports, l_count = build_tree(i_class, i_commits, i_kernel)
+    l_size = tracemalloc.get_traced_memory()[0] - l_before
+    tracemalloc.stop()
+    del l_reports
+    return l_size, l_count
+
+
+def main(i_args):
+    l_parser = argparse.ArgumentParser(
+        description='Memory taken by CommitReport trees')
+    l_parser.add_argument('--commits', type=int, default=2000,
+                          help='Top level commits (default 2000)')
+    l_parser.add_argument('--kernel', type=int, default=20000,
+                          help='Commits of the kernel bump (default 20000)')
+    l_args = l_parser.parse_args(i_args)
+
+    l_results = []
+    for l_class in (DictReport, CommitReport):
+        l_size, l_count = measure(l_class, l_args.commits, l_args.kernel)
+        l_results.append(l_size)
+        print('{:<14} {:>8} reports {:>10.1f} KiB {:>7.0f} bytes/report'
+              .format(l_class.__name__, l_count, l_size / 1024.0,
+                      float(l_size) / l_count))
+    print('CommitReport takes {:.0f}% of DictReport'.format(
+        100.0 * l_results[1] / l_results[0]))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file scan_corpus
+# @brief Checks the precompiled scanner of crn.py (find_fixes_and_notes,
+#        find_fixes, find_notes, get_bump_info) against the plain re.findall
+#        and re.search calls it replaced, and times both
+#
+#   bench/scan_corpus.py [--seed 7] [--count 20000] [--repeat 3]
+#
+# The corpus is the hand written cases below plus --count generated PR texts
+# of each kind, keyword dense ones pasted together out of the pieces the
+# patterns trip over and typical review comments, and --count generated
+# recipe patches. The same seed always gives the same corpus. Every text has
+# to give exactly what the reference functions give, in the same order. The
+# exit status is 1 when one doesn't.
+###############################################################################
+
+import argparse
+import logging
+import os
+import random
+import re
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+FAKES_DIR = os.path.join(REPO_DIR, 'fakes')
+
+# fakes/ewm.py stands in for the ewm module crn.py connects with at import
+sys.path[:0] = [FAKES_DIR, REPO_DIR]
+
+import crn  # noqa: E402
+
+JAZZ_URLS = [
+    'https://jazz07.rchland.ibm.com:13443/jazz/resource/itemName/com.ibm.team.workitem.WorkItem/',
+    'https://jazz07.rchland.ibm.com:13443'
+    '/jazz/web/projects/CSSD#action=com.ibm.team.workitem.viewWorkItem&id=',
+]
+
+
+###############################################################################
+# Reference implementations, the code the scanner replaced
+###############################################################################
+def reference_find_fixes(i_data):
+    l_closed_issues = []
+    l_stgDefects = []
+
+    for cq in re.findall('fixes.+([S|F]W\d\d\d\d\d\d).*', i_data, flags=re.I):
+        logging.info(cq)
+        l_closed_issues.append(cq)
+    for ewm in re.findall('fixes[: ]*(PE\w+)', i_data, flags=re.I):
+        logging.info(ewm)
+        l_closed_issues.append(ewm)
+    for stg in re.findall('fixes[: ]*\s+(\d{6,8})', i_data, flags=re.I):
+        logging.info(stg)
+        l_stgDefects.append(stg)
+    for jazz_url in JAZZ_URLS:
+        regex = 'fixes[: ]*\s+' + re.escape(jazz_url) + '(\d{6,8})'
+        for stg in re.findall(regex, i_data, flags=re.I):
+            logging.info(stg)
+            l_stgDefects.append(stg)
+
+    logging.info("List of closed issues and stgDefects")
+    logging.info(l_closed_issues)
+    logging.info(l_stgDefects)
+    return l_closed_issues, l_stgDefects
+
+
+def reference_find_notes(i_data):
+    l_notes = []
+    release_notes = re.search(r'Release note[: ](.*)', i_data,
+                              flags=re.I | re.DOTALL)
+    if release_notes:
+        for line in release_notes.group(1).splitlines():
+            if "::" in line:
+                l_notes.append(line.split('::')[0].strip())
+                break
+            l_notes.append(line.strip())
+    return l_notes
+
+
+def reference_get_bump_info(i_file, i_repo):
+    l_old_hash = None
+    l_new_hash = None
+    l_old_hash_match = re.search('-[A-Z_]*SRCREV[+=? ]+"([a-f0-9]+)"',
+                                 i_file.patch)
+    l_new_hash_match = re.search('\+[A-Z_]*SRCREV[+=? ]+"([a-f0-9]+)"',
+                                 i_file.patch)
+    if l_old_hash_match:
+        l_old_hash = l_old_hash_match.group(1)
+    if l_new_hash_match:
+        l_new_hash = l_new_hash_match.group(1)
+
+    l_uri = None
+    l_uri_match = re.search('_URI[+=? ]+"([-a-zA-Z0-9/:\.]+)"', i_file.patch)
+    if l_uri_match:
+        l_uri = l_uri_match.group(1)
+    l_uri_match = re.search('_URI[+=? ]+"([-a-zA-Z0-9/:\.@]+);', i_file.patch)
+    if l_uri_match:
+        l_uri = l_uri_match.group(1)
+    l_uri_match = re.search('\+SRC_URI[+=? ]+"([-a-zA-Z0-9/:\.@]+);',
+                            i_file.patch)
+    if l_uri_match:
+        l_uri = l_uri_match.group(1)
+
+    return l_uri, l_new_hash, l_old_hash
+
+
+###############################################################################
+# Corpus
+###############################################################################
+CASES = [
+    '',
+    'LGTM',
+    'Fixes SW552204',
+    'fixes: SW552204 and fixes FW123456',
+    'This fixes SW552204\nand also fixes SW552205',
+    'Fixes: PE00ABC12',
+    'fixes  1234567',
+    'Fixes: 12345678 fixes 123456789',
+    'fixesfixes 1234567',
+    'Fixes: ' + JAZZ_URLS[0] + '313544',
+    'fixes ' + JAZZ_URLS[1] + '3135440',
+    'S|W123456 fixes S|W123456',
+    'Release note: Adds the thing',
+    'release note the first line\nsecond line :: rest\nthird',
+    'Release Note:\n  one\n  two',
+    'Release note: a\nRelease note: b',
+    'fixes SW552204\nRelease note: fixes SW552205\nmore fixes 1234567',
+    'Release noteX fixes 1234567 release note: late',
+    u'Fixes SW552204 ſ é release note: über',
+]
+
+FRAGMENTS = [
+    'fixes', 'Fixes:', 'FIXES ', 'fixes:  ', 'fixes\n', 'SW123456', 'fw654321',
+    'S|W', 'sw12345', 'PE00ABC12', 'pe1', '1234567', '12345678', '123', '\n',
+    ' ', 'word ', 'Release note: ', 'release note ', 'Release noteX', '::',
+    u'ſ', 'fixesfixes', JAZZ_URLS[0], JAZZ_URLS[1],
+    'Fixes: ' + JAZZ_URLS[0] + '1234567', 'fixes ' + JAZZ_URLS[1] + '7654321',
+    'See ', 'Signed-off-by: Dev <dev@example.com>\n',
+    'lorem ipsum dolor sit amet ' * 3,
+]
+
+PATCH_LINES = [
+    '-SRCREV = "abc123"\n', '+SRCREV = "def456"\n', '+SRCREV_pn-x ?= "a1"\n',
+    '-SRCREV_pn-x ?= "b2"\n', ' SRC_URI = "git://github.com/openbmc/pldm;branch=1"\n',
+    '+SRC_URI += "git://github.ibm.com/openbmc/x;nobranch=1"\n',
+    '-SRC_URI = "git://github.com/openbmc/old;branch=master"\n',
+    'KSRC = "git://github.ibm.com/openbmc/linux;branch=dev-6.1"\n',
+    '_URI = "git://github.com/a/b"\n', ' some context line\n',
+    '+DEPENDS += "foo"\n', '@@ -1,4 +1,4 @@\n',
+]
+
+
+class PatchFile(object):
+    def __init__(self, i_patch):
+        self.patch = i_patch
+
+
+def make_corpus(i_seed, i_count):
+    l_random = random.Random(i_seed)
+    l_dense = [''.join(l_random.choice(FRAGMENTS)
+                       for l_count in range(l_random.randint(0, 60)))
+               for l_count in range(i_count)]
+    # Most review comments have none of the keywords
+    l_plain = ['LGTM, thanks!\n' * l_random.randint(1, 5)
+               + 'ci passed on build {}\n'.format(l_count)
+               for l_count in range(i_count)]
+    l_patches = [PatchFile(''.join(l_random.choice(PATCH_LINES)
+                                   for l_count in range(
+                                       l_random.randint(0, 12))))
+                 for l_count in range(i_count)]
+    return CASES + l_dense, l_plain, l_patches
+
+
+###############################################################################
+# @return The texts or patches whose results differ, with both results
+###############################################################################
+def check_texts(i_texts):
+    l_mismatches = []
+    for l_text in i_texts:
+        l_fixes = reference_find_fixes(l_text)
+        l_notes = reference_find_notes(l_text)
+        l_results = [crn.find_fixes(l_text), crn.find_notes(l_text),
+                     crn.find_fixes_and_notes(l_text)]
+        if l_results != [l_fixes, l_notes, l_fixes + (l_notes,)]:
+            l_mismatches.append((l_text, (l_fixes, l_notes), l_results))
+    return l_mismatches
+
+
+def check_patches(i_patches):
+    return [(l_file.patch, reference_get_bump_info(l_file, None),
+             crn.get_bump_info(l_file, None)) for l_file in i_patches
+            if reference_get_bump_info(l_file, None)
+            != crn.get_bump_info(l_file, None)]
+
+
+def timed(i_function, i_items, i_repeat):
+    l_best = None
+    for l_count in range(i_repeat):
+        l_start = time.perf_counter()
+        for l_item in i_items:
+            i_function(l_item)
+        l_time = time.perf_counter() - l_start
+        l_best = l_time if l_best is None else min(l_best, l_time)
+    return l_best
+
+
+def reference_comment(i_text):
+    return reference_find_fixes(i_text), reference_find_notes(i_text)
+
+
+def reference_patch(i_file):
+    return reference_get_bump_info(i_file, None)
+
+
+def scanner_patch(i_file):
+    return crn.get_bump_info(i_file, None)
+
+
+def parse_arguments(i_args):
+    l_parser = argparse.ArgumentParser(
+        description='Check and time the crn.py scanner against plain regexes')
+    l_parser.add_argument(
+        '--seed', type=int, default=7,
+        help='Seed of the generated corpus (default 7)')
+    l_parser.add_argument(
+        '--count', type=int, default=20000,
+        help='Generated texts of each kind and patches (default 20000)')
+    l_parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='Timed runs over the corpus, the fastest one is reported')
+    return l_parser.parse_args(i_args)
+
+
+def main(i_args):
+    l_args = parse_arguments(i_args)
+    logging.basicConfig(level=logging.WARNING)
+    l_dense, l_plain, l_patches = make_corpus(l_args.seed, l_args.count)
+
+    l_mismatches = check_texts(l_dense + l_plain)
+    l_patch_mismatches = check_patches(l_patches)
+    for l_mismatch in (l_mismatches + l_patch_mismatches)[:10]:
+        print('mismatch for {!r}\n  reference {!r}\n  scanner   {!r}'.format(
+            *l_mismatch))
+    print('{} texts, {} patches: {} mismatches'.format(
+        len(l_dense) + len(l_plain), len(l_patches),
+        len(l_mismatches) + len(l_patch_mismatches)))
+
+    # A comment goes through find_fixes and find_notes, a PR body through
+    # find_fixes and a recipe patch through get_bump_info
+    print('{:<18} {:>11} {:>11} {:>8}'.format('corpus', 'reference s',
+                                               'scanner s', 'speedup'))
+    for l_name, l_items, l_reference, l_scanner in [
+            ('keyword dense', l_dense, reference_comment,
+             crn.find_fixes_and_notes),
+            ('typical comments', l_plain, reference_comment,
+             crn.find_fixes_and_notes),
+            ('PR bodies', l_plain, reference_find_fixes, crn.find_fixes),
+            ('recipe patches', l_patches, reference_patch, scanner_patch)]:
+        l_before = timed(l_reference, l_items, l_args.repeat)
+        l_after = timed(l_scanner, l_items, l_args.repeat)
+        print('{:<18} {:>11.3f} {:>11.3f} {:>7.1f}x'.format(
+            l_name, l_before, l_after, l_before / l_after))
+
+    return 1 if l_mismatches or l_patch_mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
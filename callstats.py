@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file callstats
+# @brief Counts, sizes and latencies of the outbound calls of a run, for the
+#        --stats option of crn.py and ab.py
+#
+# Calls are grouped by kind (github, cqcmd, ewm), host and endpoint class.
+# The endpoint class of a GitHub call is its kind of URL (compare, commit,
+# pull, ...), for cqcmd.pl the action and for EWM the method. Every group
+# keeps a latency histogram. GitHub calls are taken off a response hook of
+# the ghclient sessions, so PyGithub's and the raw ones are both counted.
+#
+# Nothing is recorded until enable() is called.
+###############################################################################
+
+import json
+import re
+import sys
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets in seconds, the last bucket
+# takes everything slower
+BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+REPO = r'/repos/[^/]+/[^/]+'
+# Tried in order, the first match names the endpoint
+GITHUB_ENDPOINTS = [
+    (re.compile(r'/graphql$'), 'graphql'),
+    (re.compile(REPO + r'/compare/'), 'compare'),
+    (re.compile(REPO + r'/commits/[^/]+/pulls$'), 'commit pulls'),
+    (re.compile(REPO + r'/commits/[^/]+$'), 'commit'),
+    (re.compile(REPO + r'/commits$'), 'commit list'),
+    (re.compile(REPO + r'/pulls/\d+$'), 'pull'),
+    (re.compile(REPO + r'/pulls$'), 'pull list'),
+    (re.compile(REPO + r'/issues/\d+/comments$'), 'issue comments'),
+    (re.compile(REPO + r'/contents/'), 'contents'),
+    (re.compile(REPO + r'/git/'), 'git data'),
+    (re.compile(REPO + r'$'), 'repo'),
+]
+# Left out of the paths of other endpoints
+ID_RE = re.compile(r'/(\d+|[0-9a-f]{40})(?=/|$)')
+
+enabled = False
+_lock = threading.Lock()
+# (kind, host, endpoint) : CallGroup
+_groups = dict()
+# Cache name : [hits, misses]
+_caches = dict()
+# Name : count, for events that aren't calls (rate limit pauses, ...)
+_counters = dict()
+_start = time.time()
+
+
+def enable():
+    global enabled, _start
+    enabled = True
+    _start = time.time()
+
+
+def github_endpoint(i_path):
+    for l_re, l_name in GITHUB_ENDPOINTS:
+        if l_re.search(i_path):
+            return l_name
+    return ID_RE.sub('/*', i_path)
+
+
+###############################################################################
+# @class CallGroup
+# @brief Totals and latency histogram of the calls to one endpoint class
+###############################################################################
+class CallGroup(object):
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+
+    def add(self, i_seconds, i_bytes, i_error):
+        self.calls += 1
+        self.errors += 1 if i_error else 0
+        self.bytes += i_bytes
+        self.seconds += i_seconds
+        l_bucket = 0
+        while l_bucket < len(BUCKETS) and i_seconds > BUCKETS[l_bucket]:
+            l_bucket += 1
+        self.buckets[l_bucket] += 1
+
+    ###########################################################################
+    # @brief Latency the given fraction of the calls stayed under, as the
+    #        upper bound of its histogram bucket
+    ###########################################################################
+    def percentile(self, i_fraction):
+        l_wanted = i_fraction * self.calls
+        l_count = 0
+        for l_bucket, l_calls in enumerate(self.buckets):
+            l_count += l_calls
+            if l_count >= l_wanted:
+                break
+        if l_bucket < len(BUCKETS):
+            return BUCKETS[l_bucket]
+        return float('inf')
+
+
+def record(i_kind, i_host, i_endpoint, i_seconds, i_bytes=0, i_error=False):
+    if not enabled:
+        return
+    l_key = (i_kind, i_host, i_endpoint)
+    with _lock:
+        l_group = _groups.get(l_key)
+        if l_group is None:
+            l_group = _groups[l_key] = CallGroup()
+        l_group.add(i_seconds, i_bytes, i_error)
+
+
+###############################################################################
+# @brief requests response hook recording a GitHub call
+#
+# The time is taken from the start of the request to the end of its body,
+# the body is read here for that
+###############################################################################
+def record_response(i_response, *args, **kwargs):
+    if not enabled:
+        return
+    l_start = time.time() - i_response.elapsed.total_seconds()
+    l_bytes = len(i_response.content or b'')
+    l_request = i_response.request
+    l_host = re.sub(r'^\w+://([^/:]+).*$', r'\1', l_request.url)
+    l_path = re.sub(r'^\w+://[^/]+', '', l_request.url).split('?')[0]
+    record('github', l_host, github_endpoint(l_path), time.time() - l_start,
+           l_bytes, i_response.status_code >= 400)
+
+
+###############################################################################
+# @class timed
+# @brief Context manager recording the call made in its block, set bytes
+#        and error on it when they are known
+###############################################################################
+class timed(object):
+    def __init__(self, i_kind, i_host, i_endpoint):
+        self.key = (i_kind, i_host, i_endpoint)
+        self.bytes = 0
+        self.error = False
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.time()
+        return self
+
+    def __exit__(self, i_type, i_value, i_traceback):
+        record(self.key[0], self.key[1], self.key[2],
+               time.time() - self._start, self.bytes,
+               self.error or i_type is not None)
+        return False
+
+
+def count_cache(i_name, i_hit):
+    if not enabled:
+        return
+    with _lock:
+        l_cache = _caches.setdefault(i_name, [0, 0])
+        l_cache[0 if i_hit else 1] += 1
+
+
+def set_cache(i_name, i_hits, i_misses):
+    with _lock:
+        _caches[i_name] = [i_hits, i_misses]
+
+
+def count(i_name, i_count=1):
+    if not enabled:
+        return
+    with _lock:
+        _counters[i_name] = _counters.get(i_name, 0) + i_count
+
+
+# Over the last bucket is None in the summary, JSON has no infinity
+def json_seconds(i_seconds):
+    if i_seconds == float('inf'):
+        return None
+    return i_seconds
+
+
+def summary():
+    with _lock:
+        l_calls = []
+        for (l_kind, l_host, l_endpoint), l_group in sorted(_groups.items()):
+            l_calls.append({
+                'kind': l_kind, 'host': l_host, 'endpoint': l_endpoint,
+                'calls': l_group.calls, 'errors': l_group.errors,
+                'bytes': l_group.bytes, 'seconds': round(l_group.seconds, 3),
+                'histogram': dict(zip([str(l_bound) for l_bound in BUCKETS]
+                                      + ['inf'], l_group.buckets)),
+                'p50': json_seconds(l_group.percentile(0.5)),
+                'p90': json_seconds(l_group.percentile(0.9)),
+                'p99': json_seconds(l_group.percentile(0.99))})
+        l_caches = dict()
+        for l_name, (l_hits, l_misses) in sorted(_caches.items()):
+            l_total = l_hits + l_misses
+            l_caches[l_name] = {
+                'hits': l_hits, 'misses': l_misses,
+                'hit_rate': round(float(l_hits) / l_total, 3)
+                if l_total else None}
+        return {'wall_seconds': round(time.time() - _start, 3),
+                'calls': l_calls, 'caches': l_caches,
+                'counters': dict((l_name, round(l_count, 3))
+                                 for l_name, l_count in _counters.items())}
+
+
+def format_seconds(i_seconds):
+    if i_seconds is None:
+        return '>{}s'.format(BUCKETS[-1])
+    if i_seconds < 1:
+        return '{}ms'.format(int(i_seconds * 1000))
+    return '{}s'.format(i_seconds)
+
+
+def format_summary(i_summary):
+    l_lines = ['Calls of the last {:.1f}s:'.format(i_summary['wall_seconds']),
+               '{:<6} {:<28} {:<16} {:>6} {:>5} {:>10} {:>9} {:>6} {:>6} '
+               '{:>6}'.format('kind', 'host', 'endpoint', 'calls', 'errs',
+                              'bytes', 'total s', 'p50', 'p90', 'p99')]
+    for l_call in i_summary['calls']:
+        l_lines.append(
+            '{:<6} {:<28} {:<16} {:>6} {:>5} {:>10} {:>9.2f} {:>6} {:>6} '
+            '{:>6}'.format(l_call['kind'], l_call['host'][0:28],
+                           l_call['endpoint'][0:16], l_call['calls'],
+                           l_call['errors'], l_call['bytes'],
+                           l_call['seconds'], format_seconds(l_call['p50']),
+                           format_seconds(l_call['p90']),
+                           format_seconds(l_call['p99'])))
+    for l_host in sorted(set(l_call['host'] for l_call in i_summary['calls'])):
+        l_host_calls = [l_call for l_call in i_summary['calls']
+                        if l_call['host'] == l_host]
+        l_lines.append('{:<35} {:>16} {:>6} {:>5} {:>10} {:>9.2f}'.format(
+            l_host, 'all', sum(l_call['calls'] for l_call in l_host_calls),
+            sum(l_call['errors'] for l_call in l_host_calls),
+            sum(l_call['bytes'] for l_call in l_host_calls),
+            sum(l_call['seconds'] for l_call in l_host_calls)))
+    if i_summary['caches']:
+        l_lines.append('Caches:')
+        for l_name, l_cache in sorted(i_summary['caches'].items()):
+            l_rate = '-' if l_cache['hit_rate'] is None \
+                else '{:.0%}'.format(l_cache['hit_rate'])
+            l_lines.append('  {:<24} {:>7} hits {:>7} misses {:>5}'.format(
+                l_name, l_cache['hits'], l_cache['misses'], l_rate))
+    for l_name, l_count in sorted(i_summary['counters'].items()):
+        l_lines.append('{}: {}'.format(l_name, l_count))
+    return '\n'.join(l_lines) + '\n'
+
+
+###############################################################################
+# @brief Writes the summary, as a table on stderr or as JSON
+#
+# @param i_file : File name for the JSON summary, '-' for the table
+###############################################################################
+def report(i_file='-'):
+    l_summary = summary()
+    if i_file == '-':
+        sys.stderr.write(format_summary(l_summary))
+        return
+    with open(i_file, 'w') as l_file:
+        json.dump(l_summary, l_file, indent=1, sort_keys=True)
@@ -24,19 +24,27 @@
 ###############################################################################
 
 import argparse
+import atexit
 #import git
+import commitcache
 import config
+import ghclient
+import gitmirror
 import json
 import logging
 import os
+import profiling
 import re
+import reportrender
 import requests
 import sys
 import time
-from github import Github
 #GITHUB_AUTH = (config.GITHUB_USER,config.py_token)
 GITHUB_AUTH = (config.GITHUB_USER, config.GITHUB_PASSWORD)
 
+# Persistent commit metadata cache, see commitcache.py. None disables it
+commit_cache = None
+
 class CommitReportEncoder(json.JSONEncoder):
     def default(self, i_obj):
         return i_obj.__dict__
@@ -59,37 +67,6 @@ class CommitReport:
         self.closed_issues = i_closed_issues
         self.subreports = []
 
-    def to_cl_string(self, i_level=0):
-        # Define colors for the console
-        RED = '\033[31m'
-        BLUE = '\033[94m'
-        ENDC = '\033[0m'
-        # Put the string together
-        l_cl_string = ('  ' * i_level) + RED + self.repo_name + ENDC  + ' ' \
-            + BLUE + self.nice_name + ENDC + ' ' \
-            + re.sub('\s+', ' ', self.summary)
-        # Do the same for every subreport
-        for l_report in self.subreports:
-            l_cl_string += '\n' + l_report.to_cl_string(i_level + 1)
-        return l_cl_string
-
-    def to_html(self, i_level=0):
-        l_repo_url = re.sub('git://', 'http://', self.repo_uri)
-        # Get HTML for this commit
-        l_html = \
-            '<div style="margin-left: ' + str(i_level * 20) + 'px">' \
-            + '<a href="' + l_repo_url + '" target="_blank" ' \
-            + 'style="color: red">' + self.repo_name + '</a>&nbsp;' \
-            + '<a href="' + l_repo_url + '/commit/' + self.sha \
-            + '" target="_blank" style="color: blue">' + self.nice_name \
-            + '</a>&nbsp;' \
-            + '<span>' + re.sub('\s+', ' ', self.summary) + '</span>' \
-            + '</div>\n'
-        # Get the HTML for all subcommits
-        for l_commit in self.subreports:
-            l_html += l_commit.to_html(i_level + 1)
-        return l_html
-
     def get_total_insertions(self):
         l_insertions = self.insertions
         for l_commit in self.subreports:
@@ -108,6 +85,12 @@ class CommitReport:
             l_closed_issues.extend(l_commit.get_all_closed_issues())
         return l_closed_issues
 
+###############################################################################
+# @brief Web URL of a repo for the HTML output
+###############################################################################
+def html_repo_url(i_repo_uri):
+    return i_repo_uri.replace('git://', 'http://')
+
 ###############################################################################
 # @brief Main function for the script
 #
@@ -121,6 +104,14 @@ def main(i_args):
     logging.basicConfig(level=logging.ERROR)
 #    logging.basicConfig(level=logging.DEBUG)
 
+    if l_args.profile:
+        profiling.start()
+        atexit.register(profiling.report, l_args.profile)
+
+    global commit_cache
+    if not l_args.no_cache:
+        commit_cache = commitcache.CommitCache(l_args.cache_dir)
+
     # Generate the commit reports
     l_reports = generate_commit_reports(
         l_args.repo_uri,
@@ -137,10 +128,19 @@ def main(i_args):
         l_total_insertions += l_report.get_total_insertions()
         l_issues.extend(l_report.get_all_closed_issues())
 
-    # Print commit information to the console
+    # Print commit information to the console, and to the HTML file if the
+    # user set the flag, in one walk of the reports
+    l_renderers = [reportrender.ConsoleRenderer(sys.stdout)]
+    l_html_file = None
+    if l_args.html_file:
+        print 'Writing to HTML file...'
+        l_html_file = open(l_args.html_file, 'w+')
+        l_html_file.write('<html><body>\n')
+        l_renderers.append(reportrender.HtmlRenderer(l_html_file,
+                                                     html_repo_url))
     print 'Commits...'
-    for l_report in l_reports:
-        print l_report.to_cl_string()
+    with profiling.span('render'):
+        reportrender.render_reports(l_reports, l_renderers)
     print 'Closed issues...'
     for l_issue in l_issues:
         print '%10s' % (l_issue[2]),
@@ -149,13 +149,8 @@ def main(i_args):
     print str(l_total_insertions) + ' insertions'
     print str(l_total_deletions) + ' deletions'
 
-    # Write to the HTML file if the user set the flag
-    if l_args.html_file:
-        print 'Writing to HTML file...'
-        l_html_file = open(l_args.html_file, 'w+')
-        l_html_file.write('<html><body>\n')
-        for l_report in l_reports:
-            l_html_file.write(l_report.to_html())
+    # Finish the HTML file
+    if l_html_file:
         l_html_file.write('<p>' + str(l_total_insertions) \
                           + ' insertions and ' + str(l_total_deletions) \
                           + ' deletions</p>')
@@ -229,6 +224,27 @@ def parse_arguments(i_args):
         '--branch',
         default='master',
         help='select branch master, OP920.10 ')
+    l_parser.add_argument(
+        '--cache-dir',
+        dest='cache_dir',
+        default=commitcache.DEFAULT_CACHE_DIR,
+        help='Directory of the commit metadata cache shared with crn.py')
+    l_parser.add_argument(
+        '--no-cache',
+        dest='no_cache',
+        action='store_true',
+        help='Don\'t read or write the commit metadata cache')
+    l_parser.add_argument(
+        '--profile',
+        dest='profile',
+        nargs='?',
+        const='commitTracker.prof',
+        default=None,
+        help='Profile the run: write the cProfile statistics to the given ' \
+             +'file (default commitTracker.prof, read with python -m ' \
+             +'pstats) and the wall clock time of each phase (compare ' \
+             +'walk, enrichment, subrepos, rendering) to stderr and ' \
+             +'<file>.txt')
     return l_parser.parse_args(i_args)
 
 ###############################################################################
@@ -257,10 +273,22 @@ def generate_commit_reports(i_repo_uri, i_begin_commit,
     l_reports = []
     try:
         
-        l_commits = l_repo.compare(i_begin_commit, i_end_commit).commits
+        l_commits = None
+        with profiling.span('compare walk'):
+            if commit_cache:
+                l_commits = commit_cache.get_range(
+                    i_repo_uri, i_begin_commit, i_end_commit)
+            if l_commits is None:
+                l_commits = ghclient.compare_commits(
+                    l_repo, i_begin_commit, i_end_commit)
+                if commit_cache:
+                    commit_cache.put_range(i_repo_uri, i_begin_commit,
+                                           i_end_commit, l_commits)
 
         # Go through each commit, generating a report
         for l_commit in l_commits:
+            with profiling.span('commit details'):
+                l_commit = resolve_commit(l_repo, i_repo_uri, l_commit)
             # Get the insertion and deletion line counts
             l_insertions = l_commit.stats.additions
             l_deletions = l_commit.stats.deletions
@@ -269,6 +297,8 @@ def generate_commit_reports(i_repo_uri, i_begin_commit,
             if  "Merge pull request" in l_summary:
                 continue
 
+            with profiling.span('enrichment'):
+                l_closed_issues = get_closed_issues(l_commit)
             l_report = CommitReport(
                 i_repo_uri,
                 i_repo_uri.split('/')[-1].replace('.git', ''),
@@ -277,7 +307,7 @@ def generate_commit_reports(i_repo_uri, i_begin_commit,
                 l_summary,
                 l_insertions,
                 l_deletions,
-                get_closed_issues(l_commit))
+                l_closed_issues)
             # Search the files for any bumps of submodule versions
             l_files = l_commit.files
             for l_file in l_files:
@@ -311,10 +341,12 @@ def generate_commit_reports(i_repo_uri, i_begin_commit,
                             and l_subrepo_uri.startswith('git'):
                         logging.debug('  Bumped')
                         l_subrepo_path = l_subrepo_uri.split('/')[-1]
-                        l_subreports = generate_commit_reports(
-                        l_subrepo_uri,
-                            l_subrepo_old_hash,
-                            l_subrepo_new_hash)
+                        with profiling.span(
+                                'subrepo', l_subrepo_path.replace('.git', '')):
+                            l_subreports = generate_commit_reports(
+                                l_subrepo_uri,
+                                l_subrepo_old_hash,
+                                l_subrepo_new_hash)
                         l_report.subreports.extend(l_subreports)
 
             # Put the report on the end of the list
@@ -323,6 +355,28 @@ def generate_commit_reports(i_repo_uri, i_begin_commit,
         print "exception in generate_commit_reports: do nothing"
     return l_reports
 
+###############################################################################
+# @brief Gets a commit with its stats and files, from the commit cache when
+#        it is there, otherwise from the API and into the cache
+#
+# @param i_repo     : The Repo object the commit is in
+# @param i_repo_uri : The URI of the repo, part of the cache key
+# @param i_commit   : The commit as listed by compare
+#
+# @return A commit object with stats and files
+###############################################################################
+def resolve_commit(i_repo, i_repo_uri, i_commit):
+    if commit_cache is None:
+        return i_commit
+    l_commit = commit_cache.get_commit(i_repo_uri, i_commit.sha)
+    if l_commit is not None:
+        return l_commit
+    if isinstance(i_commit, gitmirror.LocalCommit) and i_commit.files is None:
+        # Only the range was cached
+        i_commit = i_repo.get_commit(i_commit.sha)
+    commit_cache.put_commit(i_repo_uri, i_commit)
+    return i_commit
+
 ###############################################################################
 # @brief Gets the repo URI, the updated SHA, and the old SHA from a
 #        given repo, commit SHA and file
@@ -387,54 +441,16 @@ def rchop(thestring, ending):
     return thestring
 
 ###############################################################################
-# @brief Updates the repo under the given path or clones it from the
-#        uri if it doesn't yet exist
+# @brief Gets the GitHub repo for a URI from the registry shared by all
+#        tools, see ghclient.py
 #
-# @param i_uri  : The URI to the remote repo to clone
-# @param i_path : The file path to where the repo currently exists or
-#                 where it will be created
+# @param i_uri  : The URI of the remote repo
+#
+# @return The PyGithub Repository object
 ###############################################################################
 def get_repo(i_uri):
+    return ghclient.get_repo(i_uri)
 
-#    print "i_uri",
-#    print i_uri
-    l_uri = i_uri.strip()
-    l_values = l_uri.split('/')
-
-#    if len(l_list) != 3:
-#        print "Error wrong uri format. Exiting"
-#        for l_out in l_list:
-#            print "%s" % l_out.strip()
-#        sys.exit()
-    count = 0;
-    for l_value in l_values:
-        if 'github.ibm.com' in l_value:
-#            print "Found GHE"
-#            print list(l_values)
-            l_repo_name = l_values[count+1] + "/" + rchop(l_values[count+2],'.git')
-#            print l_repo_name
-            l_github = Github(login_or_token = config.py_ibm_token, base_url='https://github.ibm.com/api/v3')
-            l_repo = l_github.get_repo(l_repo_name)
-#            print list(l_repo.get_branches())
-#            print l_repo.default_branch
-#            l_repo.edit(default_branch="master")
-#            print l_repo.master_branch
-
-        
-        elif 'github.com' in l_value:
-#            print "Found Master"
-            l_repo_name = l_values[count+1] + "/" + l_values[count+2] #@rf
-            l_repo_name = rreplace(l_repo_name, ".git", '', 1)
-            print l_repo_name
-            l_github = Github(login_or_token = config.py_token)
-            l_repo = l_github.get_repo(l_repo_name)
-        count += 1
-
-#    else:
-#        print "Error found %s. Unknown uri name" % l_list[0]
-#        sys.exit()
-
-    return l_repo
 
 
 
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file commitcache
+# @brief On-disk cache of commit metadata shared by crn.py and
+#        commitTracker.py
+#
+# A commit's author, message, line counts and recipe patches never change,
+# so they are kept in SQLite keyed by (host, repo, sha). The commit list of a
+# range is cached too when both ends are full SHAs, which is the case for
+# every SRCREV bump. The least recently used entries are evicted once the
+# cache grows past its size bound.
+###############################################################################
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import commitidentity
+import gitmirror
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'mytools')
+DEFAULT_MAX_MB = 512
+
+# How many writes go by between two size checks
+EVICT_INTERVAL = 200
+
+SHA_RE = re.compile('^[0-9a-f]{40}$')
+
+
+def repo_key(i_repo_uri):
+    l_parts = gitmirror.split_repo_uri(i_repo_uri)
+    if not l_parts:
+        return None
+    return l_parts[0], l_parts[1] + '/' + l_parts[2]
+
+
+###############################################################################
+# @param i_files : The files of the commit when they are already at hand,
+#                  every walk over commit.files of the API asks for them again
+###############################################################################
+def commit_to_record(i_commit, i_files=None):
+    l_files = []
+    for l_file in i_commit.files if i_files is None else i_files:
+        if l_file.patch and gitmirror.is_recipe_patch(l_file.patch):
+            l_files.append([l_file.filename, l_file.patch])
+    l_record = {
+        'message': i_commit.commit.message,
+        'author': i_commit.commit.author.name,
+        'url': i_commit.commit.url,
+        'additions': i_commit.stats.additions,
+        'deletions': i_commit.stats.deletions,
+        'files': l_files,
+    }
+    # The file patches kept are only the recipe ones, the patch id is kept
+    # when it has been worked out before, see crn.resolve_commit
+    l_patch_id = commitidentity.known_patch_id(i_commit)
+    if l_patch_id is not commitidentity.UNKNOWN:
+        l_record['patch_id'] = l_patch_id
+    return l_record
+
+
+def record_to_commit(i_sha, i_record):
+    l_files = [gitmirror.LocalFile(l_name, l_patch)
+               for l_name, l_patch in i_record['files']]
+    return gitmirror.LocalCommit(i_sha, i_record['message'],
+                                 i_record['author'], i_record['url'],
+                                 i_record['additions'], i_record['deletions'],
+                                 l_files, i_record.get(
+                                     'patch_id', commitidentity.UNKNOWN))
+
+
+###############################################################################
+# @class CommitCache
+# @brief SQLite backed, size bounded cache of commits and SHA ranges
+###############################################################################
+class CommitCache(object):
+    def __init__(self, i_cache_dir=DEFAULT_CACHE_DIR,
+                 i_max_bytes=DEFAULT_MAX_MB * 1024 * 1024):
+        if not os.path.isdir(i_cache_dir):
+            os.makedirs(i_cache_dir)
+        self.path = os.path.join(i_cache_dir, 'commits.sqlite')
+        self.max_bytes = i_max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS commits (host TEXT, repo TEXT, '
+            'sha TEXT, data TEXT, size INTEGER, used REAL, '
+            'PRIMARY KEY (host, repo, sha))')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS ranges (host TEXT, repo TEXT, '
+            'begin TEXT, end TEXT, data TEXT, size INTEGER, used REAL, '
+            'PRIMARY KEY (host, repo, begin, end))')
+        self._db.commit()
+
+    def _get(self, i_table, i_where, i_key):
+        with self._lock:
+            l_row = self._db.execute(
+                'SELECT data FROM {} WHERE {}'.format(i_table, i_where),
+                i_key).fetchone()
+            if l_row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._db.execute(
+                'UPDATE {} SET used = ? WHERE {}'.format(i_table, i_where),
+                (time.time(),) + i_key)
+            self._db.commit()
+        return json.loads(l_row[0])
+
+    def _put(self, i_table, i_key, i_record):
+        l_data = json.dumps(i_record)
+        l_marks = ', '.join('?' * (len(i_key) + 3))
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO {} VALUES ({})'.format(i_table,
+                                                               l_marks),
+                i_key + (l_data, len(l_data), time.time()))
+            self._db.commit()
+            self._writes += 1
+            if self._writes % EVICT_INTERVAL == 0:
+                self._evict()
+
+    def _evict(self):
+        l_total = 0
+        for l_table in ('commits', 'ranges'):
+            l_total += self._db.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM {}'.format(l_table)
+            ).fetchone()[0]
+        if l_total <= self.max_bytes:
+            return
+
+        # Free down to 90% so eviction doesn't run on every write
+        l_excess = l_total - int(self.max_bytes * 0.9)
+        l_rows = self._db.execute(
+            'SELECT \'commits\', rowid, size, used FROM commits UNION ALL '
+            'SELECT \'ranges\', rowid, size, used FROM ranges ORDER BY 4'
+        ).fetchall()
+        l_count = 0
+        for l_table, l_rowid, l_size, l_used in l_rows:
+            if l_excess <= 0:
+                break
+            self._db.execute('DELETE FROM {} WHERE rowid = ?'.format(l_table),
+                             (l_rowid,))
+            l_excess -= l_size
+            l_count += 1
+        self._db.commit()
+        logging.info('commit cache evicted {} entries'.format(l_count))
+
+    ###########################################################################
+    # @brief Looks up a commit
+    #
+    # @return A gitmirror.LocalCommit or None if it isn't cached
+    ###########################################################################
+    def get_commit(self, i_repo_uri, i_sha):
+        l_key = repo_key(i_repo_uri)
+        if l_key is None:
+            return None
+        l_record = self._get('commits', 'host = ? AND repo = ? AND sha = ?',
+                             l_key + (i_sha,))
+        if l_record is None:
+            return None
+        return record_to_commit(i_sha, l_record)
+
+    def put_commit(self, i_repo_uri, i_commit, i_files=None):
+        l_key = repo_key(i_repo_uri)
+        if l_key is None:
+            return
+        self._put('commits', l_key + (i_commit.sha,),
+                  commit_to_record(i_commit, i_files))
+
+    ###########################################################################
+    # @brief Looks up the commit list of a range between two full SHAs
+    #
+    # @return A list of gitmirror.LocalCommit in range order or None. They
+    #         only carry sha, message, author and url, files is None until
+    #         the commit is resolved through get_commit or the API
+    ###########################################################################
+    def get_range(self, i_repo_uri, i_begin_commit, i_end_commit):
+        l_key = repo_key(i_repo_uri)
+        if l_key is None or not SHA_RE.match(i_begin_commit) \
+                or not SHA_RE.match(i_end_commit):
+            return None
+        l_record = self._get('ranges',
+                             'host = ? AND repo = ? AND begin = ? AND end = ?',
+                             l_key + (i_begin_commit, i_end_commit))
+        if l_record is None:
+            return None
+        l_commits = []
+        for l_sha, l_author, l_message, l_url in l_record:
+            l_commits.append(gitmirror.LocalCommit(
+                l_sha, l_message, l_author, l_url, None, None, None))
+        return l_commits
+
+    def put_range(self, i_repo_uri, i_begin_commit, i_end_commit, i_commits):
+        l_key = repo_key(i_repo_uri)
+        if l_key is None or not SHA_RE.match(i_begin_commit) \
+                or not SHA_RE.match(i_end_commit):
+            return
+        l_record = [[l_commit.sha, l_commit.commit.author.name,
+                     l_commit.commit.message, l_commit.commit.url]
+                    for l_commit in i_commits]
+        self._put('ranges', l_key + (i_begin_commit, i_end_commit), l_record)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file commitidentity
+# @brief Tells when two commits are the same change: a cherry-pick between
+#        the downstream and GHE branches, or a subrepo commit reached through
+#        two bump paths
+#
+# The identity of a commit is its Gerrit Change-Id, or when it has none the
+# stable patch id of its diff (git patch-id --stable) in its repo. Commits
+# from a mirror get their patch ids from git log, see
+# gitmirror.mirror_patch_ids. For the commits of the API the diff is put
+# back together from the file patches. The API has no file modes, every file
+# is taken as 100644: that matches git's diff for added, changed, removed
+# and purely renamed regular files, an added executable or symlink or a mode
+# change gives a patch id of its own. Commits with a file the API gives no
+# patch for (a mode change only, binary or very large files) get none.
+# Commits without either, like merges, are only the same as themselves.
+#
+# A Change-Id is the same change wherever it is. The same diff twice is only
+# taken as one change when the two commits were reached by different bumps
+# of their repo: a revert and reapply in one range, or the same fix made in
+# two repos, are changes of their own.
+#
+# Patch ids are only worked out when a commit is looked up, crn.py does it
+# before it puts a commit in the commit cache. Records of the cache written
+# without one give UNKNOWN.
+###############################################################################
+
+import logging
+import re
+import subprocess
+import threading
+PIPE = subprocess.PIPE
+
+import profiling
+
+CHANGE_ID_RE = re.compile(r'^Change-Id:\s*(I[0-9a-f]{8,})\s*$', re.M)
+
+# sha : patch id of the API commits done so far, None when there is none
+_patch_ids = dict()
+_patch_ids_lock = threading.Lock()
+
+# Patch id of a commit it hasn't been worked out for
+UNKNOWN = object()
+
+PATCH_ID_PREFIX = 'patch-id '
+
+
+###############################################################################
+# @brief The Change-Id trailer of a commit message, the last one when it has
+#        several
+###############################################################################
+def change_id(i_message):
+    l_ids = CHANGE_ID_RE.findall(i_message or '')
+    if l_ids:
+        return l_ids[-1]
+    return None
+
+
+###############################################################################
+# @brief Runs git patch-id --stable over the diffs of one or more commits
+#
+# @param i_diff : Text of the diffs, each one after a "commit <sha>" line
+#
+# @return Dict of sha : patch id, empty when git failed
+###############################################################################
+def patch_ids(i_diff):
+    if not isinstance(i_diff, bytes):
+        i_diff = i_diff.encode('utf-8', 'replace')
+    try:
+        with profiling.span('git', 'patch-id'):
+            process = subprocess.Popen(['git', 'patch-id', '--stable'],
+                                       stdin=PIPE, stdout=PIPE, stderr=PIPE)
+            stdoutput, stderroutput = process.communicate(i_diff)
+    except OSError as e:
+        logging.warning('Unable to run git patch-id: {}'.format(e))
+        return dict()
+    if process.returncode != 0:
+        logging.warning('git patch-id failed: {}'.format(
+            stderroutput.decode('utf-8', 'replace')))
+        return dict()
+    l_ids = dict()
+    for l_line in stdoutput.decode('utf-8', 'replace').splitlines():
+        l_fields = l_line.split()
+        if len(l_fields) == 2:
+            l_ids[l_fields[1]] = l_fields[0]
+    return l_ids
+
+
+###############################################################################
+# @brief Puts the git diff of an API commit back together from its files
+#
+# @param i_files : The files of the commit when they are already at hand,
+#                  every walk over commit.files of the API asks for them again
+#
+# @return The diff after a "commit <sha>" line, None when a file has no
+#         patch and isn't a plain rename. The patches of binary and very
+#         large files aren't in the API and a mode change has none, those
+#         diffs would say too little
+###############################################################################
+def commit_diff(i_commit, i_files=None):
+    l_lines = []
+    l_content = False
+    for l_file in i_commit.files if i_files is None else i_files:
+        if not l_file.patch and (getattr(l_file, 'status', None) != 'renamed'
+                                 or getattr(l_file, 'changes', 0)):
+            return None
+        l_status = getattr(l_file, 'status', 'modified')
+        l_old = getattr(l_file, 'previous_filename', None) or l_file.filename
+        l_new = l_file.filename
+        l_lines.append(u'diff --git a/{} b/{}'.format(l_old, l_new))
+        if l_status == 'added':
+            l_lines.extend([u'new file mode 100644', u'--- /dev/null',
+                            u'+++ b/' + l_new])
+        elif l_status == 'removed':
+            l_lines.extend([u'deleted file mode 100644', u'--- a/' + l_old,
+                            u'+++ /dev/null'])
+        elif l_status == 'renamed' and not l_file.patch:
+            l_lines.extend([u'similarity index 100%', u'rename from ' + l_old,
+                            u'rename to ' + l_new])
+        else:
+            l_lines.extend([u'--- a/' + l_old, u'+++ b/' + l_new])
+        if l_file.patch:
+            l_lines.append(l_file.patch)
+        l_content = True
+    if not l_content:
+        return None
+    return u'commit {}\n\n{}\n'.format(i_commit.sha, u'\n'.join(l_lines))
+
+
+###############################################################################
+# @brief Patch id of a commit when it has been worked out, without working it
+#        out
+#
+# @return The patch id, None when there is none, UNKNOWN when it hasn't been
+#         worked out
+###############################################################################
+def known_patch_id(i_commit):
+    # Commits of a mirror or the commit cache carry it
+    l_patch_id = getattr(i_commit, 'patch_id', UNKNOWN)
+    if l_patch_id is not UNKNOWN:
+        return l_patch_id
+    with _patch_ids_lock:
+        return _patch_ids.get(i_commit.sha, UNKNOWN)
+
+
+###############################################################################
+# @brief Stable patch id of a commit
+#
+# @param i_files : The files of the commit when they are already at hand
+#
+# @return The patch id, or None when it can't be had
+###############################################################################
+def patch_id(i_commit, i_files=None):
+    l_patch_id = known_patch_id(i_commit)
+    if l_patch_id is not UNKNOWN:
+        return l_patch_id
+    if hasattr(i_commit, 'patch_id'):
+        # A commit cache record without it, the file patches kept are only
+        # the recipe ones
+        return None
+    l_diff = commit_diff(i_commit, i_files)
+    l_patch_id = None
+    if l_diff is not None:
+        l_patch_id = patch_ids(l_diff).get(i_commit.sha)
+    with _patch_ids_lock:
+        _patch_ids[i_commit.sha] = l_patch_id
+    return l_patch_id
+
+
+###############################################################################
+# @brief Identity of a commit message with a Change-Id, None without one
+###############################################################################
+def change_identity(i_message):
+    l_change_id = change_id(i_message)
+    if l_change_id:
+        return 'Change-Id ' + l_change_id
+    return None
+
+
+###############################################################################
+# @brief Identity of a commit: 'Change-Id <id>', 'patch-id <repo_uri> <id>'
+#        or, for a commit that has neither, 'commit <sha>'
+#
+# @param i_repo_uri : URI of the repo of the commit
+# @param i_files    : The files of the commit when they are already at hand
+###############################################################################
+def identity(i_repo_uri, i_commit, i_files=None):
+    l_identity = change_identity(i_commit.commit.message)
+    if l_identity:
+        return l_identity
+    l_patch_id = patch_id(i_commit, i_files)
+    if l_patch_id:
+        return '{}{} {}'.format(PATCH_ID_PREFIX, i_repo_uri, l_patch_id)
+    return 'commit ' + i_commit.sha
+
+
+def is_patch_identity(i_identity):
+    return i_identity is not None and i_identity.startswith(PATCH_ID_PREFIX)
+
+
+###############################################################################
+# @class IdentityIndex
+# @brief The changes of one report tree and the commit that has each
+#
+# crn.py claims the changes of the reports as they are attached to the tree,
+# in tree order, so the first commit of a change in the tree keeps it however
+# the worker threads went. They only look changes up.
+###############################################################################
+class IdentityIndex(object):
+    def __init__(self):
+        # identity : ((repo_uri, repo_name, sha, nice_name), bump) of the
+        # first commit
+        self._first = dict()
+        self._lock = threading.Lock()
+
+    ###########################################################################
+    # @brief Claims a change for a commit
+    #
+    # @param i_identity : Identity of the commit, None claims nothing
+    # @param i_ref      : (repo_uri, repo_name, sha, nice_name) of the commit
+    # @param i_bump     : The bump that reached the commit, (repo_uri, sha) of
+    #                     the commit bumping its repo, None for the commits of
+    #                     the range itself
+    #
+    # @return The ref of the commit that had the change first, None if that
+    #         is this one or the change is another one of the same diff
+    ###########################################################################
+    def claim(self, i_identity, i_ref, i_bump=None):
+        if i_identity is None:
+            return None
+        with self._lock:
+            l_first = self._first.get(i_identity)
+            if l_first is None:
+                self._first[i_identity] = (i_ref, i_bump)
+                return None
+        l_ref, l_bump = l_first
+        if is_patch_identity(i_identity) and l_bump == i_bump \
+                and l_ref[2] != i_ref[2]:
+            # Same diff twice in one range, like a revert and reapply
+            return None
+        return l_ref
+
+    ###########################################################################
+    # @return The ref of the commit that claimed a change, None if none did.
+    #         Patch ids are left to claim, they depend on the bump
+    ###########################################################################
+    def first(self, i_identity):
+        if i_identity is None or is_patch_identity(i_identity):
+            return None
+        with self._lock:
+            l_first = self._first.get(i_identity)
+        return l_first[0] if l_first is not None else None
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file commitreport
+# @brief The report tree crn.py builds for a range: one CommitReport per
+#        commit, holding the reports of the subrepo commits it bumps in
+#
+# Ranges with kernel bumps make tens of thousands of reports, so they are
+# kept small, see bench/report_memory.py.
+###############################################################################
+
+import io
+import sys
+
+import reportrender
+
+# Shared by every report without issues, notes, defects or subreports
+EMPTY = ()
+
+
+def intern_str(i_value):
+    if isinstance(i_value, str):
+        return sys.intern(i_value)
+    return i_value
+
+
+###############################################################################
+# @brief Web URL of a repo for the HTML output
+###############################################################################
+def html_repo_url(i_repo_uri):
+    return i_repo_uri.replace('github.ibm.com', 'https://github.ibm.com')
+
+
+def compact(i_values):
+    if not i_values:
+        return EMPTY
+    return tuple(i_values)
+
+
+###############################################################################
+# @class CommitReport
+# @brief A class representing information about a commit and all commits in
+#        relevant subrepos
+#
+# The issue, note, defect and subreport lists are tuples, the empty ones all
+# the same EMPTY tuple, and the repo and author strings are interned.
+#
+# identity is the change the commit makes, see commitidentity.py. A commit
+# whose change is already in the tree is a cross-reference: duplicate_of
+# holds (repo_uri, repo_name, sha, nice_name) of the first commit, and it has
+# no line counts or subreports of its own. It keeps its issues, notes and
+# defects, a cherry-pick has a PR of its own, unless it is the first commit
+# itself reached again.
+###############################################################################
+class CommitReport(object):
+    __slots__ = ('repo_uri', 'repo_name', 'sha', 'nice_name', 'author_name',
+                 'summary', 'insertions', 'deletions', 'closed_issues',
+                 'notes', 'stgDefects', 'subreports', 'identity',
+                 'duplicate_of')
+
+    def __init__(self, i_repo_uri, i_repo_name,  i_sha, i_nice_name, i_author_name,
+                 i_summary, i_insertions, i_deletions, i_closed_issues, i_notes, i_stgDefects):
+        self.repo_uri = intern_str(i_repo_uri)
+        self.repo_name = intern_str(i_repo_name)
+        self.sha = i_sha
+        self.nice_name = i_nice_name
+        self.author_name = intern_str(i_author_name)
+        self.summary = i_summary
+        self.insertions = i_insertions
+        self.deletions = i_deletions
+        self.closed_issues = compact(i_closed_issues)
+        self.notes = compact(i_notes)
+        self.stgDefects = compact(i_stgDefects)
+        self.subreports = EMPTY
+        self.identity = None
+        self.duplicate_of = None
+
+    def add_subreports(self, i_reports):
+        if i_reports:
+            self.subreports = self.subreports + tuple(i_reports)
+
+    ###########################################################################
+    # @brief Makes the report a cross-reference to the first commit of its
+    #        change
+    #
+    # @param i_first : (repo_uri, repo_name, sha, nice_name) of that commit
+    ###########################################################################
+    def make_duplicate(self, i_first):
+        self.insertions = 0
+        self.deletions = 0
+        if self.is_commit(i_first):
+            self.closed_issues = EMPTY
+            self.notes = EMPTY
+            self.stgDefects = EMPTY
+        self.subreports = EMPTY
+        self.duplicate_of = tuple(i_first)
+
+    ###########################################################################
+    # @brief Tells if a (repo_uri, repo_name, sha, nice_name) ref is the
+    #        commit of this report
+    ###########################################################################
+    def is_commit(self, i_ref):
+        return i_ref[0] == self.repo_uri and i_ref[2] == self.sha
+
+    def render(self, i_renderer_class, *args):
+        l_out = io.StringIO()
+        reportrender.render_reports([self], [i_renderer_class(l_out, *args)])
+        return l_out.getvalue()
+
+    def to_cl_string(self):
+        return self.render(reportrender.ConsoleRenderer)[:-1]
+
+    def to_string(self):
+        return self.render(reportrender.TextRenderer)[:-1]
+
+    def to_html(self):
+        return self.render(reportrender.HtmlRenderer, html_repo_url)
+
+    def get_total_insertions(self):
+        l_insertions = self.insertions
+        for l_commit in self.subreports:
+            l_insertions += l_commit.get_total_insertions()
+        return l_insertions
+
+    def get_total_deletions(self):
+        l_deletions = self.deletions
+        for l_commit in self.subreports:
+            l_deletions += l_commit.get_total_deletions()
+        return l_deletions
+
+    def get_all_closed_issues(self):
+        l_closed_issues = list(self.closed_issues)
+        for l_commit in self.subreports:
+            l_closed_issues.extend(l_commit.get_all_closed_issues())
+        return l_closed_issues
+    def get_all_notes(self):
+        l_notes = list(self.notes)
+        for l_commit in self.subreports:
+            l_notes.extend(l_commit.get_all_notes())
+        return l_notes
+    def get_all_stgDefects(self):
+        l_stgDefects = list(self.stgDefects)
+        for l_commit in self.subreports:
+            l_stgDefects.extend(l_commit.get_all_stgDefects())
+        return l_stgDefects
+
+    def to_dict(self):
+        return {
+            'repo_uri': self.repo_uri,
+            'repo_name': self.repo_name,
+            'sha': self.sha,
+            'nice_name': self.nice_name,
+            'author_name': self.author_name,
+            'summary': self.summary,
+            'insertions': self.insertions,
+            'deletions': self.deletions,
+            'closed_issues': list(self.closed_issues),
+            'notes': list(self.notes),
+            'stgDefects': list(self.stgDefects),
+            'subreports': [l_report.to_dict() for l_report in self.subreports],
+            'identity': self.identity,
+            'duplicate_of': list(self.duplicate_of)
+            if self.duplicate_of else None,
+        }
+
+    @staticmethod
+    def from_dict(i_dict):
+        l_report = CommitReport(
+            i_dict['repo_uri'], i_dict['repo_name'], i_dict['sha'],
+            i_dict['nice_name'], i_dict['author_name'], i_dict['summary'],
+            i_dict['insertions'], i_dict['deletions'],
+            i_dict['closed_issues'], i_dict['notes'], i_dict['stgDefects'])
+        l_report.add_subreports([CommitReport.from_dict(l_sub)
+                                 for l_sub in i_dict['subreports']])
+        l_report.identity = i_dict.get('identity')
+        if i_dict.get('duplicate_of'):
+            l_report.duplicate_of = tuple(i_dict['duplicate_of'])
+        return l_report
+
+###############################################################################
+# @class ReportTotals
+# @brief Closed issues, notes, STGDefects and line counts of report trees,
+#        collected in a single walk that leaves the reports as they are
+###############################################################################
+class ReportTotals:
+    def __init__(self, i_reports=()):
+        # dicts keep insertion order, they serve as ordered sets
+        self._closed_issues = dict()
+        self._notes = dict()
+        self._stgDefects = dict()
+        self.commits = 0
+        self.insertions = 0
+        self.deletions = 0
+        for l_report in i_reports:
+            self.add(l_report)
+
+    ###########################################################################
+    # @brief Adds a report and all its subreports, in the order the
+    #        get_all_* methods list them. Cross-references to a change
+    #        counted already aren't commits
+    ###########################################################################
+    def add(self, i_report):
+        l_todo = [i_report]
+        while l_todo:
+            l_report = l_todo.pop()
+            if l_report.duplicate_of is None:
+                self.commits += 1
+            self.insertions += l_report.insertions or 0
+            self.deletions += l_report.deletions or 0
+            self._closed_issues.update(dict.fromkeys(l_report.closed_issues))
+            self._notes.update(dict.fromkeys(l_report.notes))
+            self._stgDefects.update(dict.fromkeys(l_report.stgDefects))
+            l_todo.extend(reversed(l_report.subreports))
+
+    @property
+    def closed_issues(self):
+        return list(self._closed_issues)
+
+    @property
+    def notes(self):
+        return list(self._notes)
+
+    @property
+    def stgDefects(self):
+        return list(self._stgDefects)
@@ -4,6 +4,11 @@
 py_token = ""
 py_ibm_token = ""
 
+# Optional pools of tokens per host, GitHub requests are spread over them and
+# moved to another token when one gets rate limited (see ratelimit.py)
+py_token_pool = []
+py_ibm_token_pool = []
+
 auth_headers = {'Authorization': 'token ' +  py_token }
 auth_ibm_headers = {'Authorization': 'token ' +  py_ibm_token }
 
@@ -2,28 +2,114 @@
 
 import sys
 import argparse
+import atexit
+import copy
 import logging 
 import re
-import requests
-from datetime import datetime, timedelta
+from datetime import datetime
 
-from github import Github
+import callstats
 import config
+import commitcache
+import commitidentity
+from commitreport import EMPTY, CommitReport, ReportTotals, html_repo_url
+import ghclient
+import gitmirror
+import prindex
+import profiling
+import reportrender
+import reportstore
+import runbundle
 import os
 import json
 import subprocess
 PIPE = subprocess.PIPE
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import shlex
 
 sys.path.append("/home/rfrandse/ewm")
 import ewm
 ewm_instance = ewm.Ewm()
+ewm_local = threading.local()
+
+# EWM work items read in this run, ewmId : (work item, read time, from disk)
+ewm_workitems = dict()
+ewm_workitems_lock = threading.Lock()
+# Seconds work items stay valid in the on-disk EWM cache, 0 disables it
+ewm_cache_ttl = 0
+ewm_cache_file = None
+# Work items read at the same time by prefetch_ewm_workitems
+ewm_jobs = 1
+# EWM calls per second made by the --ewm update workers, 0 doesn't limit them
+ewm_rate = 0
+ewm_rate_lock = threading.Lock()
+ewm_next_call = 0
+# Attempts after the first one for a failing work item update, the wait
+# before attempt n is EWM_BACKOFF * 2**(n - 1) seconds
+ewm_retries = 3
+EWM_BACKOFF = 2
 
 
 
 workspace_dir = os.getcwd()
 
+# Directory of local bare mirrors, see gitmirror.py. None uses the API only
+mirror_dir = None
+
+# Persistent commit metadata cache, see commitcache.py. None disables it
+commit_cache = None
+
+# Local index of merged PRs, see --pr-index. None disables it
+pr_index = None
+
+# Enrich commits with batched GraphQL queries, see --graphql
+graphql_enrichment = False
+GRAPHQL_BATCH = 100
+
+# Worker pool expanding bumped subrepos, see --jobs. None runs them inline
+subrepo_executor = None
+
+# Report trees of earlier runs, see reportstore.py. None disables it
+report_store = None
+# Stored chains ending this close to a new range are checked for reuse
+STORED_CANDIDATES = 3
+# Changes of the report tree being generated, a change reached again through
+# a cherry-pick or another bump path is only a cross-reference
+commit_identities = commitidentity.IdentityIndex()
+
+# Top level commits and their enrichment fetched up front for the ranges of
+# a batch of tags, see prefetch_batch. (repo_uri, begin, end) : commits and
+# sha : (closed issues, notes, stgDefects), each is used once
+batch_commits = dict()
+batch_enrichment = dict()
+
+# Ranges generate_commit_reports gave up on, incomplete trees aren't stored
+generate_errors = 0
+generate_errors_lock = threading.Lock()
+
+# Bundle --export-bundle writes what the run fetched into at exit, and the
+# one --from-bundle answers every call of the run from. None when not used
+bundle_writer = None
+bundle_reader = None
+
+# ClearQuest command line tool used by the bulk queries, see --cqcmd
+CQCMD_PATH = '/gsa/ausgsa/projects/p/pfd_rat_tools/prod/cqcmd.pl'
+cqcmd = CQCMD_PATH
+CQ_HOST = 'cqweb.rchland.ibm.com'
+CQCMD_ARGS = ['-db', 'AIXOS', '-schema', 'STGC_AIX',
+              '-cqhost', CQ_HOST, '-port', '6600', '-relog']
+# Host of the EWM work items, for --stats
+EWM_HOST = 'jazz07.rchland.ibm.com'
+# ClearQuest ids per bulk query, keeps the command line well under ARG_MAX
+CQ_BATCH = 200
+# ClearQuest universal ids, the closed issues also hold the EWM PE ids
+CQ_ID_RE = re.compile(r'^[SF]W\d{6}$')
+# What cqcmd.pl -fields splits on, between fields and between name and value
+CQ_FIELD_SEPARATORS = ['~~', '::']
+
 
 def rchop(thestring, ending):
     if thestring.endswith(ending):
@@ -35,7 +121,8 @@ def rreplace(s_value, old, new, occurrence):
     return new.join(line)
 
 def subtract_lists(A_list,B_list):
-    return [x for x in A_list if x not in B_list]
+    B_set = set(B_list)
+    return [x for x in A_list if x not in B_set]
 
 def intersect_lists(A_list,B_list):
     return list(set(A_list).intersection(B_list))
@@ -65,158 +152,77 @@ def get_repo_info(recipe):
 
     return l_uri
 
+###############################################################################
+# Precompiled scanner for PR texts and recipe patches
+#
+# Every pattern find_fixes looks for starts with the literal "fixes" and a
+# release note starts with "release note", so a text is searched once for
+# both keywords and each pattern is only tried where "fixes" occurs. Trying
+# them in text order and skipping occurrences inside the previous match of
+# the same pattern gives exactly what re.findall over the whole text gives,
+# and the note is read after the first "release note" as re.search finds
+# it. Patches are only searched for SRCREV and _URI values when those
+# keywords are in them. bench/scan_corpus.py checks all this against the
+# plain re.findall and re.search calls.
+###############################################################################
+JAZZ_URLS = [
+    'https://jazz07.rchland.ibm.com:13443/jazz/resource/itemName/com.ibm.team.workitem.WorkItem/',
+    'https://jazz07.rchland.ibm.com:13443'
+    '/jazz/web/projects/CSSD#action=com.ibm.team.workitem.viewWorkItem&id=',
+]
+
+# Group 1 is set for "fixes", empty for a release note
+KEYWORDS_RE = re.compile('(fixes)|release note[: ]', flags=re.I)
+CQ_RE = re.compile('fixes.+([S|F]W\d\d\d\d\d\d).*', flags=re.I)
+EWM_RE = re.compile('fixes[: ]*(PE\w+)', flags=re.I)
+STG_RE = re.compile('fixes[: ]*\s+(\d{6,8})', flags=re.I)
+JAZZ_RES = [re.compile('fixes[: ]*\s+' + re.escape(jazz_url) + '(\d{6,8})',
+                       flags=re.I)
+            for jazz_url in JAZZ_URLS]
+
+# Patterns in the order their matches are reported. True when the match
+# is a closed issue (CQ, EWM), False when it's a STGDefect number
+FIXES_PATTERNS = [(CQ_RE, True), (EWM_RE, True), (STG_RE, False)] \
+    + [(jazz_re, False) for jazz_re in JAZZ_RES]
+
+OLD_SRCREV_RE = re.compile('-[A-Z_]*SRCREV[+=? ]+"([a-f0-9]+)"')
+NEW_SRCREV_RE = re.compile('\+[A-Z_]*SRCREV[+=? ]+"([a-f0-9]+)"')
+# Tried in order, the last one that matches wins
+URI_RES = [
+    re.compile('_URI[+=? ]+"([-a-zA-Z0-9/:\.]+)"'),
+    re.compile('_URI[+=? ]+"([-a-zA-Z0-9/:\.@]+);'),
+    re.compile('\+SRC_URI[+=? ]+"([-a-zA-Z0-9/:\.@]+);'),
+]
+
+
 def get_bump_info(i_file, i_repo):
 
+    l_patch = i_file.patch
+
     # Get the new and old version hashes
     l_old_hash = None
     l_new_hash = None
-    l_old_hash_match = re.search('-[A-Z_]*SRCREV[+=? ]+"([a-f0-9]+)"',
-                                 i_file.patch)
-    l_new_hash_match = re.search('\+[A-Z_]*SRCREV[+=? ]+"([a-f0-9]+)"',
-                                 i_file.patch)
-    if l_old_hash_match:
-        l_old_hash = l_old_hash_match.group(1)
-    if l_new_hash_match:
-        l_new_hash = l_new_hash_match.group(1)
+    if 'SRCREV' in l_patch:
+        l_old_hash_match = OLD_SRCREV_RE.search(l_patch)
+        l_new_hash_match = NEW_SRCREV_RE.search(l_patch)
+        if l_old_hash_match:
+            l_old_hash = l_old_hash_match.group(1)
+        if l_new_hash_match:
+            l_new_hash = l_new_hash_match.group(1)
 
     # Get the URI of the subrepo
     l_uri = None
-    l_uri_match = re.search('_URI[+=? ]+"([-a-zA-Z0-9/:\.]+)"', i_file.patch)
-    if l_uri_match:
-        l_uri = l_uri_match.group(1)
-
-    l_uri_match = re.search('_URI[+=? ]+"([-a-zA-Z0-9/:\.@]+);', i_file.patch)
-    if l_uri_match:
-        l_uri = l_uri_match.group(1)
-
-
-    l_uri_match = re.search('\+SRC_URI[+=? ]+"([-a-zA-Z0-9/:\.@]+);', i_file.patch)
-    if l_uri_match:
-        l_uri = l_uri_match.group(1)
+    if '_URI' in l_patch:
+        for l_uri_re in URI_RES:
+            l_uri_match = l_uri_re.search(l_patch)
+            if l_uri_match:
+                l_uri = l_uri_match.group(1)
 
     return l_uri, l_new_hash, l_old_hash
 
 
 def get_repo(i_uri):
-
-    l_uri = i_uri.strip()
-    l_values = l_uri.split('/')
-
-    count = 0;
-    l_repo = None
-    for l_value in l_values:
-        if 'github.ibm.com' in l_value:
-            l_repo_name = l_values[count+1] + "/" + rchop(l_values[count+2],'.git')
-            logging.info('{}'.format(l_repo_name))
-            l_github = Github(login_or_token = config.py_ibm_token, base_url='https://github.ibm.com/api/v3')
-            l_repo = l_github.get_repo(l_repo_name)
-        
-        elif 'github.com' in l_value:
-            l_repo_name = l_values[count+1] + "/" + l_values[count+2]
-            l_repo_name = rreplace(l_repo_name, ".git", '', 1)                
-            logging.info('{}'.format(l_repo_name))
-            l_github = Github(login_or_token = config.py_token)
-            l_repo = l_github.get_repo(l_repo_name)
-        count += 1
-
-
-    return l_repo
-
-###############################################################################
-# @class CommitReport
-# @brief A class representing information about a commit and all commits in
-#        relevant subrepos
-###############################################################################
-class CommitReport:
-    def __init__(self, i_repo_uri, i_repo_name,  i_sha, i_nice_name, i_author_name,
-                 i_summary, i_insertions, i_deletions, i_closed_issues, i_notes, i_stgDefects):
-        self.repo_uri = i_repo_uri
-        self.repo_name = i_repo_name
-        self.sha = i_sha
-        self.nice_name = i_nice_name
-        self.author_name = i_author_name
-        self.summary = i_summary
-        self.insertions = i_insertions
-        self.deletions = i_deletions
-        self.closed_issues = i_closed_issues
-        self.notes = i_notes
-        self.stgDefects = i_stgDefects
-        self.subreports = []
-
-    def to_cl_string(self, i_level=0):
-        # Define colors for the console
-        RED = '\033[31m'
-        BLUE = '\033[94m'
-        ENDC = '\033[0m'
-        # Put the string together
-        l_cl_string = ('  ' * i_level) + RED + self.repo_name + ENDC  + ' ' \
-            + BLUE + self.nice_name + ENDC + ' ' \
-            + self.author_name + ' ' \
-            + re.sub('\s+', ' ', self.summary)
-        # Do the same for every subreport
-        for l_report in self.subreports:
-            l_cl_string += '\n' + l_report.to_cl_string(i_level + 1)
-        return l_cl_string
-    def to_string(self, i_level=0):
-        # Define colors for the console
-        # Put the string together
-        l_string = ('  ' * i_level) + self.repo_name + ' ' \
-            + self.nice_name + ' ' \
-            + self.author_name + ' ' \
-            + re.sub('\s+', ' ', self.summary)
-        # Do the same for every subreport
-        for l_report in self.subreports:
-            l_string += '\n' + l_report.to_string(i_level + 1)
-
-        return l_string
-
-    def to_html(self, i_level=0):
-        l_repo_url = re.sub('git://', 'http://', self.repo_uri)
-        l_repo_url = re.sub('github.ibm.com', 'https://github.ibm.com', self.repo_uri)
-        # Get HTML for this commit
-        l_html = \
-            '<div style="margin-left: ' + str(i_level * 20) + 'px">' \
-            + '<a href="' + l_repo_url + '" target="_blank" ' \
-            + 'style="color: red">' + self.repo_name + '</a>&nbsp;' \
-            + '<a href="' + l_repo_url + '/commit/' + self.sha \
-            + '" target="_blank" style="color: blue">' + self.nice_name \
-            + '</a>&nbsp;' \
-            + '<span style="color: green">' \
-            + re.sub('\s+', ' ', self.author_name) + '</span>' + ' ' \
-            + '<span>' + re.sub('\s+', ' ', self.summary) + '</span>' \
-            + '</div>\n'
-        # Get the HTML for all subcommits
-        for l_commit in self.subreports:
-            l_html += l_commit.to_html(i_level + 1)
-        return l_html
-
-    def get_total_insertions(self):
-        l_insertions = self.insertions
-        for l_commit in self.subreports:
-            l_insertions += l_commit.get_total_insertions()
-        return l_insertions
-
-    def get_total_deletions(self):
-        l_deletions = self.deletions
-        for l_commit in self.subreports:
-            l_deletions += l_commit.get_total_deletions()
-        return l_deletions
-
-    def get_all_closed_issues(self):
-        l_closed_issues = self.closed_issues
-        for l_commit in self.subreports:
-            l_closed_issues.extend(l_commit.get_all_closed_issues())
-        return l_closed_issues
-    def get_all_notes(self):
-        l_notes = self.notes
-        for l_commit in self.subreports:
-            l_notes.extend(l_commit.get_all_notes())
-        return l_notes
-    def get_all_stgDefects(self):
-        l_stgDefects = self.stgDefects
-        for l_commit in self.subreports:
-            l_stgDefects.extend(l_commit.get_all_stgDefects())
-        return l_stgDefects
+    return ghclient.get_repo(i_uri)
 
 ##############################################################################
 # @brief Cuts the hash in commit revision names down to its 7 digit prefix
@@ -232,52 +238,43 @@ def to_prefix_name_rev(i_name_rev):
     return l_name_rev
 
 
-def find_fixes(i_data):
+###############################################################################
+# @brief Finds the closed issues, STGDefects and release note of a text in
+#        one pass over it
+#
+# @return (closed issues, stgDefects, notes), as find_fixes and find_notes
+###############################################################################
+def find_fixes_and_notes(i_data):
 
     l_closed_issues = []
     l_stgDefects = []
+    l_note_start = None
 
     try:
-        
-        cq_matches = re.findall('fixes.+([S|F]W\d\d\d\d\d\d).*',i_data,flags=re.I)
-        if cq_matches:      
-            for cq in cq_matches:
-                logging.info(cq)
-                l_closed_issues.append(cq)
-            
-        ewm_matches = re.findall('fixes[: ]*(PE\w+)',i_data,flags=re.I)
-        if ewm_matches:
-            for ewm in ewm_matches:
-                logging.info(ewm)
-                l_closed_issues.append(ewm)
-
-        stg_matches = re.findall('fixes[: ]*\s+(\d{6,8})',i_data,flags=re.I)
-        if stg_matches:
-            for stg in stg_matches:
-                logging.info(stg)
-                l_stgDefects.append(stg)
-
-
-        url_list = []
-        url_list.append('https://jazz07.rchland.ibm.com:13443/jazz/resource/itemName/com.ibm.team.workitem.WorkItem/')
-        url_list.append('https://jazz07.rchland.ibm.com:13443'+\
-                                '/jazz/web/projects/CSSD#action=com.ibm.team.workitem.viewWorkItem&id=')
-
-
-        for jazz_url in url_list:
-            jazz_url = re.escape(jazz_url)
-
-            regex = 'fixes[: ]*\s+'+ jazz_url +'(\d{6,8})'
-
-            stg_matches = re.findall(regex, i_data, flags=re.I )
-            if stg_matches:
-                for stg in stg_matches:
-                    logging.info(stg)
-                    l_stgDefects.append(stg)
-
-
-
+        l_found = [[] for l_pattern in FIXES_PATTERNS]
+        l_ends = [0] * len(FIXES_PATTERNS)
 
+        for l_keyword in KEYWORDS_RE.finditer(i_data):
+            if not l_keyword.group(1):
+                if l_note_start is None:
+                    l_note_start = l_keyword.end()
+                continue
+            l_pos = l_keyword.start()
+            for l_index, (l_re, l_is_issue) in enumerate(FIXES_PATTERNS):
+                if l_pos < l_ends[l_index]:
+                    continue
+                l_match = l_re.match(i_data, l_pos)
+                if l_match:
+                    l_found[l_index].append(l_match.group(1))
+                    l_ends[l_index] = l_match.end()
+
+        for l_matches, (l_re, l_is_issue) in zip(l_found, FIXES_PATTERNS):
+            for l_value in l_matches:
+                logging.info(l_value)
+                if l_is_issue:
+                    l_closed_issues.append(l_value)
+                else:
+                    l_stgDefects.append(l_value)
 
         logging.info("List of closed issues and stgDefects")
         logging.info(l_closed_issues)
@@ -288,26 +285,39 @@ def find_fixes(i_data):
         fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
         logging.warning(exc_type, fname, exc_tb.tb_lineno)
 
+    l_notes = []
+    if l_note_start is not None:
+        l_notes = note_lines(i_data[l_note_start:])
+
+    return l_closed_issues, l_stgDefects, l_notes
 
+def find_fixes(i_data):
+    l_closed_issues, l_stgDefects, l_notes = find_fixes_and_notes(i_data)
     return l_closed_issues, l_stgDefects
 
 def find_notes(i_data):
+    return find_fixes_and_notes(i_data)[2]
+
+###############################################################################
+# @brief The lines of a release note, up to the first one with a '::'
+#
+# @param i_text : The text after "release note"
+###############################################################################
+def note_lines(i_text):
 
     l_notes = []
     
-    release_notes = re.search(r'Release note[: ](.*)',i_data,flags=re.I | re.DOTALL)
-    if release_notes:
-        lines =  release_notes.group(1).splitlines()
-        for line in lines:
-            if "::" in line:
-                note = line.split('::')
-#                l_notes.append(note[0].encode("utf8").strip())
-                l_notes.append(note[0].strip())
-
-                break
-            else:
-                #l_notes.append(line.encode("utf8").strip())
-                l_notes.append(line.strip())
+    lines =  i_text.splitlines()
+    for line in lines:
+        if "::" in line:
+            note = line.split('::')
+#            l_notes.append(note[0].encode("utf8").strip())
+            l_notes.append(note[0].strip())
+
+            break
+        else:
+            #l_notes.append(line.encode("utf8").strip())
+            l_notes.append(line.strip())
 
 
     return l_notes
@@ -348,10 +358,10 @@ def get_closed_issues(i_repo, i_commit):
                 pull_comments = pull_data.get_issue_comments()
                 for comment in pull_comments:
     #                print comment.body
-                    list1, list2 = find_fixes(comment.body)
+                    list1, list2, list3 = find_fixes_and_notes(comment.body)
                     l_closed_issues.extend(list1)
                     l_stgDefects.extend(list2)
-                    l_notes.extend(find_notes(comment.body))
+                    l_notes.extend(list3)
 
             num_match = re.search('Merge pull request #([0-9]+)',l_summary)
             if num_match:
@@ -363,17 +373,17 @@ def get_closed_issues(i_repo, i_commit):
 
                 pull_comments = pull_data.get_issue_comments()
                 for comment in pull_comments:
-                    list1, list2 = find_fixes(comment.body)
+                    list1, list2, list3 = find_fixes_and_notes(comment.body)
                     l_closed_issues.extend(list1)
                     l_stgDefects.extend(list2)
-                    l_notes.extend(find_notes(comment.body))
+                    l_notes.extend(list3)
 
             
         elif 'github.com' in  i_commit.commit.url:
                     logging.info("processing github.com")
                     logging.info(l_summary)
-                    pr_list = requests.get(pr_url, 
-                    headers=config.auth_headers).json()
+                    pr_list = ghclient.get_session('github.com').get(
+                        pr_url).json()
                     logging.debug(json.dumps(pr_list,indent=4))
                     logging.debug('length:{}'.format(len(pr_list)))
                     for pr_data in pr_list:
@@ -382,19 +392,16 @@ def get_closed_issues(i_repo, i_commit):
                             pull_data = i_repo.get_pull(pr_data['number'])
                             pull_comments = pull_data.get_issue_comments()
                             for comment in pull_comments:
-                                list1, list2 = find_fixes(comment.body)
+                                list1, list2, list3 = \
+                                    find_fixes_and_notes(comment.body)
                                 l_closed_issues.extend(list1)
                                 l_stgDefects.extend(list2)
-                                l_notes.extend(find_notes(comment.body))
+                                l_notes.extend(list3)
 
 
                     
-        print(l_closed_issues)
-        print(l_notes)
-        print(l_stgDefects)
-        l_closed_issues = list(dict.fromkeys(l_closed_issues))
-        l_notes = list(dict.fromkeys(l_notes))
-        l_stgDefects = list(dict.fromkeys(l_stgDefects))
+        l_closed_issues, l_notes, l_stgDefects = finish_closed_issues(
+            l_closed_issues, l_notes, l_stgDefects)
     
     except Exception as e:
         exc_type, exc_obj, exc_tb = sys.exc_info()
@@ -404,41 +411,230 @@ def get_closed_issues(i_repo, i_commit):
     return l_closed_issues, l_notes, l_stgDefects
 
 
+GRAPHQL_QUERY = '''query($owner: String!, $name: String!) {
+  repository(owner: $owner, name: $name) { %s }
+}'''
 
-def list_of_pull_requests(i_repo):
-    
-    pull_dict = dict()
-    pulls = i_repo.get_pulls(state='closed', sort='updated' ,direction='desc')
+GRAPHQL_PULL_FIELDS = '''number body
+    comments(first: 100) { totalCount nodes { body } }'''
 
-    for pr in pulls:     
-        logging.info(pr.number)
+GRAPHQL_COMMIT_FIELD = '''c%d: object(oid: "%s") { ... on Commit {
+    associatedPullRequests(first: 10) {
+      totalCount nodes { ''' + GRAPHQL_PULL_FIELDS + ''' } } } }'''
 
-        comments = pr.get_issue_comments()
+GRAPHQL_PULL_FIELD = '''p%d: pullRequest(number: %d) {
+    ''' + GRAPHQL_PULL_FIELDS + ''' }'''
 
-        for comment in comments:
-            logging.info(comment.body)
 
-        
+def get_pr_numbers(i_summary):
+    l_numbers = []
+    num_match = re.search('\(#([0-9]+)\)$', i_summary)
+    if num_match:
+        l_numbers.append(int(num_match.group(1)))
+    num_match = re.search('Merge pull request #([0-9]+)', i_summary)
+    if num_match:
+        l_numbers.append(int(num_match.group(1)))
+    return l_numbers
 
-        logging.info('commits:{}'.format(pr.commits))
-        commits = pr.get_commits()
-        for commit in commits:
-            logging.info(commit.sha)
-            logging.info(commit.commit.message)
 
-        dCTM = datetime.now() - pr.updated_at
+def is_complete_pull(i_pull):
+    l_comments = i_pull['comments']
+    return l_comments['totalCount'] <= len(l_comments['nodes'])
+
+
+###############################################################################
+# @brief Runs a PR's texts through find_fixes and find_notes the way
+#        get_closed_issues does for a PR fetched with REST
+#
+# @param i_body     : The PR body, None on the github.com path, which only
+#                     looks for fixes in the comments
+# @param i_comments : The comment bodies
+###############################################################################
+def scan_pull(i_body, i_comments, io_closed_issues, io_notes, io_stgDefects):
+    if i_body is not None:
+        list1, list2 = find_fixes(i_body)
+        io_closed_issues.extend(list1)
+        io_stgDefects.extend(list2)
+    for comment in i_comments:
+        list1, list2, list3 = find_fixes_and_notes(comment)
+        io_closed_issues.extend(list1)
+        io_stgDefects.extend(list2)
+        io_notes.extend(list3)
+
+
+def comment_bodies(i_pull):
+    return [l_comment['body'] for l_comment in i_pull['comments']['nodes']]
+
+
+###############################################################################
+# @brief Drops the repeats from what the PRs of a commit gave, the REST,
+#        GraphQL and PR index paths all end here
+#
+# @return (closed issues, notes, stgDefects)
+###############################################################################
+def finish_closed_issues(i_closed_issues, i_notes, i_stgDefects):
+    logging.debug(i_closed_issues)
+    logging.debug(i_notes)
+    logging.debug(i_stgDefects)
+    return (list(dict.fromkeys(i_closed_issues)), list(dict.fromkeys(i_notes)),
+            list(dict.fromkeys(i_stgDefects)))
+
+
+def graphql_commit_issues(i_host, i_owner, i_name, i_commits):
+    l_results = dict()
+    l_fields = [GRAPHQL_COMMIT_FIELD % (l_index, l_commit.sha)
+                for l_index, l_commit in enumerate(i_commits)]
+    l_data = ghclient.graphql(i_host, GRAPHQL_QUERY % '\n'.join(l_fields),
+                              {'owner': i_owner, 'name': i_name})
+    l_repo_data = l_data.get('repository') or {}
+
+    for l_index, l_commit in enumerate(i_commits):
+        l_object = l_repo_data.get('c%d' % l_index)
+        if not l_object:
+            continue
+        l_pulls = l_object['associatedPullRequests']
+        # Anything cut short by the page sizes is left to the REST path
+        if l_pulls['totalCount'] > len(l_pulls['nodes']) \
+                or not all(is_complete_pull(l_pull)
+                           for l_pull in l_pulls['nodes']):
+            continue
+        l_closed_issues, l_notes, l_stgDefects = [], [], []
+        for l_pull in l_pulls['nodes']:
+            logging.info(l_pull['number'])
+            scan_pull(None, comment_bodies(l_pull),
+                      l_closed_issues, l_notes, l_stgDefects)
+        l_results[l_commit.sha] = finish_closed_issues(
+            l_closed_issues, l_notes, l_stgDefects)
+
+    return l_results
+
+
+def graphql_pull_issues(i_host, i_owner, i_name, i_commits):
+    l_results = dict()
+    l_numbers = []
+    for l_commit in i_commits:
+        l_summary = ((l_commit.commit.message).split('\n')[0]).strip()
+        l_numbers.extend(get_pr_numbers(l_summary))
+    l_numbers = list(dict.fromkeys(l_numbers))
+
+    l_pulls = dict()
+    if l_numbers:
+        l_fields = [GRAPHQL_PULL_FIELD % (l_number, l_number)
+                    for l_number in l_numbers]
+        l_data = ghclient.graphql(i_host, GRAPHQL_QUERY % '\n'.join(l_fields),
+                                  {'owner': i_owner, 'name': i_name})
+        l_repo_data = l_data.get('repository') or {}
+        for l_number in l_numbers:
+            l_pulls[l_number] = l_repo_data.get('p%d' % l_number)
+
+    for l_commit in i_commits:
+        l_summary = ((l_commit.commit.message).split('\n')[0]).strip()
+        l_commit_pulls = [(l_number, l_pulls[l_number])
+                          for l_number in get_pr_numbers(l_summary)]
+        if not all(is_complete_pull(l_pull) for l_number, l_pull
+                   in l_commit_pulls if l_pull):
+            continue
+        l_closed_issues, l_notes, l_stgDefects = [], [], []
+        for l_number, l_pull in l_commit_pulls:
+            if not l_pull:
+                logging.warning("Unable to process PR:{}".format(l_number))
+                continue
+            scan_pull(l_pull['body'], comment_bodies(l_pull),
+                      l_closed_issues, l_notes, l_stgDefects)
+        l_results[l_commit.sha] = finish_closed_issues(
+            l_closed_issues, l_notes, l_stgDefects)
+
+    return l_results
+
+
+###############################################################################
+# @brief Gets what get_closed_issues would return for many commits at once,
+#        using one GraphQL query per GRAPHQL_BATCH commits for the PRs,
+#        PR bodies and comments
+#
+# @param i_repo_uri : The URI of the repo the commits are in
+# @param i_commits  : The commits to enrich
+#
+# @return A dict of sha : (closed issues, notes, stgDefects). Commits that
+#         are missing have to go through get_closed_issues
+###############################################################################
+def prefetch_closed_issues(i_repo_uri, i_commits):
+    l_results = dict()
+    l_parts = gitmirror.split_repo_uri(i_repo_uri)
+    if l_parts is None:
+        return l_results
+    l_host, l_owner, l_name = l_parts
+
+    for l_start in range(0, len(i_commits), GRAPHQL_BATCH):
+        l_batch = i_commits[l_start:l_start + GRAPHQL_BATCH]
+        try:
+            if l_host == 'github.ibm.com':
+                l_results.update(graphql_pull_issues(l_host, l_owner, l_name,
+                                                     l_batch))
+            else:
+                l_results.update(graphql_commit_issues(l_host, l_owner,
+                                                       l_name, l_batch))
+        except Exception as e:
+            logging.warning("graphql enrichment failed for {}, using REST: {}"
+                            .format(i_repo_uri, e))
+
+    return l_results
+
+
+
+###############################################################################
+# @brief Brings the local index of a repo's merged PRs up to date, fetching
+#        only the PRs updated since the last refresh, see prindex.py
+###############################################################################
+def list_of_pull_requests(i_repo):
+    pr_index.ensure_fresh(repo_host(i_repo), i_repo)
+
+def repo_host(i_repo):
+    if 'github.ibm.com' in i_repo.url:
+        return 'github.ibm.com'
+    return 'github.com'
+
+
+###############################################################################
+# @brief Gets what get_closed_issues would return for a commit from the
+#        local PR index, without any API call
+#
+# @return (closed issues, notes, stgDefects), or None if the index doesn't
+#         know the commit's PRs
+###############################################################################
+def indexed_closed_issues(i_repo, i_commit):
+    list_of_pull_requests(i_repo)
+    l_host = repo_host(i_repo)
+    l_closed_issues, l_notes, l_stgDefects = [], [], []
+
+    if l_host == 'github.ibm.com':
+        l_summary = ((i_commit.commit.message).split('\n')[0]).strip()
+        for l_number in get_pr_numbers(l_summary):
+            l_pull = pr_index.get_pull(l_host, i_repo.full_name, l_number)
+            if l_pull is None:
+                return None
+            scan_pull(l_pull['body'], l_pull['comments'],
+                      l_closed_issues, l_notes, l_stgDefects)
+    else:
+        l_pulls = pr_index.get_pulls_for_commit(l_host, i_repo.full_name,
+                                                i_commit.sha)
+        if l_pulls is None:
+            return None
+        for l_pull in l_pulls:
+            logging.info(l_pull['number'])
+            scan_pull(None, l_pull['comments'],
+                      l_closed_issues, l_notes, l_stgDefects)
+
+    return finish_closed_issues(l_closed_issues, l_notes, l_stgDefects)
 
-        if dCTM > timedelta(days=1):
-            logging.info("delta time works")
-            break
-        
 
 def git_add(filename):
 
     git_args = ['git', 'add', filename]
 
-    process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
-    stdoutput, stderroutput = process.communicate()
+    with profiling.span('git', git_args[1]):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
     stdoutput=stdoutput.decode()
     if 'fatal' in  stdoutput:
         print('git_add fatal')
@@ -447,8 +643,9 @@ def git_commit(commit_msg):
 
     git_args = ['git', 'commit', '-m', commit_msg]
 
-    process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
-    stdoutput, stderroutput = process.communicate()
+    with profiling.span('git', git_args[1]):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
     stdoutput=stdoutput.decode()
     if 'fatal' in  stdoutput:
         print('git_commit fatal')
@@ -456,8 +653,9 @@ def git_commit(commit_msg):
 def git_show(sha):
     git_args = ['git', 'show', sha]
 
-    process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
-    stdoutput, stderroutput = process.communicate()
+    with profiling.span('git', git_args[1]):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
     stdoutput=stdoutput.decode()
 
     if 'fatal' in  stdoutput:
@@ -470,8 +668,9 @@ def git_log(parms_array):
 
     git_args = ['git', 'log']+parms_array
 
-    process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
-    stdoutput, stderroutput = process.communicate()
+    with profiling.span('git', git_args[1]):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
     stdoutput=stdoutput.decode()
 
     if 'fatal' in  stdoutput:
@@ -485,8 +684,9 @@ def git_log(parms_array):
 def git_clone(repo_name, url):
     git_args = ['git', 'clone', url, repo_name]
 
-    process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
-    stdoutput, stderroutput = process.communicate()
+    with profiling.span('git', git_args[1]):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
     stdoutput=stdoutput.decode()
     if 'fatal' in  stdoutput:
         print('fatal git_clone')
@@ -499,8 +699,9 @@ def git_fetch(_cwd):
 
     git_args = ['git', 'fetch', '--all']
 
-    process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
-    stdoutput, stderroutput = process.communicate()
+    with profiling.span('git', git_args[1]):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
     stdoutput=stdoutput.decode()
     if 'fatal' in  stdoutput:
         print('fatal git_fetch')
@@ -513,8 +714,9 @@ def git_reset(_cwd):
     os.chdir(_cwd)
     git_args = ['git', 'reset', '--hard', 'FETCH_HEAD']
 
-    process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
-    stdoutput, stderroutput = process.communicate()
+    with profiling.span('git', git_args[1]):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
     stdoutput=stdoutput.decode()
     if 'fatal' in  stdoutput:
         print('fatal git_reset')
@@ -530,8 +732,9 @@ def git_branch(_cwd):
 
     git_args = ['git', 'branch' ]
 
-    process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
-    stdoutput, stderroutput = process.communicate()
+    with profiling.span('git', git_args[1]):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
     stdoutput=stdoutput.decode()
     if 'fatal' in  stdoutput:
         print('fatal git_branch')
@@ -549,8 +752,9 @@ def is_sha_commit(sha_value, _cwd):
     os.chdir(_cwd)
     git_args = ['git', 'cat-file', '-t', sha_value ]
 
-    process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
-    stdoutput, stderroutput = process.communicate()
+    with profiling.span('git', git_args[1]):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
     stdoutput=stdoutput.decode()
 #    if 'fatal' in  stdoutput:
 #        print('fatal')
@@ -565,16 +769,15 @@ def cq_to_ewm(cq_number):
 #    resource_type,resource_name,system_type,system_name,parentdefect,parentdefect.universal_id from ExternalResource 
 #    where  parentdefect.universal_id='SW552582' or parentrequirement.universal_id='SW552582'"
 
-    args_str = "cqcmd.pl -db AIXOS -schema STGC_AIX -cqhost cqweb.rchland.ibm.com  -port 6600 -relog -action query  -fields " 
-    args_str += "\"force_commit::yes~~sql::SELECT  resource_type,resource_name,system_type,system_name,parentdefect,parentdefect.universal_id from ExternalResource "
-    args_str += "where parentdefect.universal_id=\'{}\' or parentrequirement.universal_id=\'{}\'\"".format(cq_number,cq_number)
-
-    cq_args = shlex.split(args_str)
-    process = subprocess.Popen(cq_args, stdout=subprocess.PIPE)
-    stdoutput, stderroutput = process.communicate()
-    stdoutput=stdoutput.decode()
+    stdoutput = run_cqcmd([
+        '-action', 'query', '-fields',
+        "force_commit::yes~~sql::SELECT  resource_type,resource_name,"
+        "system_type,system_name,parentdefect,parentdefect.universal_id "
+        "from ExternalResource where parentdefect.universal_id='{}' or "
+        "parentrequirement.universal_id='{}'".format(cq_number, cq_number)])
+    if stdoutput is None:
+        return None
 
-    logging.info(stdoutput)
     lines = stdoutput.splitlines()
     for line in lines:
         # Example lines:
@@ -586,7 +789,93 @@ def cq_to_ewm(cq_number):
 
     return None
 
+###############################################################################
+# @brief Runs cqcmd.pl with the given action arguments
+#
+# @return The output, or None if cqcmd.pl failed
+###############################################################################
+def run_cqcmd(i_args):
+    if bundle_reader is not None:
+        return bundle_reader.command(CQCMD_ARGS + i_args)
+    cq_args = [cqcmd] + CQCMD_ARGS + i_args
+    with profiling.span('cqcmd', i_args[1]), \
+            callstats.timed('cqcmd', CQ_HOST, i_args[1]) as l_call:
+        process = subprocess.Popen(cq_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
+        l_call.bytes = len(stdoutput)
+        l_call.error = process.returncode != 0
+    if process.returncode != 0:
+        logging.warning("cqcmd.pl {} failed: {}".format(
+            ' '.join(i_args[:2]), stderroutput.decode('utf-8', 'replace')))
+        stdoutput = None
+    else:
+        stdoutput = stdoutput.decode('utf-8', 'replace')
+        logging.info(stdoutput)
+    if bundle_writer is not None:
+        bundle_writer.add_command(CQCMD_ARGS + i_args, stdoutput)
+    return stdoutput
+
+###############################################################################
+# @brief Runs a SQL query through cqcmd.pl
+#
+# @return The rows of the answer as lists of fields, or None if cqcmd.pl
+#         failed
+###############################################################################
+def cq_query(i_sql):
+    stdoutput = run_cqcmd(['-action', 'query', '-fields',
+                           'force_commit::yes~~sql::' + i_sql])
+    if stdoutput is None:
+        return None
+
+    l_rows = []
+    for line in stdoutput.splitlines():
+        if '|' not in line:
+            continue
+        if line.endswith('|'):
+            line = line[:-1]
+        l_rows.append([l_field.strip() for l_field in line.split('|')])
+    return l_rows
+
+def cq_in_list(cq_numbers):
+    return ', '.join("'{}'".format(cq) for cq in cq_numbers)
+
+###############################################################################
+# @brief Bulk version of cq_to_ewm, one cqcmd.pl query per CQ_BATCH numbers
+#
+# @param cq_numbers : ClearQuest universal ids
+#
+# @return Dict of ClearQuest universal id : STGDefect id for the numbers
+#         that have one
+###############################################################################
+def cq_to_ewm_bulk(cq_numbers):
+    l_wanted = list(dict.fromkeys(cq_numbers))
+    l_map = dict()
+    for l_start in range(0, len(l_wanted), CQ_BATCH):
+        l_chunk = l_wanted[l_start:l_start + CQ_BATCH]
+        l_ids = cq_in_list(l_chunk)
+        l_rows = cq_query(
+            "SELECT resource_type,resource_name,parentdefect.universal_id,"
+            "parentrequirement.universal_id from ExternalResource "
+            "where parentdefect.universal_id in ({}) "
+            "or parentrequirement.universal_id in ({})".format(l_ids, l_ids))
+        if l_rows is None:
+            # Fall back to one query per number for this chunk
+            for cq in l_chunk:
+                ewmId = cq_to_ewm(cq)
+                if ewmId is not None:
+                    l_map[cq] = ewmId
+            continue
+
+        for l_row in l_rows:
+            # Example row:
+            # STGDefect|313544|SW552204|
+            if len(l_row) < 4 or "STGDefect" not in l_row[0]:
+                continue
+            for cq in l_row[2:4]:
+                if cq in l_chunk and cq not in l_map:
+                    l_map[cq] = l_row[1]
 
+    return l_map
 
 
 def cq_info(cq_number):
@@ -634,9 +923,127 @@ def write_cq_keywords(cq_number, data):
 
     return stdoutput
 
+###############################################################################
+# @brief Gets the EWM instance of the calling thread, the ewm module makes no
+#        promise about sharing one between threads
+###############################################################################
+def get_ewm_instance():
+    if threading.current_thread() is threading.main_thread():
+        return ewm_instance
+    if not hasattr(ewm_local, 'instance'):
+        ewm_local.instance = ewm.Ewm()
+    return ewm_local.instance
+
+###############################################################################
+# @brief ewm display and modify, timed for --stats and --profile. display
+#        goes to the bundle with --export-bundle and --from-bundle
+#
+# @param i_ewm : The EWM instance, default the calling thread's one
+###############################################################################
+def ewm_display(ewmId, i_ewm=None):
+    if bundle_reader is not None:
+        return bundle_reader.workitem(ewmId)
+    with profiling.span('ewm', 'display'), \
+            callstats.timed('ewm', EWM_HOST, 'display'):
+        try:
+            workItem = (i_ewm or get_ewm_instance()).display(ewmId)
+        except Exception as e:
+            if bundle_writer is not None:
+                bundle_writer.add_workitem(ewmId, None, e)
+            raise
+    if bundle_writer is not None:
+        bundle_writer.add_workitem(ewmId, workItem)
+    return workItem
+
+def ewm_modify(ewmId, attributes, i_ewm=None):
+    with profiling.span('ewm', 'modify'), \
+            callstats.timed('ewm', EWM_HOST, 'modify'):
+        (i_ewm or get_ewm_instance()).modify(id=ewmId, attributes=attributes)
+
+###############################################################################
+# @brief Reads an EWM work item once per run
+#
+# @param ewmId   : The work item id
+# @param i_fresh : Don't settle for a copy from the on-disk cache, used
+#                  before writes so the "already contains" checks hold
+#
+# @return The work item dict as returned by ewm display
+###############################################################################
+def read_ewm_workitem(ewmId, i_fresh=False):
+    with ewm_workitems_lock:
+        l_entry = ewm_workitems.get(ewmId)
+    l_hit = bool(l_entry and not (i_fresh and l_entry[2]))
+    callstats.count_cache('ewm work items', l_hit)
+    if l_hit:
+        return l_entry[0]
+    workItem = ewm_display(ewmId)
+    with ewm_workitems_lock:
+        ewm_workitems[ewmId] = (workItem, time.time(), False)
+    return workItem
+
+def forget_ewm_workitem(ewmId):
+    with ewm_workitems_lock:
+        ewm_workitems.pop(ewmId, None)
+
+###############################################################################
+# @brief Reads all the given work items that aren't known yet, ewm_jobs at a
+#        time. The ewm module has no bulk read, so this is as close as it
+#        gets to one.
+###############################################################################
+def prefetch_ewm_workitems(ewmIds):
+    with ewm_workitems_lock:
+        l_missing = [ewmId for ewmId in dict.fromkeys(ewmIds)
+                     if ewmId not in ewm_workitems]
+    if not l_missing:
+        return
+
+    def read(ewmId):
+        try:
+            read_ewm_workitem(ewmId)
+        except:
+            logging.warning("Unable to read ewm work item:{}".format(ewmId))
+
+    if ewm_jobs > 1 and len(l_missing) > 1:
+        with ThreadPoolExecutor(max_workers=ewm_jobs) as l_executor:
+            list(l_executor.map(read, l_missing))
+    else:
+        for ewmId in l_missing:
+            read(ewmId)
+    save_ewm_cache()
+
+def load_ewm_cache():
+    if not ewm_cache_ttl or not os.path.exists(ewm_cache_file):
+        return
+    try:
+        with open(ewm_cache_file) as l_file:
+            l_entries = json.load(l_file)
+    except Exception as e:
+        logging.warning("Unable to read {}: {}".format(ewm_cache_file, e))
+        return
+    l_oldest = time.time() - ewm_cache_ttl
+    with ewm_workitems_lock:
+        for ewmId, (workItem, l_time) in l_entries.items():
+            if l_time >= l_oldest:
+                ewm_workitems[ewmId] = (workItem, l_time, True)
+
+def save_ewm_cache():
+    if not ewm_cache_ttl:
+        return
+    l_oldest = time.time() - ewm_cache_ttl
+    with ewm_workitems_lock:
+        l_entries = dict((ewmId, (workItem, l_time)) for ewmId, (workItem,
+                         l_time, l_from_disk) in ewm_workitems.items()
+                         if l_time >= l_oldest)
+    l_cache_dir = os.path.dirname(ewm_cache_file)
+    if not os.path.isdir(l_cache_dir):
+        os.makedirs(l_cache_dir)
+    with open(ewm_cache_file + '.tmp', 'w') as l_file:
+        json.dump(l_entries, l_file, default=str)
+    os.replace(ewm_cache_file + '.tmp', ewm_cache_file)
+
 def read_ewm_universalid_summary_owner(ewmId):
     try:
-        workItem = ewm_instance.display(ewmId)
+        workItem = read_ewm_workitem(ewmId)
         universal_id = workItem["Universal ID"]
         summary =  workItem["Summary"]
         owner = workItem["Owned By"]
@@ -649,7 +1056,7 @@ def read_ewm_universalid_summary_owner(ewmId):
 
 def read_ewm_tags(ewmId):
     try:
-        workItem = ewm_instance.display(ewmId)
+        workItem = read_ewm_workitem(ewmId, i_fresh=True)
         return (workItem["Tags"])
     except:
         logging.warning("Unable to read ewm Tags:{}".format(ewmId))
@@ -657,7 +1064,8 @@ def read_ewm_tags(ewmId):
 
 def write_ewm_tags(ewmId, data):
     try:
-        ewm_instance.modify(id=ewmId,attributes=["Tags:", data])
+        forget_ewm_workitem(ewmId)
+        ewm_modify(ewmId, ["Tags:", data])
     except:
         logging.warning("Unable to write ewm Tags:{}".format(data))
 
@@ -673,7 +1081,7 @@ def update_ewm_tags_field(ewmId, data='merged'):
 
 def read_ewm_priority_justification(ewmId):
     try:
-        workItem = ewm_instance.display(ewmId)
+        workItem = read_ewm_workitem(ewmId, i_fresh=True)
         return (workItem["Priority Justification"])
     except:
         logging.warning("Unable to read ewm priority justification:{}".format(ewmId))
@@ -681,7 +1089,8 @@ def read_ewm_priority_justification(ewmId):
 
 def write_ewm_priority_justification(ewmId, data):
     try:
-        ewm_instance.modify(id=ewmId,attributes=["Priority Justification:", data])
+        forget_ewm_workitem(ewmId)
+        ewm_modify(ewmId, ["Priority Justification:", data])
     except:
         logging.warning("Unable to write ewm priority justification:{}".format(data))
 
@@ -695,6 +1104,99 @@ def update_ewm_priority_justification_tag_info(ewmId, tag):
     print("Writing",ewmId,":",new_text)
     write_ewm_priority_justification(ewmId, new_text)
 
+###############################################################################
+# @brief Waits until the next EWM call fits in ewm_rate calls per second
+###############################################################################
+def ewm_throttle():
+    global ewm_next_call
+    if not ewm_rate:
+        return
+    with ewm_rate_lock:
+        l_now = time.time()
+        l_wait = ewm_next_call - l_now
+        ewm_next_call = max(l_now, ewm_next_call) + 1.0 / ewm_rate
+    if l_wait > 0:
+        time.sleep(l_wait)
+
+###############################################################################
+# @brief Does what update_ewm_priority_justification_tag_info and
+#        update_ewm_tags_field do for one work item, but lets errors through
+#        so they can be retried. The work item is read again on every
+#        attempt, so a retry after a partial update doesn't add the tag twice
+#
+# @return True if the work item was modified, False if it had the tag info
+#         and the merged tag already
+###############################################################################
+def update_ewm_workitem(ewmId, tag, data='merged'):
+    tag_info = "OPENBMC_TAG:%s" % tag
+    l_ewm = get_ewm_instance()
+    ewm_throttle()
+    workItem = ewm_display(ewmId, l_ewm)
+    l_updated = False
+
+    original_text = workItem["Priority Justification"]
+    if tag_info not in original_text:
+        new_text = tag_info + " " + original_text
+        print("Writing",ewmId,":",new_text)
+        forget_ewm_workitem(ewmId)
+        ewm_throttle()
+        ewm_modify(ewmId, ["Priority Justification:", new_text], l_ewm)
+        l_updated = True
+
+    original_text = workItem["Tags"]
+    if data not in original_text:
+        new_text = original_text + " " + data
+        print("Writing",ewmId,":",new_text)
+        forget_ewm_workitem(ewmId)
+        ewm_throttle()
+        ewm_modify(ewmId, ["Tags:", new_text], l_ewm)
+        l_updated = True
+
+    return l_updated
+
+###############################################################################
+# @brief Records a tag in EWM work items, i_workers at a time, retrying each
+#        failing item ewm_retries times with exponential backoff
+#
+# @param ewmIds    : The work item ids
+# @param tag       : Tag name recorded in the priority justification
+# @param i_workers : Number of work items updated at the same time
+#
+# @return Dict of ewmId : 'updated', 'skipped' or 'failed'
+###############################################################################
+def update_ewm_workitems(ewmIds, tag, i_workers=1):
+    def update(ewmId):
+        for l_attempt in range(ewm_retries + 1):
+            try:
+                if update_ewm_workitem(ewmId, tag):
+                    return 'updated'
+                return 'skipped'
+            except Exception as e:
+                if l_attempt == ewm_retries:
+                    logging.warning("Unable to update ewm work item:{} {}"
+                                    .format(ewmId, e))
+                    return 'failed'
+                l_delay = EWM_BACKOFF * 2 ** l_attempt
+                logging.warning("Updating ewm work item:{} failed ({}), "
+                                "retrying in {}s".format(ewmId, e, l_delay))
+                time.sleep(l_delay)
+
+    ewmIds = list(dict.fromkeys(ewmIds))
+    if i_workers > 1 and len(ewmIds) > 1:
+        with ThreadPoolExecutor(max_workers=i_workers) as l_executor:
+            l_states = list(l_executor.map(update, ewmIds))
+    else:
+        l_states = [update(ewmId) for ewmId in ewmIds]
+    l_results = dict(zip(ewmIds, l_states))
+
+    print("EWM updates: {} updated, {} skipped, {} failed".format(
+        l_states.count('updated'), l_states.count('skipped'),
+        l_states.count('failed')))
+    for ewmId, l_state in l_results.items():
+        if l_state == 'failed':
+            print("  failed: {}".format(ewmId))
+
+    return l_results
 
 
 def read_cq_priority_justification(cq_number):
@@ -794,6 +1296,117 @@ def update_cq_tag_info(cq_number, tag):
     new_text = tag_info + "\n" + original_text
     write_cq_priority_justification(cq_number, new_text)
 
+###############################################################################
+# @brief Reads one, possibly multi-line, field of many defects with one
+#        cqcmd.pl query per CQ_BATCH defects
+#
+# @param cq_numbers : ClearQuest universal ids
+# @param i_field    : Defect field, e.g. Notes_Log
+#
+# @return Dict of universal id : field text, ids cqcmd.pl didn't answer for
+#         are left out
+###############################################################################
+def read_cq_field_bulk(cq_numbers, i_field):
+    l_wanted = list(dict.fromkeys(cq_numbers))
+    l_values = dict()
+    for l_start in range(0, len(l_wanted), CQ_BATCH):
+        l_chunk = l_wanted[l_start:l_start + CQ_BATCH]
+        stdoutput = run_cqcmd(
+            ['-action', 'query', '-fields',
+             "force_commit::yes~~sql::SELECT universal_id, {} from defect "
+             "where Universal_id in ({})".format(i_field,
+                                                 cq_in_list(l_chunk))])
+        if stdoutput is None:
+            continue
+
+        # A record is "<id>|<text>|", the text may span lines, so a new
+        # record starts at the first line beginning with an id asked for
+        l_current = None
+        l_lines = []
+        for line in stdoutput.splitlines() + [None]:
+            if line is not None:
+                l_id = line.split('|', 1)[0]
+                if l_id not in l_chunk or '|' not in line:
+                    if l_current is not None:
+                        l_lines.append(line)
+                    continue
+            if l_current is not None:
+                l_values[l_current] = rreplace('\n'.join(l_lines), '|', '', 1)
+            if line is not None:
+                l_current = l_id
+                l_lines = [line.split('|', 1)[1]]
+
+    return l_values
+
+###############################################################################
+# @brief Bulk version of update_cq_tag_info and update_keywords for --update
+#
+# The notes, priority justifications and keywords of all the defects are read
+# with one query per field and CQ_BATCH defects, the changes are worked out
+# locally and each defect that needs any gets a single modify carrying them
+# all, cqcmd.pl modifies one defect per call. A defect with ~~ or :: in a
+# value to write is left alone, -fields has no way to quote them.
+#
+# @param cq_numbers : ClearQuest universal ids
+# @param tag        : Tag name recorded in the defects
+# @param i_dry_run  : Only report what would change
+#
+# @return Dict of universal id : list of the fields changed, or None when
+#         the defect couldn't be read, modified or left alone
+###############################################################################
+def update_cq_bulk(cq_numbers, tag, i_dry_run=False):
+    tag_info = "OPENBMC_TAG:%s" % tag
+    l_notes = read_cq_field_bulk(cq_numbers, 'Notes_Log')
+    l_justifications = read_cq_field_bulk(cq_numbers, 'Priority_Justification')
+    l_keywords = read_cq_field_bulk(cq_numbers, 'keywords')
+
+    l_changes = dict()
+    for cq in dict.fromkeys(cq_numbers):
+        if cq not in l_notes or cq not in l_justifications \
+                or cq not in l_keywords:
+            logging.warning("Unable to read ClearQuest defect:{}".format(cq))
+            l_changes[cq] = None
+            continue
+
+        l_fields = []
+        if not check_for_tag(tag_info, l_notes[cq]):
+            l_fields.append(('Note_Entry', tag_info))
+        if tag_info not in l_justifications[cq]:
+            l_fields.append(('Priority_Justification',
+                             tag_info + "\n" + l_justifications[cq]))
+        if not re.findall('merged', l_keywords[cq], flags=re.I):
+            l_fields.append(('Keywords', l_keywords[cq].strip() + "\nMerged"))
+
+        # A value holding a separator would be cut into other fields
+        l_unsafe = [l_name for l_name, l_value in l_fields
+                    if any(l_sep in l_value for l_sep in CQ_FIELD_SEPARATORS)]
+        if l_unsafe:
+            logging.warning("Not updating ClearQuest defect:{}, its {} has {} "
+                            "in it".format(cq, ', '.join(l_unsafe),
+                                           ' or '.join(CQ_FIELD_SEPARATORS)))
+            l_changes[cq] = None
+            continue
+
+        l_changes[cq] = [l_name for l_name, l_value in l_fields]
+        if not l_fields or i_dry_run:
+            continue
+        l_text = '~~'.join(['force_commit::yes'] + ['{}::{}'.format(l_name,
+                           l_value) for l_name, l_value in l_fields])
+        if run_cqcmd(['-action', 'modify', '-univid', cq,
+                      '-fields', l_text]) is None:
+            l_changes[cq] = None
+
+    print("ClearQuest updates{}:".format(" (dry run)" if i_dry_run else ""))
+    for cq, l_fields in l_changes.items():
+        if l_fields is None:
+            print("  {}: failed".format(cq))
+        elif l_fields:
+            print("  {}: {}".format(cq, ', '.join(l_fields)))
+        else:
+            print("  {}: unchanged".format(cq))
+
+    return l_changes
+
 def switch_branch(branch_name, _cwd):
     saved_cwd = os.getcwd()
     global workspace_dir
@@ -802,8 +1415,9 @@ def switch_branch(branch_name, _cwd):
 
     git_args = ['git', 'checkout', branch_name]
 
-    process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
-    stdoutput, stderroutput = process.communicate()
+    with profiling.span('git', git_args[1]):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        stdoutput, stderroutput = process.communicate()
     stdoutput = stdoutput.decode()
 
     if 'fatal' in  stdoutput:
@@ -827,11 +1441,188 @@ def git_clone_or_reset(repo_name, url, args):
 
 
 
+###############################################################################
+# @brief Gets a commit with its stats and files, from the commit cache when
+#        it is there, otherwise from the API and into the cache
+###############################################################################
+def resolve_commit(i_repo, i_repo_uri, i_commit):
+    if commit_cache is None:
+        return i_commit
+    l_commit = commit_cache.get_commit(i_repo_uri, i_commit.sha)
+    if l_commit is not None:
+        if l_commit.patch_id is not commitidentity.UNKNOWN \
+                or not needs_patch_id(l_commit.commit.message):
+            return l_commit
+        # Cached by commitTracker.py, which doesn't look for repeated changes
+        i_commit = i_repo.get_commit(i_commit.sha)
+    elif isinstance(i_commit, gitmirror.LocalCommit) and i_commit.files is None:
+        # Only the range was cached
+        i_commit = i_repo.get_commit(i_commit.sha)
+    l_files = None
+    if needs_patch_id(i_commit.commit.message):
+        # The cache keeps only the recipe patches, the patch id has to be
+        # worked out before
+        l_files = list(i_commit.files)
+        commitidentity.patch_id(i_commit, l_files)
+    commit_cache.put_commit(i_repo_uri, i_commit, l_files)
+    return i_commit
+
+###############################################################################
+# @brief Tells if the change of a commit is only known by its patch id: it
+#        has no Change-Id and isn't a PR merge, which has the diff of the PR
+###############################################################################
+def needs_patch_id(i_message):
+    return not is_pr_merge(i_message) and not commitidentity.change_id(
+        i_message)
+
+def is_pr_merge(i_message):
+    return "Merge pull request" in i_message.split('\n')[0]
+
+###############################################################################
+# @brief Gets the commits of a range: from the commit cache, a mirror or the
+#        compare API, and into the cache
+#
+# Branch and tag names are resolved with the API first, the cache and the
+# mirrors are only asked for the SHAs the server has. A mirror that hasn't
+# fetched them yet doesn't have the range, it is walked with the API.
+#
+# @return A list of commits oldest first
+###############################################################################
+def range_commits(i_repo, i_repo_uri, i_begin_commit, i_end_commit):
+    l_resolved = False
+    if commit_cache or mirror_dir:
+        l_begin_sha = resolve_sha(i_repo, i_begin_commit)
+        l_end_sha = resolve_sha(i_repo, i_end_commit)
+        if l_begin_sha is not None and l_end_sha is not None:
+            i_begin_commit, i_end_commit = l_begin_sha, l_end_sha
+            l_resolved = True
+    l_commits = None
+    if commit_cache:
+        l_commits = commit_cache.get_range(
+            i_repo_uri, i_begin_commit, i_end_commit)
+    if l_commits is None:
+        if mirror_dir and l_resolved:
+            l_commits = gitmirror.mirror_commits(
+                mirror_dir, i_repo_uri, i_begin_commit, i_end_commit)
+        if l_commits is None:
+            l_commits = ghclient.compare_commits(
+                i_repo, i_begin_commit, i_end_commit)
+        if commit_cache:
+            commit_cache.put_range(i_repo_uri, i_begin_commit,
+                                   i_end_commit, l_commits)
+    return l_commits
+
+###############################################################################
+# @brief Fetches the top level commits of all the ranges of a batch of tags
+#        at once, i_workers ranges at a time, and with --graphql enriches
+#        all of them in full GRAPHQL_BATCH queries. generate_commit_reports
+#        takes them from batch_commits and batch_enrichment
+#
+# @param i_repo_uri : URI of the repo
+# @param i_ranges   : List of (begin, end) references
+# @param i_workers  : Ranges compared at the same time
+###############################################################################
+def prefetch_batch(i_repo_uri, i_ranges, i_workers):
+    l_repo = get_repo(i_repo_uri)
+    if l_repo is None:
+        return
+
+    def fetch(i_range):
+        try:
+            return range_commits(l_repo, i_repo_uri, i_range[0], i_range[1])
+        except Exception as e:
+            # generate_commit_reports tries again and reports it
+            logging.warning('Unable to compare {}..{}: {}'.format(
+                i_range[0], i_range[1], e))
+            return None
+
+    with profiling.span('compare walk'):
+        with ThreadPoolExecutor(max_workers=max(1, i_workers)) as l_executor:
+            l_results = list(l_executor.map(fetch, i_ranges))
+    l_union = []
+    for (l_begin, l_end), l_commits in zip(i_ranges, l_results):
+        if l_commits is not None:
+            batch_commits[(i_repo_uri, l_begin, l_end)] = l_commits
+            l_union.extend(l_commits)
+    if graphql_enrichment and l_union:
+        with profiling.span('enrichment'):
+            batch_enrichment.update(prefetch_closed_issues(i_repo_uri,
+                                                           l_union))
+
+###############################################################################
+# @brief Starts the report generation for a bumped subrepo, on the worker
+#        pool when there is one, inline otherwise
+#
+# @return A job to hand to collect_subrepo_reports
+###############################################################################
+def submit_subrepo_reports(i_repo_uri, i_begin_commit, i_end_commit):
+    # Bound to the spans open here, so --profile nests it under its parent
+    # whichever thread runs it
+    l_run = profiling.wrap(subrepo_reports, i_repo_uri, i_begin_commit,
+                           i_end_commit)
+    if subrepo_executor is None:
+        return (None, l_run())
+    return (subrepo_executor.submit(l_run), l_run)
+
+def collect_subrepo_reports(i_job):
+    l_future, l_value = i_job
+    if l_future is None:
+        return l_value
+    # A job no worker has picked up yet is run by the waiting thread. Workers
+    # only ever wait on jobs that are already running, so the bounded pool
+    # can't deadlock on nested bumps.
+    if l_future.cancel():
+        return l_value()
+    return l_future.result()
+
+def subrepo_reports(i_repo_uri, i_begin_commit, i_end_commit):
+    with profiling.span('subrepo',
+                        i_repo_uri.split('/')[-1].replace('.git', '')):
+        return generate_commit_reports(i_repo_uri, i_begin_commit,
+                                       i_end_commit)
+
+
+###############################################################################
+# @brief Hands on the reports whose subrepo reports are all there, in order
+#
+# @param io_pending  : List of [report, subrepo jobs] in commit order
+# @param i_wait      : Wait for the jobs of every pending report
+# @param i_on_report : Callable taking the finished reports
+###############################################################################
+def flush_reports(io_pending, i_wait, i_on_report):
+    while io_pending:
+        l_report, l_jobs = io_pending[0]
+        if not i_wait and not all(l_job[0] is None or l_job[0].done()
+                                  for l_job in l_jobs):
+            return
+        # Attach subrepo reports in bump order so the tree matches a serial
+        # run
+        for l_job in l_jobs:
+            l_report.add_subreports(collect_subrepo_reports(l_job))
+        io_pending.pop(0)
+        i_on_report(l_report)
+
+
+###############################################################################
+# @brief Generates the report tree of a range
+#
+# @param i_repo_uri     : URI of the repo
+# @param i_begin_commit : Reference to the oldest commit, excluded
+# @param i_end_commit   : Reference to the newest commit, included
+# @param i_on_report    : Optional callable taking each top level report, in
+#                         order, as soon as its subrepo reports are done.
+#                         The reports are then not kept nor returned
+#
+# @return A list of CommitReport objects, empty when i_on_report is given
+###############################################################################
 def generate_commit_reports(i_repo_uri, i_begin_commit,
-                            i_end_commit):
+                            i_end_commit, i_on_report=None):
     # Get the repo that the user requested
     
     l_reports = []
+    l_pending = []
+    if i_on_report is None:
+        i_on_report = l_reports.append
     commit_dict = dict()
     commit_msg_dict = dict()
 
@@ -845,7 +1636,12 @@ def generate_commit_reports(i_repo_uri, i_begin_commit,
 
     try:
 
-        l_commits = l_repo.compare(i_begin_commit, i_end_commit).commits
+        l_commits = batch_commits.pop(
+            (i_repo_uri, i_begin_commit, i_end_commit), None)
+        if l_commits is None:
+            with profiling.span('compare walk'):
+                l_commits = range_commits(l_repo, i_repo_uri, i_begin_commit,
+                                          i_end_commit)
 
         # Go through all commits check for duplicates by using commit message which includes author, date, Change-Id
 
@@ -856,6 +1652,26 @@ def generate_commit_reports(i_repo_uri, i_begin_commit,
             commit_dict.setdefault(l_author.name.encode('ascii','ignore'), []).append(l_commit.commit.message)   
             commit_msg_dict.setdefault(l_commit.commit.message.encode('ascii','ignore'), []).append(l_commit.sha)
 
+        l_unique_commits = [
+            l_commit for l_commit in l_commits
+            if commit_msg_dict[l_commit.commit.message.encode(
+                'ascii', 'ignore')][-1] == l_commit.sha]
+        l_enrichment = dict()
+        with profiling.span('enrichment'):
+            for l_commit in l_unique_commits:
+                if l_commit.sha in batch_enrichment:
+                    l_enrichment[l_commit.sha] = batch_enrichment.pop(
+                        l_commit.sha)
+            if pr_index:
+                for l_commit in l_unique_commits:
+                    l_indexed = indexed_closed_issues(l_repo, l_commit)
+                    if l_indexed is not None:
+                        l_enrichment[l_commit.sha] = l_indexed
+            if graphql_enrichment:
+                l_enrichment.update(prefetch_closed_issues(i_repo_uri, [
+                    l_commit for l_commit in l_unique_commits
+                    if l_commit.sha not in l_enrichment]))
+
         for l_commit in l_commits:
 
             
@@ -866,6 +1682,8 @@ def generate_commit_reports(i_repo_uri, i_begin_commit,
 
 
             logging.info(l_commit.sha)
+            with profiling.span('commit details'):
+                l_commit = resolve_commit(l_repo, i_repo_uri, l_commit)
 
             # Get the insertion and deletion line counts
             l_insertions = l_commit.stats.additions
@@ -878,13 +1696,55 @@ def generate_commit_reports(i_repo_uri, i_begin_commit,
             logging.debug(l_author.name) 
             logging.debug(l_summary)
 
-            l_closed_issues, l_notes, l_stgDefects = get_closed_issues(l_repo, l_commit)
+            l_repo_name = i_repo_uri.split('/')[-1].replace('.git', '')
+            l_nice_name = to_prefix_name_rev(l_commit.sha)
+            # A merge has the diff of the PR it merges, it isn't claimed
+            l_identity = None
+            l_first = None
+            l_files = None
+            if not is_pr_merge(l_summary):
+                # Walked once, every walk over the files of an API commit
+                # asks for them again
+                l_files = list(l_commit.files)
+                l_identity = commitidentity.identity(i_repo_uri, l_commit,
+                                                     l_files)
+                # Changes are claimed as the reports are attached, in tree
+                # order, see claim_changes. One claimed already was claimed
+                # by a commit before this one in the tree
+                l_first = commit_identities.first(l_identity)
+            if l_first is not None and l_first[0] == i_repo_uri \
+                    and l_first[2] == l_commit.sha:
+                # The same commit again, the first one has it all
+                l_closed_issues, l_notes, l_stgDefects = EMPTY, EMPTY, EMPTY
+            elif l_commit.sha in l_enrichment:
+                l_closed_issues, l_notes, l_stgDefects = \
+                    l_enrichment[l_commit.sha]
+            else:
+                with profiling.span('enrichment'):
+                    l_closed_issues, l_notes, l_stgDefects = \
+                        get_closed_issues(l_repo, l_commit)
+
+            if l_first is not None:
+                # The first commit of the change has the subrepo bumps, this
+                # one only refers to it. Its PR may fix more, a cherry-pick
+                # has one of its own
+                logging.info('{} is the same change as {} {}'.format(
+                    l_commit.sha, l_first[1], l_first[2]))
+                l_report = CommitReport(
+                    i_repo_uri, l_repo_name, str(l_commit.sha), l_nice_name,
+                    l_author.name, l_summary, 0, 0, l_closed_issues, l_notes,
+                    l_stgDefects)
+                l_report.identity = l_identity
+                l_report.duplicate_of = l_first
+                l_pending.append([l_report, []])
+                flush_reports(l_pending, False, i_on_report)
+                continue
 
             l_report = CommitReport(
                 i_repo_uri,
-                i_repo_uri.split('/')[-1].replace('.git', ''),
+                l_repo_name,
                 str(l_commit.sha),
-                to_prefix_name_rev(l_commit.sha),
+                l_nice_name,
                 l_author.name,
                 l_summary,
                 l_insertions,
@@ -892,17 +1752,20 @@ def generate_commit_reports(i_repo_uri, i_begin_commit,
                 l_closed_issues,
                 l_notes,
                 l_stgDefects)
+            l_report.identity = l_identity
                 
                 
             if  "Merge pull request" in l_summary:
                 # Put the report on the end of the list
-                l_reports.append(l_report)
+                l_pending.append([l_report, []])
+                flush_reports(l_pending, False, i_on_report)
                 # don't process merge pull request it creates duplicates 
                 logging.info("found Merge pull request don't process")
                 continue
 
+            l_subrepo_jobs = []
+
             # Search the files for any bumps of submodule versions
-            l_files = l_commit.files
             for l_file in l_files:
                 # If we have two files to compare with diff...
                 if l_file.patch:
@@ -924,15 +1787,16 @@ def generate_commit_reports(i_repo_uri, i_begin_commit,
                             and l_subrepo_uri.startswith('git'):
                         logging.debug('  Bumped')
                         l_subrepo_path = l_subrepo_uri.split('/')[-1]
-                        l_subreports = generate_commit_reports(
-                        l_subrepo_uri,
-                            l_subrepo_old_hash,
-                            l_subrepo_new_hash)
-                        l_report.subreports.extend(l_subreports)
+                        l_subrepo_jobs.append(
+                            submit_subrepo_reports(
+                                l_subrepo_uri,
+                                l_subrepo_old_hash,
+                                l_subrepo_new_hash))
 
             # Put the report on the end of the list
             logging.info("append l_report")
-            l_reports.append(l_report)
+            l_pending.append([l_report, l_subrepo_jobs])
+            flush_reports(l_pending, False, i_on_report)
 
 
     except Exception as e:
@@ -940,10 +1804,232 @@ def generate_commit_reports(i_repo_uri, i_begin_commit,
         fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
         logging.warning("exception in generate_commit_reports: do nothing")
         logging.warning(exc_type, fname, exc_tb.tb_lineno)
+        global generate_errors
+        with generate_errors_lock:
+            generate_errors += 1
 
+    flush_reports(l_pending, True, i_on_report)
 
     return l_reports
 
+def natural_key(i_ref):
+    return [int(l_part) if l_part.isdigit() else l_part
+            for l_part in re.split(r'(\d+)', i_ref)]
+
+###############################################################################
+# @brief Claims the changes of a report tree as it is attached to the tree
+#
+# Reports are attached in tree order, each one before its subreports, so the
+# first commit of a change in the tree keeps it. A later commit of the change
+# is made a cross-reference to it, whichever worker thread got to it first.
+#
+# @param i_bump : (repo_uri, sha) of the commit whose bump reached the
+#                 report, None for the commits of the range itself
+###############################################################################
+def claim_changes(i_report, i_bump=None):
+    if i_report.duplicate_of is not None:
+        # Its change was in the tree when it was fetched
+        return
+    l_first = commit_identities.claim(i_report.identity, (
+        i_report.repo_uri, i_report.repo_name, i_report.sha,
+        i_report.nice_name), i_bump)
+    if l_first is not None:
+        logging.info('{} is the same change as {} {}'.format(
+            i_report.sha, l_first[1], l_first[2]))
+        i_report.make_duplicate(l_first)
+        return
+    for l_subreport in i_report.subreports:
+        claim_changes(l_subreport, (i_report.repo_uri, i_report.sha))
+
+###############################################################################
+# @brief Loads a chain of stored ranges, when its ranges are still the ones
+#        of their references: each one begins at the SHA the one before ended
+#        at, the first one at i_begin_sha
+#
+# @return (list of report dicts, SHA the chain ends at), or None
+###############################################################################
+def load_stored_chain(i_repo_uri, i_chain, i_begin_sha):
+    l_reports = []
+    l_sha = i_begin_sha
+    for l_begin, l_end in i_chain:
+        l_stored = report_store.load(i_repo_uri, l_begin, l_end)
+        # Ranges stored without their SHAs can't be told apart from the
+        # ones a branch has moved on from
+        if l_stored is None or not l_stored.get('end_sha') \
+                or l_stored.get('begin_sha') != l_sha:
+            return None
+        l_sha = l_stored['end_sha']
+        l_reports.extend(l_stored['reports'])
+    return l_reports, l_sha
+
+###############################################################################
+# @brief SHA of the commit a reference is at on the server. A mirror is only
+#        as new as its last fetch, a branch or a tag pushed since would still
+#        be at an old commit there
+#
+# @return The SHA, None when it can't be had
+###############################################################################
+def resolve_sha(i_repo, i_ref):
+    if commitcache.SHA_RE.match(i_ref):
+        return i_ref
+    try:
+        return i_repo.get_commit(i_ref).sha
+    except Exception as e:
+        logging.warning('Unable to get the SHA of {}: {}'.format(i_ref, e))
+        return None
+
+###############################################################################
+# @brief Gets the report tree of a release range, reusing the stored trees of
+#        earlier runs, and stores the result for later runs
+#
+# A stored chain reaching i_end_name is used as is. Otherwise the chain
+# ending at the newest stored tag that i_end_ref is ahead of is used, and
+# only the commits after that tag are walked. Stored ranges are only used
+# while their references are at the SHAs they were stored with, a branch
+# that moved on is walked on from where it was.
+#
+# Every call starts a new tree, the changes of earlier calls don't make
+# cross-references in it.
+#
+# @param i_repo_uri     : URI of the repo
+# @param i_begin_commit : Reference to the oldest commit, excluded
+# @param i_end_name     : Name of the newest commit the range is stored as
+# @param i_end_ref      : Reference to the newest commit, included
+# @param i_on_report    : Optional callable taking each top level report as
+#                         soon as it is done, see generate_commit_reports
+#
+# @return A list of CommitReport objects, as generate_commit_reports
+###############################################################################
+def generate_release_reports(i_repo_uri, i_begin_commit, i_end_name,
+                             i_end_ref, i_on_report=None):
+    global commit_identities
+    commit_identities = commitidentity.IdentityIndex()
+
+    l_reports = []
+    if i_on_report is None:
+        i_on_report = l_reports.append
+
+    l_begin_sha = None
+    l_end_sha = None
+    if report_store is not None:
+        l_repo = get_repo(i_repo_uri)
+        l_begin_sha = resolve_sha(l_repo, i_begin_commit)
+        l_end_sha = resolve_sha(l_repo, i_end_ref)
+
+    if l_begin_sha is None or l_end_sha is None:
+        if report_store is not None:
+            logging.warning('not using the report store for {}..{}'.format(
+                i_begin_commit, i_end_name))
+
+        def attach(i_report):
+            claim_changes(i_report)
+            i_on_report(i_report)
+
+        generate_commit_reports(i_repo_uri, i_begin_commit, i_end_ref, attach)
+        return l_reports
+
+    l_chains = report_store.chains(i_begin_commit)
+    if i_end_name in l_chains:
+        l_chain = load_stored_chain(i_repo_uri, l_chains[i_end_name],
+                                    l_begin_sha)
+        if l_chain is not None and l_chain[1] == l_end_sha:
+            logging.info('using stored reports of {}..{}'.format(
+                i_begin_commit, i_end_name))
+            callstats.count_cache('report store', True)
+            for l_report in l_chain[0]:
+                i_on_report(CommitReport.from_dict(l_report))
+            return l_reports
+
+    l_begin = l_begin_sha
+    l_stored = []
+    l_candidates = sorted(l_chains, key=natural_key, reverse=True)
+    for l_ref in l_candidates[:STORED_CANDIDATES]:
+        l_chain = load_stored_chain(i_repo_uri, l_chains[l_ref], l_begin_sha)
+        if l_chain is None:
+            continue
+        try:
+            l_compare = l_repo.compare(l_chain[1], l_end_sha)
+        except Exception as e:
+            logging.warning('Unable to compare {}..{}: {}'.format(
+                l_ref, i_end_ref, e))
+            continue
+        if l_compare.behind_by or not l_compare.ahead_by:
+            continue
+        logging.info('using stored reports of {}..{}'.format(
+            i_begin_commit, l_ref))
+        l_begin = l_chain[1]
+        l_stored = l_chain[0]
+        break
+    callstats.count_cache('report store', bool(l_stored))
+
+    l_errors = generate_errors
+    l_shas = set()
+    try:
+        l_writer = report_store.writer(i_repo_uri, i_begin_commit, i_end_name,
+                                       l_begin_sha, l_end_sha)
+    except (IOError, OSError) as e:
+        logging.warning('Unable to store reports of {}..{}: {}'.format(
+            i_begin_commit, i_end_name, e))
+        l_writer = None
+
+    def on_report(i_report):
+        if i_report.sha in l_shas:
+            return
+        l_shas.add(i_report.sha)
+        claim_changes(i_report)
+        if l_writer:
+            l_writer.add(i_report.to_dict())
+        i_on_report(i_report)
+
+    try:
+        for l_report in l_stored:
+            on_report(CommitReport.from_dict(l_report))
+        del l_stored
+        generate_commit_reports(i_repo_uri, l_begin, l_end_sha, on_report)
+    except:
+        if l_writer:
+            l_writer.discard()
+        raise
+
+    if l_writer is None:
+        pass
+    elif generate_errors != l_errors:
+        logging.warning('reports of {}..{} are incomplete, not storing them'
+                        .format(i_begin_commit, i_end_name))
+        l_writer.discard()
+    else:
+        l_writer.close()
+    return l_reports
+
+###############################################################################
+# @brief Renderers of the commit lists: the console, and the wiki and HTML
+#        files when they are written
+###############################################################################
+def report_renderers(i_wiki_file, i_html_file):
+    l_renderers = [reportrender.ConsoleRenderer(sys.stdout)]
+    if i_wiki_file:
+        l_renderers.append(reportrender.TextRenderer(i_wiki_file))
+    if i_html_file:
+        l_renderers.append(reportrender.HtmlRenderer(i_html_file,
+                                                     html_repo_url))
+    return l_renderers
+
+def write_wiki_defects_and_notes(i_wiki_file, i_stgDefects, i_notes):
+    if len(i_stgDefects):
+        i_wiki_file.write('\nFixes STGDefects:\n')
+        for ewmId in i_stgDefects:
+            link='[{}](https://jazz07.rchland.ibm.com:13443/jazz/web/projects/CSSD#action=com.ibm.team.workitem.viewWorkItem&id={})'.format(ewmId,ewmId)
+            u, summary, o = read_ewm_universalid_summary_owner(ewmId)
+            i_wiki_file.write('* %s:`%s`\n' % (link, summary[0:90]))
+
+        i_wiki_file.write('\n---')
+
+    if len(i_notes):
+        i_wiki_file.write('\nRelease Notes:\n')
+        for l_note in i_notes:
+            if l_note:
+                i_wiki_file.write('* %s\n' % (l_note))
+
 def update_release_file(filename, line):
     with open(filename, 'r+') as f:
         content = f.read()
@@ -995,9 +2081,13 @@ def parse_arguments(i_args):
         help='A reference to the earliest commit to get information for')
 
     l_parser.add_argument(
-        'latest_commit',
+        'latest_commit', nargs='+',
         help='A reference (branch name, HEAD, SHA, etc.) to the most ' \
-             +'recent commit to get information for')
+             +'recent commit to get information for. Several tags in ' \
+             +'order make a batch: each one is noted from the one before ' \
+             +'it, with its own wiki page, gsa taglist, updates and ' \
+             +'<html_file root>-<tag>.html, in one process fetching the ' \
+             +'commits of all the ranges up front')
 
     l_parser.add_argument(
         '--html_file',
@@ -1008,6 +2098,60 @@ def parse_arguments(i_args):
         '--wiki', dest='create_wiki', action='store_true',
         help='If set create release wiki page and update reference ' \
              +'links in various release pages')
+    l_parser.add_argument(
+        '--mirror-dir', dest='mirror_dir', default=None,
+        help='Directory of bare mirrors (git clone --mirror) laid out as ' \
+             +'<host>/<org>/<repo>.git. Ranges found there are read with ' \
+             +'git log instead of the GitHub compare API')
+    l_parser.add_argument(
+        '--cache-dir', dest='cache_dir', default=commitcache.DEFAULT_CACHE_DIR,
+        help='Directory of the commit metadata cache ' \
+             +'(default {})'.format(commitcache.DEFAULT_CACHE_DIR))
+    l_parser.add_argument(
+        '--cache-size', dest='cache_size', type=int,
+        default=commitcache.DEFAULT_MAX_MB,
+        help='Size bound of the commit metadata cache in MB')
+    l_parser.add_argument(
+        '--no-cache', dest='no_cache', action='store_true',
+        help='Don\'t read or write the commit metadata cache')
+    l_parser.add_argument(
+        '--pr-index', dest='pr_index', action='store_true',
+        help='Find the PRs of commits in a local index of merged PRs kept ' \
+             +'in the cache directory. Each run only fetches the PRs ' \
+             +'updated since the last one')
+    l_parser.add_argument(
+        '--pr-index-days', dest='pr_index_days', type=int,
+        default=prindex.DEFAULT_BACKFILL_DAYS,
+        help='How far back the first refresh of a repo\'s PR index goes')
+    l_parser.add_argument(
+        '--graphql', dest='graphql', action='store_true',
+        help='Fetch the PRs, PR bodies and comments of up to ' \
+             +'{} commits per GraphQL query '.format(GRAPHQL_BATCH) \
+             +'instead of several REST calls per commit')
+    l_parser.add_argument(
+        '-j', '--jobs', dest='jobs', type=int, default=1,
+        help='Number of bumped subrepos to expand and EWM work items to ' \
+             +'read concurrently (default 1, serial)')
+    l_parser.add_argument(
+        '--ewm-cache-ttl', dest='ewm_cache_ttl', type=int, default=0,
+        help='Keep the EWM work items read for this many minutes in the ' \
+             +'cache directory so later runs reuse them (default 0, off). ' \
+             +'Items are always read again before they are updated')
+    l_parser.add_argument(
+        '--cqcmd', dest='cqcmd', default=CQCMD_PATH,
+        help='ClearQuest cqcmd.pl used to look up the STGDefects of ' \
+             +'ClearQuest defects (default {}, '.format(CQCMD_PATH) \
+             +'fakes/cqcmd.pl works offline)')
+    l_parser.add_argument(
+        '--stream', dest='stream', action='store_true',
+        help='Write every commit to the console, wiki and HTML file as ' \
+             +'soon as it is done instead of when the whole range is, ' \
+             +'the defects and notes sections come last')
+    l_parser.add_argument(
+        '--no-report-store', dest='no_report_store', action='store_true',
+        help='Don\'t reuse or save the report trees kept in ' \
+             +'<release dir>/{}, '.format(reportstore.STORE_DIR_NAME) \
+             +'walk the whole range')
     l_parser.add_argument(
         '-D', dest='dir', default=None,
         help='set a dirctory path to write release files ')
@@ -1024,16 +2168,141 @@ def parse_arguments(i_args):
         '-E','--ewm', dest='update_ewm', action='store_true',
         help='If set this script will update priority justifcation ' \
              +'with tag name in ewm ')
+    l_parser.add_argument(
+        '--ewm-workers', dest='ewm_workers', type=int, default=4,
+        help='Number of EWM work items updated at the same time by --ewm ' \
+             +'(default 4)')
+    l_parser.add_argument(
+        '--ewm-rate', dest='ewm_rate', type=float, default=0,
+        help='Most EWM calls per second made by the --ewm updates ' \
+             +'(default 0, no limit)')
+    l_parser.add_argument(
+        '--ewm-retries', dest='ewm_retries', type=int, default=3,
+        help='Times a failing EWM work item update is retried, waiting ' \
+             +'{}s, then twice as long each time (default 3)'.format(EWM_BACKOFF))
+    l_parser.add_argument(
+        '--profile', dest='profile', nargs='?', const='crn.prof',
+        default=None,
+        help='Profile the run: write the cProfile statistics to the given ' \
+             +'file (default crn.prof, read with python -m pstats) and the ' \
+             +'wall clock time of each phase (compare walk, enrichment, ' \
+             +'subrepos, CQ/EWM, rendering, git) to stderr and <file>.txt')
+    l_parser.add_argument(
+        '--stats', dest='stats', nargs='?', const='-', default=None,
+        help='At exit, report the calls made to GitHub, ClearQuest and EWM ' \
+             +'per endpoint (count, bytes, errors, latency percentiles) and ' \
+             +'the cache hit rates, on stderr or as JSON to the given file')
+    l_parser.add_argument(
+        '--export-bundle', dest='export_bundle', default=None,
+        help='Write everything the run fetches (compares, commits, PRs and ' \
+             +'their comments, cqcmd.pl output, EWM work items) into this ' \
+             +'zip file at exit, for --from-bundle. The caches, the ' \
+             +'report store, the PR index and the mirrors aren\'t used, so ' \
+             +'the run fetches all of it')
+    l_parser.add_argument(
+        '--from-bundle', dest='from_bundle', default=None,
+        help='Answer every GitHub, ClearQuest and EWM call from a bundle of ' \
+             +'--export-bundle instead, without network. Give it the range ' \
+             +'of the bundle, the outputs (--wiki, --html_file, --gsa) can ' \
+             +'differ')
 
-    return l_parser.parse_args(i_args)
+    l_args = l_parser.parse_args(i_args)
+    if l_args.export_bundle and l_args.from_bundle:
+        l_parser.error('--export-bundle and --from-bundle exclude each other')
+    if l_args.from_bundle and (l_args.update_ewm or (l_args.update_cq
+                                                     and not l_args.dry_run)):
+        l_parser.error('--from-bundle makes no calls, it can\'t update ' \
+                       +'ClearQuest (-u without --dry-run) or EWM (-E)')
+    return l_args
 
 
 
+###############################################################################
+# @brief Sets up the caches, worker pools and tools of the run the arguments
+#        ask for
+###############################################################################
+def configure(i_args):
+    global mirror_dir
+    mirror_dir = i_args.mirror_dir
+
+    global graphql_enrichment
+    graphql_enrichment = i_args.graphql
+
+    global pr_index
+    if i_args.pr_index:
+        pr_index = prindex.PullIndex(i_args.cache_dir, i_args.pr_index_days)
+
+    global commit_cache
+    if not i_args.no_cache:
+        commit_cache = commitcache.CommitCache(i_args.cache_dir,
+                                               i_args.cache_size * 1024 * 1024)
+
+    ghclient.pool_size = max(ghclient.pool_size, i_args.jobs)
+
+    global subrepo_executor
+    if i_args.jobs > 1:
+        subrepo_executor = ThreadPoolExecutor(max_workers=i_args.jobs)
+
+    global cqcmd
+    cqcmd = i_args.cqcmd
+
+    global ewm_jobs, ewm_cache_ttl, ewm_cache_file, ewm_rate, ewm_retries
+    ewm_rate = i_args.ewm_rate
+    ewm_retries = i_args.ewm_retries
+    ewm_jobs = i_args.jobs
+    ewm_cache_ttl = i_args.ewm_cache_ttl * 60
+    ewm_cache_file = os.path.join(i_args.cache_dir, 'ewm_workitems.json')
+    load_ewm_cache()
+
+
+###############################################################################
+# @brief Writes the --stats report, with the hit counts of the caches
+###############################################################################
+def report_stats(i_file):
+    if commit_cache is not None:
+        callstats.set_cache('commits', commit_cache.hits, commit_cache.misses)
+    if pr_index is not None:
+        callstats.set_cache('pr index', pr_index.hits, pr_index.misses)
+    callstats.report(i_file)
+
+
 def main(i_args):
     # Parse the arguments
     l_args = parse_arguments(i_args)
     logging.basicConfig(level=l_args.loglevel)
 
+    if l_args.stats:
+        callstats.enable()
+        atexit.register(report_stats, l_args.stats)
+    if l_args.profile:
+        profiling.start()
+        atexit.register(profiling.report, l_args.profile)
+
+    global bundle_writer, bundle_reader
+    if l_args.export_bundle or l_args.from_bundle:
+        # A bundle run only uses what it fetches itself, the one that reads
+        # the bundle then asks for exactly what is in it
+        l_args.no_cache = True
+        l_args.no_report_store = True
+        l_args.pr_index = False
+        l_args.mirror_dir = None
+        l_args.ewm_cache_ttl = 0
+    if l_args.export_bundle:
+        bundle_writer = runbundle.BundleWriter(
+            l_args.export_bundle, i_args,
+            [l_args.earliest_commit] + l_args.latest_commit)
+        bundle_writer.install()
+        atexit.register(bundle_writer.save)
+    if l_args.from_bundle:
+        bundle_reader = runbundle.BundleReader(l_args.from_bundle)
+        bundle_reader.install()
+        atexit.register(bundle_reader.close)
+        l_range = [l_args.earliest_commit] + l_args.latest_commit
+        if bundle_reader.info.get('range') != l_range:
+            logging.warning('{} is a bundle of {}, not {}'.format(
+                l_args.from_bundle, ' '.join(bundle_reader.info.get('range')
+                                             or []), ' '.join(l_range)))
+
     if l_args.dry_run:
         if logging.DEBUG != logging.root.level:
             logging.getLogger().setLevel(level=logging.INFO)
@@ -1045,52 +2314,193 @@ def main(i_args):
 #    logging.error('This is an error message')
 #    logging.critical('This is a critical message')
 
-    l_latest_commit = l_args.latest_commit
+    configure(l_args)
 
+    l_tags = [l_args.earliest_commit] + l_args.latest_commit
+    l_latest_commits = list(l_args.latest_commit)
     if l_args.gsa_tag_info:
         my_repo = get_repo(l_args.tag_repo_uri)
-        l_commit = my_repo.get_commit(l_args.latest_commit)
-        # convert to sha value, since tag hasn't been released
-        l_latest_commit = l_commit.commit.sha
+        # convert to sha values, since the tags haven't been released
+        l_latest_commits = [my_repo.get_commit(l_tag).commit.sha
+                            for l_tag in l_latest_commits]
+
+    l_batch = len(l_latest_commits) > 1
+    if l_batch:
+        # The ranges are resolved and their commits fetched together, the
+        # tags are then noted one after the other in this warm process
+        prefetch_batch(l_args.repo_uri,
+                       list(zip(l_tags[:-1], l_latest_commits)), l_args.jobs)
+
+    l_previous_totals = None
+    l_gsa_tag_info = l_args.gsa_tag_info
+    for l_earliest, l_latest, l_latest_commit in zip(
+            l_tags, l_tags[1:], l_latest_commits):
+        l_range_args = copy.copy(l_args)
+        l_range_args.earliest_commit = l_earliest
+        l_range_args.latest_commit = l_latest
+        l_range_args.gsa_tag_info = l_gsa_tag_info
+        if l_batch and l_args.html_file:
+            l_range_args.html_file = batch_file_name(l_args.html_file,
+                                                     l_latest)
+        l_previous_totals = release_notes(l_range_args, l_latest_commit,
+                                          l_previous_totals)
+        # The taglist of the next tag adds the defects of this range
+        # the way --gsa <earliest> would
+        l_gsa_tag_info = l_args.gsa_tag_info and l_earliest
 
-    
-    print(l_args.gsa_tag_info)
 
-#   exit()
+###############################################################################
+# @brief Names the output file of one tag of a batch, <root>-<tag><ext>
+###############################################################################
+def batch_file_name(i_file, i_tag):
+    l_root, l_ext = os.path.splitext(i_file)
+    return '{}-{}{}'.format(l_root, i_tag, l_ext)
 
-    # Generate the commit reports
-    l_reports = generate_commit_reports(
-        l_args.repo_uri,
-        l_args.earliest_commit, 
-        l_latest_commit)
 
-    tag_name = None
+###############################################################################
+# @brief Directory the release files and the report store of a range go in:
+#        -D, else the fwNNNN release of latest_commit, else the current one
+#
+# @return The directory, None when it doesn't exist
+###############################################################################
+def release_directory(i_args):
     release_dir =  os.getcwd()
-    l_match = re.search('fw(\d\d\d\d).',l_args.latest_commit)
+    l_match = re.search('fw(\d\d\d\d).',i_args.latest_commit)
     if (l_match):
         release_dir = l_match.group(1)
-        if l_args.dir:
-            release_dir = l_args.dir
-        if not os.path.exists(release_dir):
-            logging.error("directory {} doesn't exist. Please create".format(release_dir))
-            exit()
-
-    if l_args.dir:
-        release_dir = l_args.dir
-        if not os.path.exists(release_dir):
-            logging.error("directory {} doesn't exist. Please create".format(release_dir))
-            exit()
-
-    l_issues = []
-    l_notes = []
-    l_stgDefects = []
-    for l_report in l_reports:
-        l_issues.extend(l_report.get_all_closed_issues())
-        l_notes.extend(l_report.get_all_notes())
-        l_stgDefects.extend(l_report.get_all_stgDefects())
+    if i_args.dir:
+        release_dir = i_args.dir
+    if not os.path.exists(release_dir):
+        logging.error("directory {} doesn't exist. Please create".format(release_dir))
+        return None
+    return release_dir
+
+
+###############################################################################
+# @brief Does the fetching of the crn.py run of a new tag ahead of it, for
+#        tagwatch.py. The report tree of the range goes into the report
+#        store, its commits into the commit cache and, with --ewm-cache-ttl,
+#        its work items into the EWM cache. The run of the tag reads them
+#        back instead of fetching them
+#
+# @param i_args          : crn.py arguments of the range, configure has set
+#                          them up
+# @param i_latest_commit : Reference to the newest commit of the range
+#
+# @return The ReportTotals of the range, None when there is no release
+#         directory for it
+###############################################################################
+def prewarm_release(i_args, i_latest_commit):
+    global report_store
+    release_dir = release_directory(i_args)
+    if release_dir is None:
+        return None
+    report_store = None
+    if not i_args.no_report_store:
+        report_store = reportstore.ReportStore(release_dir)
+
+    # What earlier prewarms of this process left behind is only used as
+    # long as a new process would use it
+    if pr_index is not None:
+        pr_index.expire()
+    with ewm_workitems_lock:
+        ewm_workitems.clear()
+    load_ewm_cache()
+
+    l_totals = ReportTotals()
+    generate_release_reports(i_args.repo_uri, i_args.earliest_commit,
+                             i_args.latest_commit, i_latest_commit,
+                             l_totals.add)
+    if ewm_cache_ttl and l_totals.stgDefects:
+        with profiling.span('cq/ewm', 'read'):
+            prefetch_ewm_workitems(sorted(l_totals.stgDefects))
+    return l_totals
+
 
+###############################################################################
+# @brief Writes the release notes of one range and does its updates
+#
+# @param i_args            : The arguments, earliest_commit and latest_commit
+#                            being the range
+# @param i_latest_commit   : Reference to the newest commit of the range
+# @param i_previous_totals : ReportTotals of the range ending at
+#                            earliest_commit when it is known, --gsa then
+#                            doesn't generate it again
+#
+# @return The ReportTotals of the range
+###############################################################################
+def release_notes(i_args, i_latest_commit, i_previous_totals=None):
+    l_latest_commit = i_latest_commit
+
+    print(i_args.gsa_tag_info)
 
-    l_issues = list(dict.fromkeys(l_issues))
+#   exit()
+
+    tag_name = None
+    release_dir = release_directory(i_args)
+    if release_dir is None:
+        exit()
+
+    global report_store
+    if not i_args.no_report_store:
+        report_store = reportstore.ReportStore(release_dir)
+
+    l_totals = ReportTotals()
+    collect = l_totals.add
+
+    release_wiki = release_dir + "/" + i_args.latest_commit + ".md"
+    l_wiki_file = None
+    l_html_file = None
+    if i_args.stream:
+        # Every commit is written out as soon as its subrepos are done, the
+        # defects and notes sections follow at the end
+        print('## %s' %  (i_args.latest_commit))
+        print('from %s to %s' % (i_args.earliest_commit,i_args. latest_commit))
+        print('Commits...')
+        if i_args.create_wiki:
+            print('Writing to Wiki file...{}'.format(release_wiki))
+            l_wiki_file = open(release_wiki, 'w+')
+            header='## %s \n' % (i_args.latest_commit)
+            header += "from %s to %s\n" % (i_args.earliest_commit,i_args. latest_commit)
+            l_wiki_file.write(header)
+            l_wiki_file.write("\n```\n")
+            l_wiki_file.write('Commits...\n')
+        if i_args.html_file:
+            print('Writing to HTML file...')
+            l_html_file = open(i_args.html_file, 'w+')
+            l_html_file.write('<html><body>\n')
+
+        l_renderers = report_renderers(l_wiki_file, l_html_file)
+
+        def stream_report(i_report):
+            with profiling.span('render'):
+                reportrender.render_reports([i_report], l_renderers)
+            sys.stdout.flush()
+            if l_wiki_file:
+                l_wiki_file.flush()
+            collect(i_report)
+
+        l_reports = generate_release_reports(
+            i_args.repo_uri,
+            i_args.earliest_commit,
+            i_args.latest_commit,
+            l_latest_commit,
+            stream_report)
+    else:
+        # Generate the commit reports
+        l_reports = generate_release_reports(
+            i_args.repo_uri,
+            i_args.earliest_commit, 
+            i_args.latest_commit,
+            l_latest_commit)
+        for l_report in l_reports:
+            collect(l_report)
+
+
+    logging.info('{} commits, {} insertions, {} deletions'.format(
+        l_totals.commits, l_totals.insertions, l_totals.deletions))
+
+    l_issues = l_totals.closed_issues
     print(l_issues)
 
 
@@ -1100,11 +2510,9 @@ def main(i_args):
         cq_list = l_issues
 
 
-    # list(dict.fromkeys() removes duplicates. 
-    l_notes = list(dict.fromkeys(l_notes))
+    l_notes = l_totals.notes
 
-    l_stgDefects =  list(dict.fromkeys(l_stgDefects))
-    l_stgDefects.sort()
+    l_stgDefects = sorted(l_totals.stgDefects)
 
     print(l_stgDefects)
 
@@ -1114,37 +2522,40 @@ def main(i_args):
         #convert CQ to EWM ids but only the ones we don't have already. 
         ewm_uniId_list = []
         if len(l_stgDefects):
+            with profiling.span('cq/ewm', 'read'):
+                prefetch_ewm_workitems(l_stgDefects)
             for ewmId in l_stgDefects:
                 uniId, s, o = read_ewm_universalid_summary_owner(ewmId)
                 ewm_uniId_list.append(uniId)
 
         whats_left_list = subtract_lists(cq_list,ewm_uniId_list)
         if len(whats_left_list):
+            print("Processing cq_to_ewm:", whats_left_list)
+            with profiling.span('cq/ewm', 'resolve'):
+                l_cq_to_ewm = cq_to_ewm_bulk(whats_left_list)
             for cq in whats_left_list:
-                print("Processing cq_to_ewm:",cq)
-                ewmId = cq_to_ewm(cq)
+                ewmId = l_cq_to_ewm.get(cq)
                 if ewmId is None:
                     continue
                 print("adding to stgDefects list: ",ewmId)
                 l_stgDefects.append(ewmId)
 
             #get rid of duplictates and sort list
-            l_stgDefects =  list(dict.fromkeys(l_stgDefects))
-            l_stgDefects.sort()
+            l_stgDefects = sorted(set(l_stgDefects))
             print(l_stgDefects)
 
 
  
 
 
-    if l_args.gsa_tag_info:
+    if i_args.gsa_tag_info:
 
 
         prev_txtfile = ''
-        if l_args.dry_run:
-            p_filename = '%s.txt' % (l_args.earliest_commit)
+        if i_args.dry_run:
+            p_filename = '%s.txt' % (i_args.earliest_commit)
         else:
-            p_filename = '/gsa/ausgsa/projects/b/bmctaglists/%s.txt' % (l_args.earliest_commit) 
+            p_filename = '/gsa/ausgsa/projects/b/bmctaglists/%s.txt' % (i_args.earliest_commit) 
 
         try: 
             with open(p_filename, 'r') as f:
@@ -1152,18 +2563,20 @@ def main(i_args):
                 print(prev_txtfile)
 
 
-                l_prev_stgDefects = []
-                l_prev_reports = generate_commit_reports(
-                    l_args.repo_uri,
-                    l_args.gsa_tag_info,
-                    l_args.earliest_commit)
+                l_prev_totals = i_previous_totals
+                if l_prev_totals is None:
+                    l_prev_totals = ReportTotals()
+                    generate_release_reports(
+                        i_args.repo_uri,
+                        i_args.gsa_tag_info,
+                        i_args.earliest_commit,
+                        i_args.earliest_commit,
+                        l_prev_totals.add)
 
-                for l_prev_report in l_prev_reports:
-                    l_prev_stgDefects.extend(l_prev_report.get_all_stgDefects())
-                
-                l_prev_stgDefects =  list(dict.fromkeys(l_prev_stgDefects))
-                l_prev_stgDefects.sort()
+                l_prev_stgDefects = sorted(l_prev_totals.stgDefects)
 
+                with profiling.span('cq/ewm', 'read'):
+                    prefetch_ewm_workitems(l_prev_stgDefects)
                 for prev_ewmId in l_prev_stgDefects:
                     universalid, summary, owner = read_ewm_universalid_summary_owner(prev_ewmId)
                     print(universalid)
@@ -1172,8 +2585,7 @@ def main(i_args):
                     print("adding previous defect to stgDefects list: ",prev_ewmId)
                     l_stgDefects.append(prev_ewmId)
                 #get rid of duplictates and sort list
-                l_stgDefects =  list(dict.fromkeys(l_stgDefects))
-                l_stgDefects.sort()
+                l_stgDefects = sorted(set(l_stgDefects))
                 print("gsa defect list: ", l_stgDefects)
         except Exception as e:
             exc_type, exc_obj, exc_tb = sys.exc_info()
@@ -1183,10 +2595,11 @@ def main(i_args):
 
         #process STGDefects 
         if len(l_stgDefects):
-            if l_args.dry_run:
-                filename = '%s.txt' % (l_args.latest_commit)
+            prefetch_ewm_workitems(l_stgDefects)
+            if i_args.dry_run:
+                filename = '%s.txt' % (i_args.latest_commit)
             else:
-                filename = '/gsa/ausgsa/projects/b/bmctaglists/%s.txt' % (l_args.latest_commit) 
+                filename = '/gsa/ausgsa/projects/b/bmctaglists/%s.txt' % (i_args.latest_commit) 
             with open(filename, 'w+') as txtfile:
                 tmpStr = ""
                 for ewmId in l_stgDefects:
@@ -1198,18 +2611,30 @@ def main(i_args):
             print("\nWriting:", filename)
 
 
-    if l_args.update_ewm:
+    if i_args.update_cq:
+        l_cq_ids = [cq for cq in cq_list if CQ_ID_RE.match(cq)]
+        if len(l_cq_ids):
+            with profiling.span('cq/ewm', 'update'):
+                update_cq_bulk(l_cq_ids, i_args.latest_commit,
+                               i_args.dry_run)
+
+    if i_args.update_ewm:
         #process STGDefects 
         if len(l_stgDefects):
-            for ewmId in l_stgDefects:
-                print("updating ewmId:%s with tag info" % (ewmId))
-                update_ewm_priority_justification_tag_info(ewmId, l_args.latest_commit)
-                update_ewm_tags_field(ewmId)
+            print("updating ewmIds:%s with tag info" % (l_stgDefects))
+            with profiling.span('cq/ewm', 'update'):
+                update_ewm_workitems(l_stgDefects, i_args.latest_commit,
+                                     i_args.ewm_workers)
+
 
+    # Every defect listed below needs its summary
+    with profiling.span('cq/ewm', 'read'):
+        prefetch_ewm_workitems(l_stgDefects)
 
     # Print commit information to the console
-    print('## %s' %  (l_args.latest_commit))
-    print('from %s to %s' % (l_args.earliest_commit,l_args. latest_commit))
+    if not i_args.stream:
+        print('## %s' %  (i_args.latest_commit))
+        print('from %s to %s' % (i_args.earliest_commit,i_args. latest_commit))
 
     if len(l_stgDefects):
         print('Fixes STGDefects:')
@@ -1227,50 +2652,42 @@ def main(i_args):
             if l_note:
                 print('* %s' % (l_note))
 
-    print('Commits...')
-    for l_report in l_reports:
-        print(l_report.to_cl_string())
-
-  
-    # Write to the wiki file if the user set the flag
-    if l_args.create_wiki:
-        release_wiki = release_dir + "/" + l_args.latest_commit + ".md"
-        print('Writing to Wiki file...{}'.format(release_wiki))
-        with open(release_wiki, 'w+') as l_wiki_file:
-            header='## %s \n' % (l_args.latest_commit)
-            header += "from %s to %s\n" % (l_args.earliest_commit,l_args. latest_commit)
+    if not i_args.stream:
+        # The console, wiki and HTML commit lists are written in one walk
+        if i_args.create_wiki:
+            print('Writing to Wiki file...{}'.format(release_wiki))
+            l_wiki_file = open(release_wiki, 'w+')
+            header='## %s \n' % (i_args.latest_commit)
+            header += "from %s to %s\n" % (i_args.earliest_commit,i_args. latest_commit)
             l_wiki_file.write(header)
 
-            if len(l_stgDefects):
-                l_wiki_file.write('\nFixes STGDefects:\n')
-                for ewmId in l_stgDefects:
-                    link='[{}](https://jazz07.rchland.ibm.com:13443/jazz/web/projects/CSSD#action=com.ibm.team.workitem.viewWorkItem&id={})'.format(ewmId,ewmId)
-                    u, summary, o = read_ewm_universalid_summary_owner(ewmId)
-                    l_wiki_file.write('* %s:`%s`\n' % (link, summary[0:90]))
+            write_wiki_defects_and_notes(l_wiki_file, l_stgDefects, l_notes)
 
-                l_wiki_file.write('\n---')
-
-            if len(l_notes):
-                l_wiki_file.write('\nRelease Notes:\n')
-                for l_note in l_notes:
-                    if l_note:
-                        l_wiki_file.write('* %s\n' % (l_note))
-            
             l_wiki_file.write("\n```\n")
             l_wiki_file.write('Commits...\n')
+        if i_args.html_file:
+            print('Writing to HTML file...')
+            l_html_file = open(i_args.html_file, 'w+')
+            l_html_file.write('<html><body>\n')
 
+        print('Commits...')
+        with profiling.span('render'):
+            reportrender.render_reports(
+                l_reports, report_renderers(l_wiki_file, l_html_file))
 
-            for l_report in l_reports:
-                #l_wiki_file.write('%s\n' % l_report.to_string().encode("utf-8"))
-                l_wiki_file.write('%s\n' % l_report.to_string())
-
-            l_wiki_file.write("```\n")
-
-        l_match = re.match(r'(fw[0-9].+)-[0-9].*', l_args.latest_commit)
+    # Write to the wiki file if the user set the flag
+    if i_args.create_wiki:
+        l_wiki_file.write("```\n")
+        if i_args.stream:
+            write_wiki_defects_and_notes(l_wiki_file, l_stgDefects, l_notes)
+        l_wiki_file.close()
+
+    if i_args.create_wiki:
+        l_match = re.match(r'(fw[0-9].+)-[0-9].*', i_args.latest_commit)
         if l_match:
             release_link_file = l_match.group(1) + ".md"
             if os.path.exists(release_link_file):
-                tag = l_args.latest_commit
+                tag = i_args.latest_commit
                 c_date = datetime.now().strftime("%Y-%m-%d")
                 line = "*   [{}](https://github.ibm.com/openbmc/release-notes/wiki/{})     {}".format(tag,tag,c_date)
                 update_release_file(release_link_file, line)
@@ -1289,12 +2706,7 @@ def main(i_args):
 
             
     # Write to the HTML file if the user set the flag
-    if l_args.html_file:
-        print('Writing to HTML file...')
-        l_html_file = open(l_args.html_file, 'w+')
-        l_html_file.write('<html><body>\n')
-        for l_report in l_reports:
-            l_html_file.write(l_report.to_html())
+    if i_args.html_file:
 #        l_html_file.write('<p>' + str(l_total_insertions) \
 #                          + ' insertions and ' + str(l_total_deletions) \
 #                          + ' deletions</p>')
@@ -1318,5 +2730,7 @@ def main(i_args):
         l_html_file.write('</body></html>')
         l_html_file.close()
 
+    return l_totals
+
 if __name__ == '__main__':
     main(sys.argv[1:])
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file cqcmd.pl
+# @brief Offline stand-in for the ClearQuest cqcmd.pl used by crn.py
+#
+# Answers the SQL queries crn.py sends from a JSON file named by
+# CQCMD_FAKE_DATA:
+#   {
+#     "ExternalResource": [
+#       {"resource_type": "STGDefect", "resource_name": "313544",
+#        "system_type": "EWM", "system_name": "https://...",
+#        "parentdefect": "AIXOS13474966",
+#        "parentdefect.universal_id": "SW552204",
+#        "parentrequirement.universal_id": ""}
+#     ],
+#     "defect": {
+#       "SW552204": {"headline": "...", "Ownerinfo": "...", "keywords": "..."}
+#     }
+#   }
+#
+# Rows are printed the way cqcmd.pl prints them, fields separated and ended
+# by '|'. -action modify -univid <id> writes the fields given into the defect
+# and the JSON file, Note_Entry is appended to Notes_Log. When
+# CQCMD_FAKE_LOG is set every invocation is appended to it, one line of
+# arguments each, so callers can count the processes they spawn.
+#
+# With CQCMD_FAKE_REPLAY set to the cqcmd.json of a bundle (see runbundle.py,
+# bench/crn_bench.py extracts it), [{"args": [...], "output": "..."}], the
+# recorded output of the same arguments (from -action on) is printed instead,
+# and an output of null fails the way the recorded call did.
+#
+# Use it with crn.py --cqcmd fakes/cqcmd.pl.
+###############################################################################
+
+import json
+import os
+import re
+import sys
+
+SQL_RE = re.compile(r'select\s+(.+?)\s+from\s+(\w+)(?:\s+where\s+(.*))?$',
+                    re.I | re.S)
+VALUE_RE = re.compile(r"'([^']*)'")
+
+
+def get_option(i_args, i_name):
+    if i_name in i_args:
+        return i_args[i_args.index(i_name) + 1]
+    return None
+
+
+def parse_fields(i_fields):
+    l_fields = {}
+    for l_field in i_fields.split('~~'):
+        l_name, l_sep, l_value = l_field.partition('::')
+        l_fields[l_name.strip()] = l_value
+    return l_fields
+
+
+def get_column(i_row, i_column):
+    for l_name, l_value in i_row.items():
+        if l_name.lower() == i_column.lower():
+            return l_value
+    return ''
+
+
+###############################################################################
+# @brief Runs a query, only the shapes crn.py sends are understood: a column
+#        list, one table and a where clause whose quoted values are the ids
+#        asked for
+###############################################################################
+def query(i_data, i_sql):
+    l_match = SQL_RE.match(i_sql.strip())
+    if not l_match:
+        sys.stderr.write('cqcmd.pl: unsupported query: {}\n'.format(i_sql))
+        return 1
+    l_columns = [l_column.strip() for l_column in l_match.group(1).split(',')]
+    l_table = l_match.group(2)
+    l_ids = set(VALUE_RE.findall(l_match.group(3) or ''))
+
+    if l_table.lower() == 'externalresource':
+        l_rows = [l_row for l_row in i_data.get('ExternalResource', [])
+                  if get_column(l_row, 'parentdefect.universal_id') in l_ids
+                  or get_column(l_row, 'parentrequirement.universal_id')
+                  in l_ids]
+    elif l_table.lower() == 'defect':
+        l_rows = []
+        for l_id, l_row in sorted(i_data.get('defect', {}).items()):
+            if l_id in l_ids:
+                l_row = dict(l_row)
+                l_row.setdefault('universal_id', l_id)
+                l_rows.append(l_row)
+    else:
+        sys.stderr.write('cqcmd.pl: unknown table {}\n'.format(l_table))
+        return 1
+
+    for l_row in l_rows:
+        sys.stdout.write(''.join(get_column(l_row, l_column) + '|'
+                                 for l_column in l_columns) + '\n')
+    return 0
+
+
+def modify(i_data, i_data_file, i_univid, i_fields):
+    l_defect = i_data.setdefault('defect', {}).get(i_univid)
+    if l_defect is None:
+        sys.stderr.write('cqcmd.pl: no defect {}\n'.format(i_univid))
+        return 1
+    for l_name, l_value in i_fields.items():
+        if l_name == 'force_commit':
+            continue
+        if l_name == 'Note_Entry':
+            l_notes = l_defect.get('Notes_Log', '')
+            l_defect['Notes_Log'] = (l_notes + '\n' if l_notes else '') \
+                + l_value
+        else:
+            # Field names are case insensitive, keep the one in the file
+            for l_key in l_defect:
+                if l_key.lower() == l_name.lower():
+                    l_name = l_key
+            l_defect[l_name] = l_value
+    with open(i_data_file, 'w') as l_file:
+        json.dump(i_data, l_file, indent=1, sort_keys=True)
+    sys.stdout.write('Modified {}\n'.format(i_univid))
+    return 0
+
+
+def action_args(i_args):
+    if '-action' in i_args:
+        return i_args[i_args.index('-action'):]
+    return i_args
+
+
+def replay(i_replay_file, i_args):
+    i_args = action_args(i_args)
+    with open(i_replay_file) as l_file:
+        l_calls = json.load(l_file)
+    for l_call in l_calls:
+        if action_args(l_call['args']) == i_args:
+            if l_call['output'] is None:
+                sys.stderr.write('cqcmd.pl: recorded call failed\n')
+                return 1
+            sys.stdout.write(l_call['output'])
+            return 0
+    sys.stderr.write('cqcmd.pl: call not recorded: {}\n'.format(i_args))
+    return 1
+
+
+def main(i_args):
+    l_log = os.environ.get('CQCMD_FAKE_LOG')
+    if l_log:
+        with open(l_log, 'a') as l_file:
+            l_file.write(json.dumps(i_args) + '\n')
+
+    l_replay_file = os.environ.get('CQCMD_FAKE_REPLAY')
+    if l_replay_file:
+        return replay(l_replay_file, i_args)
+
+    l_data_file = os.environ['CQCMD_FAKE_DATA']
+    with open(l_data_file) as l_file:
+        l_data = json.load(l_file)
+
+    l_action = get_option(i_args, '-action')
+    l_fields = parse_fields(get_option(i_args, '-fields') or '')
+    if l_action == 'query':
+        return query(l_data, l_fields.get('sql', ''))
+    if l_action == 'modify':
+        return modify(l_data, l_data_file, get_option(i_args, '-univid'),
+                      l_fields)
+
+    sys.stderr.write('cqcmd.pl: unsupported action {}\n'.format(l_action))
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
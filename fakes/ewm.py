@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file ewm
+# @brief Offline stand-in for the ewm module crn.py reads and updates EWM
+#        work items with
+#
+# Work items come from a JSON file named by EWM_FAKE_DATA, the ewm.json of a
+# bundle (see runbundle.py, bench/crn_bench.py extracts it):
+#   {
+#     "display": {
+#       "313544": {"Universal ID": "SW552204", "Summary": "...",
+#                  "Owned By": "...", "Tags": "", "Priority Justification": ""},
+#       "313545": {"error": "text of the exception display raised"}
+#     }
+#   }
+#
+# display of an id that isn't in the file raises LookupError. modify changes
+# the work item in memory only, so replays always start from the same data.
+#
+# Use it by putting fakes/ first in PYTHONPATH.
+###############################################################################
+
+import copy
+import json
+import os
+import threading
+
+_lock = threading.Lock()
+_workitems = None
+
+
+def workitems():
+    global _workitems
+    with _lock:
+        if _workitems is None:
+            _workitems = dict()
+            l_data_file = os.environ.get('EWM_FAKE_DATA')
+            if l_data_file:
+                with open(l_data_file) as l_file:
+                    _workitems = json.load(l_file).get('display', {})
+        return _workitems
+
+
+class Ewm(object):
+    def display(self, i_id):
+        l_item = workitems().get(str(i_id))
+        if l_item is None:
+            raise LookupError('no work item {}'.format(i_id))
+        if 'error' in l_item and len(l_item) == 1:
+            raise Exception(l_item['error'])
+        with _lock:
+            return copy.deepcopy(l_item)
+
+    def modify(self, id=None, attributes=None):
+        l_item = workitems().get(str(id))
+        if l_item is None:
+            raise LookupError('no work item {}'.format(id))
+        l_name, l_value = attributes
+        with _lock:
+            l_item[l_name.rstrip(':')] = l_value
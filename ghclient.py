@@ -0,0 +1,421 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file ghclient
+# @brief Process wide registry of GitHub clients and repo handles shared by
+#        crn.py, ab.py and commitTracker.py
+#
+# There is one pooled client per host, so TLS sessions are kept across
+# calls, and every repo is looked up once per process. Threads asking for
+# a repo that is already being looked up wait for that lookup instead of
+# sending their own.
+#
+# All requests of a host, PyGithub's included, go through one session whose
+# transport adapter schedules them over the host's token pool, see
+# ratelimit.py. The pool is <token name>_pool in config.py, e.g.
+# py_ibm_token_pool = ['...', '...'], or else the single token.
+###############################################################################
+
+import logging
+import threading
+
+import requests
+import github.Commit
+import github.Requester
+from github import Github
+
+import callstats
+import config
+import gitmirror
+import ratelimit
+
+# host : (API base URL, name of the token in config.py)
+HOSTS = {
+    'github.ibm.com': ('https://github.ibm.com/api/v3', 'py_ibm_token'),
+    'github.com': ('https://api.github.com', 'py_token'),
+}
+
+# Network location of the API : host
+API_NETLOCS = {
+    'github.ibm.com': 'github.ibm.com',
+    'api.github.com': 'github.com',
+}
+
+GRAPHQL_URLS = {
+    'github.ibm.com': 'https://github.ibm.com/api/graphql',
+    'github.com': 'https://api.github.com/graphql',
+}
+
+# Connections kept open per host, raise it before the first call when more
+# threads than this talk to one host
+pool_size = 10
+
+# Commits per page of the compare and commit list calls, the API maximum
+PAGE_SIZE = 100
+# Pages fetched at the same time by compare_commits
+page_workers = 4
+
+_lock = threading.Lock()
+_clients = {}
+_sessions = {}
+_pools = {}
+_repos = {}
+_lookups = {}
+
+
+def get_token(i_host):
+    return getattr(config, HOSTS[i_host][1])
+
+
+def get_tokens(i_host):
+    l_tokens = getattr(config, HOSTS[i_host][1] + '_pool', None)
+    if l_tokens:
+        return list(l_tokens)
+    return [get_token(i_host)]
+
+
+def get_pool(i_host):
+    with _lock:
+        l_pool = _pools.get(i_host)
+        if l_pool is None:
+            l_pool = _pools[i_host] = ratelimit.TokenPool(i_host,
+                                                          get_tokens(i_host))
+        return l_pool
+
+
+_base_connection = getattr(github.Requester, 'HTTPSRequestsConnectionClass',
+                           None)
+if _base_connection is not None:
+    ###########################################################################
+    # @class ScheduledConnection
+    # @brief PyGithub connection sending through the scheduled session of
+    #        its host
+    ###########################################################################
+    class ScheduledConnection(_base_connection):
+        def __init__(self, host, *args, **kwargs):
+            _base_connection.__init__(self, host, *args, **kwargs)
+            self.shared = host in API_NETLOCS
+            if self.shared:
+                self.session.close()
+                self.session = get_session(API_NETLOCS[host])
+
+        def close(self):
+            # The shared session outlives the connections PyGithub makes
+            if not self.shared:
+                _base_connection.close(self)
+
+
+def get_github(i_host):
+    with _lock:
+        l_github = _clients.get(i_host)
+        if l_github is None:
+            if _base_connection is not None and not _clients:
+                github.Requester.Requester.injectConnectionClasses(
+                    github.Requester.HTTPRequestsConnectionClass,
+                    ScheduledConnection)
+            l_base_url, l_token_name = HOSTS[i_host]
+            l_kwargs = dict(login_or_token=get_token(i_host),
+                            base_url=l_base_url, per_page=100)
+            # PyGithub 2 sleeps 0.25s before every request, one request at
+            # a time for all threads, unless told not to. The token pools
+            # do the pacing. PyGithub before 2.0 doesn't pace, before 1.55
+            # it has no pool_size either
+            for l_extra in [dict(pool_size=pool_size,
+                                 seconds_between_requests=None,
+                                 seconds_between_writes=None),
+                            dict(pool_size=pool_size), dict()]:
+                try:
+                    l_github = Github(**dict(l_kwargs, **l_extra))
+                    break
+                except TypeError:
+                    if not l_extra:
+                        raise
+            _clients[i_host] = l_github
+        return l_github
+
+
+###############################################################################
+# @brief Gets the requests session of a host, its connections are kept alive
+#        and its requests scheduled over the host's token pool
+###############################################################################
+def get_session(i_host):
+    l_pool = get_pool(i_host)
+    with _lock:
+        l_session = _sessions.get(i_host)
+        if l_session is None:
+            l_session = requests.Session()
+            l_adapter = ratelimit.SchedulerAdapter(
+                l_pool, pool_connections=1, pool_maxsize=pool_size,
+                max_retries=3)
+            l_session.mount('https://', l_adapter)
+            l_session.hooks['response'].append(callstats.record_response)
+            _sessions[i_host] = l_session
+        return l_session
+
+
+###############################################################################
+# @brief Runs a GraphQL query against a host
+#
+# @param i_host      : github.com or github.ibm.com
+# @param i_query     : The query text
+# @param i_variables : Dict of the query variables
+#
+# @return The data member of the answer. Errors for single fields (a PR
+#         that doesn't exist, ...) are logged and leave that field None
+###############################################################################
+def graphql(i_host, i_query, i_variables=None):
+    l_response = get_session(i_host).post(
+        GRAPHQL_URLS[i_host],
+        json={'query': i_query, 'variables': i_variables or {}})
+    l_response.raise_for_status()
+    l_answer = l_response.json()
+    for l_error in l_answer.get('errors') or []:
+        logging.warning('graphql: {}'.format(l_error.get('message')))
+    return l_answer.get('data') or {}
+
+
+###############################################################################
+# @brief Gets the PyGithub Repository for a URI, looked up once per process
+#
+# @param i_uri : github.ibm.com/openbmc/openbmc, git://github.com/openbmc/pldm
+#                and the like
+#
+# @return The Repository, or None if the URI isn't on a known host
+###############################################################################
+def get_repo(i_uri):
+    l_parts = gitmirror.split_repo_uri(i_uri)
+    if l_parts is None:
+        return None
+    l_host = l_parts[0]
+    l_repo_name = l_parts[1] + '/' + l_parts[2]
+    l_key = (l_host, l_repo_name)
+
+    while True:
+        with _lock:
+            if l_key in _repos:
+                return _repos[l_key]
+            l_lookup = _lookups.get(l_key)
+            if l_lookup is None:
+                l_lookup = _lookups[l_key] = threading.Event()
+                break
+        # Someone else is looking it up. If that fails, try again ourselves
+        l_lookup.wait()
+
+    try:
+        logging.info('{}'.format(l_repo_name))
+        l_repo = get_github(l_host).get_repo(l_repo_name)
+        with _lock:
+            _repos[l_key] = l_repo
+        return l_repo
+    finally:
+        with _lock:
+            del _lookups[l_key]
+        l_lookup.set()
+
+
+def repo_host(i_repo):
+    for l_host, (l_base_url, l_token_name) in HOSTS.items():
+        if i_repo.url.startswith(l_base_url):
+            return l_host
+    return None
+
+
+def get_json(i_host, i_url, i_params):
+    l_response = get_session(i_host).get(i_url, params=i_params)
+    l_response.raise_for_status()
+    return l_response.json()
+
+
+###############################################################################
+# @brief Fetches pages of a paged API list, page_workers at a time
+#
+# @param i_fetch : Callable taking a page number and returning its items
+# @param i_pages : Page numbers to fetch
+#
+# @return Dict of page number : items
+###############################################################################
+def fetch_pages(i_fetch, i_pages):
+    l_pages = dict()
+    l_errors = []
+    l_todo = list(i_pages)
+    l_lock = threading.Lock()
+
+    def work():
+        while True:
+            with l_lock:
+                if not l_todo or l_errors:
+                    return
+                l_page = l_todo.pop(0)
+            try:
+                l_items = i_fetch(l_page)
+            except Exception as e:
+                with l_lock:
+                    l_errors.append(e)
+                return
+            with l_lock:
+                l_pages[l_page] = l_items
+
+    l_threads = [threading.Thread(target=work)
+                 for l_count in range(min(page_workers, len(l_todo)))]
+    for l_thread in l_threads:
+        l_thread.start()
+    for l_thread in l_threads:
+        l_thread.join()
+    if l_errors:
+        raise l_errors[0]
+    return l_pages
+
+
+def page_count(i_total):
+    return (i_total + PAGE_SIZE - 1) // PAGE_SIZE
+
+
+###############################################################################
+# @brief Gets every commit of a range, also past the 250 commits a single
+#        compare call stops at
+#
+# The compare call is paged and the pages after the first are fetched
+# concurrently. Servers that don't page compare answers give the same 250
+# commits for every page, the range is then walked on the commit list of
+# i_end_commit instead, from i_end_commit back to the merge base.
+#
+# @param i_repo         : PyGithub Repository
+# @param i_begin_commit : Reference to the oldest commit, excluded
+# @param i_end_commit   : Reference to the newest commit, included
+#
+# @return A list of PyGithub Commit objects oldest first, as
+#         i_repo.compare(i_begin_commit, i_end_commit).commits
+###############################################################################
+def compare_commits(i_repo, i_begin_commit, i_end_commit):
+    l_host = repo_host(i_repo)
+    if l_host is None:
+        return list(i_repo.compare(i_begin_commit, i_end_commit).commits)
+
+    l_url = '{}/compare/{}...{}'.format(i_repo.url, i_begin_commit,
+                                         i_end_commit)
+    l_first = get_json(l_host, l_url, {'per_page': PAGE_SIZE, 'page': 1})
+    l_total = l_first['total_commits']
+    l_data = l_first['commits']
+
+    if len(l_data) < l_total:
+        def fetch(i_page):
+            return get_json(l_host, l_url, {'per_page': PAGE_SIZE,
+                                            'page': i_page})['commits']
+
+        l_pages = fetch_pages(fetch, range(2, page_count(l_total) + 1))
+        for l_page in sorted(l_pages):
+            l_data.extend(l_pages[l_page])
+        l_shas = set(l_item['sha'] for l_item in l_data)
+        if len(l_shas) != l_total:
+            logging.info('compare {}...{} isn\'t paged, walking the commit '
+                         'list'.format(i_begin_commit, i_end_commit))
+            l_data = walk_commit_list(l_host, i_repo, i_end_commit,
+                                      l_first['merge_base_commit']['sha'],
+                                      l_total)
+
+    return [github.Commit.Commit(i_repo._requester, {}, l_item, False)
+            for l_item in l_data]
+
+
+###############################################################################
+# @brief Collects the commits reachable from i_end_commit and not from
+#        i_merge_base, paging the commit list of i_end_commit
+#
+# The list is newest first and holds every ancestor of i_end_commit, the
+# ones of the merge base mixed in wherever branches merged. After each batch
+# of pages the range is walked from i_end_commit, stopping at the merge base
+# and at the commits known to be its ancestors. The walk is taken once it
+# reaches no commit still to fetch, passes the merge base and finds i_total
+# commits. Ancestors of the merge base not known yet can only add commits,
+# so i_total of them is the range.
+#
+# @return The commit dicts oldest first
+###############################################################################
+def walk_commit_list(i_host, i_repo, i_end_commit, i_merge_base, i_total):
+    l_url = '{}/commits'.format(i_repo.url)
+
+    def fetch(i_page):
+        return get_json(i_host, l_url, {'sha': i_end_commit,
+                                        'per_page': PAGE_SIZE,
+                                        'page': i_page})
+
+    l_items = dict()
+    l_order = []
+    l_next_page = 1
+    l_batch = page_count(i_total) + 1
+    while True:
+        l_pages = fetch_pages(fetch, range(l_next_page,
+                                           l_next_page + l_batch))
+        l_next_page += l_batch
+        l_batch = page_workers
+        l_done = False
+        for l_page in sorted(l_pages):
+            for l_item in l_pages[l_page]:
+                if l_item['sha'] not in l_items:
+                    l_items[l_item['sha']] = l_item
+                    l_order.append(l_item['sha'])
+            if len(l_pages[l_page]) < PAGE_SIZE:
+                # Past the root commit
+                l_done = True
+                break
+        if not l_order:
+            raise ValueError('The commit list of {} is empty'.format(
+                i_end_commit))
+
+        l_found = range_commits(l_items, l_order[0], i_merge_base, i_total)
+        if l_found is not None:
+            l_position = dict((l_sha, l_index)
+                              for l_index, l_sha in enumerate(l_order))
+            l_found.sort(key=lambda l_sha: l_position[l_sha], reverse=True)
+            return [l_items[l_sha] for l_sha in l_found]
+        if l_done:
+            raise ValueError('The commit list of {} doesn\'t give the {} '
+                             'commits after {}'.format(i_end_commit, i_total,
+                                                       i_merge_base))
+
+
+###############################################################################
+# @brief Walks the commits fetched so far from i_head back to i_merge_base
+#
+# @param i_items : Dict of sha : commit dict of the commits fetched so far
+#
+# @return The shas of the range, None when it can't be told yet
+###############################################################################
+def range_commits(i_items, i_head, i_merge_base, i_total):
+    if i_merge_base not in i_items:
+        return None
+
+    # Ancestors of the merge base, the parents of the fetched ones included
+    l_excluded = set([i_merge_base])
+    l_todo = [i_merge_base]
+    while l_todo:
+        l_item = i_items.get(l_todo.pop())
+        if l_item is None:
+            continue
+        for l_parent in l_item['parents']:
+            if l_parent['sha'] not in l_excluded:
+                l_excluded.add(l_parent['sha'])
+                l_todo.append(l_parent['sha'])
+
+    l_found = []
+    l_seen = set([i_head])
+    l_todo = [i_head]
+    while l_todo:
+        l_sha = l_todo.pop()
+        if l_sha in l_excluded:
+            continue
+        l_item = i_items.get(l_sha)
+        if l_item is None:
+            # Not fetched yet
+            return None
+        l_found.append(l_sha)
+        if len(l_found) > i_total:
+            return None
+        for l_parent in l_item['parents']:
+            if l_parent['sha'] not in l_seen:
+                l_seen.add(l_parent['sha'])
+                l_todo.append(l_parent['sha'])
+
+    if len(l_found) != i_total:
+        return None
+    return l_found
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file gitmirror
+# @brief Reads the commits of a compare range out of a local bare mirror
+#        (git clone --mirror) instead of walking the GitHub compare API.
+#
+# Mirrors are looked up as <mirror_dir>/<host>/<org>/<repo>.git, e.g.
+#   mirrors/github.ibm.com/openbmc/openbmc.git
+#   mirrors/github.com/openbmc/phosphor-logging.git
+#
+# The objects handed back look like the PyGithub commits that
+# generate_commit_reports walks (sha, commit.message, commit.author.name,
+# commit.url, stats.additions, stats.deletions, files[].filename/.patch)
+###############################################################################
+
+import collections
+import logging
+import os
+import subprocess
+PIPE = subprocess.PIPE
+
+import commitidentity
+import profiling
+
+LocalAuthor = collections.namedtuple('LocalAuthor', 'name')
+LocalGitCommit = collections.namedtuple('LocalGitCommit', 'message author url')
+LocalStats = collections.namedtuple('LocalStats', 'additions deletions')
+LocalFile = collections.namedtuple('LocalFile', 'filename patch')
+
+# Separators used in the git log format, never found in commit text
+RECORD_SEP = '\x1e'
+FIELD_SEP = '\x1f'
+
+
+###############################################################################
+# @class LocalCommit
+# @brief A commit read from a local mirror, shaped like a PyGithub Commit
+#
+# Only the recipe patches are kept, so the stable patch id of the whole diff
+# comes along, None when the commit has a Change-Id or git gave none.
+# Commits of the commit cache have commitidentity.UNKNOWN when their record
+# was written without it
+###############################################################################
+class LocalCommit(object):
+    def __init__(self, i_sha, i_message, i_author_name, i_url,
+                 i_additions, i_deletions, i_files, i_patch_id=None):
+        self.sha = i_sha
+        self.commit = LocalGitCommit(i_message, LocalAuthor(i_author_name),
+                                     i_url)
+        self.stats = LocalStats(i_additions, i_deletions)
+        self.files = i_files
+        self.patch_id = i_patch_id
+
+    def __repr__(self):
+        return 'LocalCommit(sha="{}")'.format(self.sha)
+
+
+###############################################################################
+# @brief Splits a repo URI into host, org and repo name
+#
+# @param i_uri : URI as found in recipes or on the command line, e.g.
+#                git://github.com/openbmc/pldm or github.ibm.com/openbmc/openbmc
+#
+# @return (host, org, repo) or None if the URI isn't a known GitHub host
+###############################################################################
+def split_repo_uri(i_uri):
+    l_values = i_uri.strip().split('/')
+    for l_count, l_value in enumerate(l_values[:-2]):
+        for l_host in ('github.ibm.com', 'github.com'):
+            if l_host in l_value:
+                l_repo = l_values[l_count + 2]
+                if l_repo.endswith('.git'):
+                    l_repo = l_repo[:-len('.git')]
+                return l_host, l_values[l_count + 1], l_repo
+    return None
+
+
+def api_commit_url(i_host, i_org, i_repo, i_sha):
+    if i_host == 'github.ibm.com':
+        l_base = 'https://github.ibm.com/api/v3'
+    else:
+        l_base = 'https://api.github.com'
+    return '{}/repos/{}/{}/git/commits/{}'.format(l_base, i_org, i_repo, i_sha)
+
+
+def mirror_path(i_mirror_dir, i_uri):
+    l_parts = split_repo_uri(i_uri)
+    if not l_parts:
+        return None
+    l_path = os.path.join(i_mirror_dir, l_parts[0], l_parts[1],
+                          l_parts[2] + '.git')
+    if os.path.isdir(l_path):
+        return l_path
+    return None
+
+
+def has_commit(i_git_dir, i_ref):
+    git_args = ['git', '--git-dir', i_git_dir, 'cat-file', '-e',
+                i_ref + '^{commit}']
+    with profiling.span('git', 'cat-file'):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        process.communicate()
+    return process.returncode == 0
+
+
+def is_recipe_patch(i_patch):
+    # Only patches that can carry a SRCREV bump are kept in memory
+    return 'SRCREV' in i_patch
+
+
+def _finish_file(i_files, i_filename, i_patch_lines):
+    if i_filename is None:
+        return
+    l_patch = None
+    if i_patch_lines:
+        l_patch = '\n'.join(i_patch_lines)
+        if not is_recipe_patch(l_patch):
+            l_patch = None
+    i_files.append(LocalFile(i_filename, l_patch))
+
+
+###############################################################################
+# @brief Parses the output of the single git log pass done by mirror_commits
+#
+# @param i_lines : Iterable of decoded output lines
+# @param i_url   : Callable returning the API commit URL for a sha
+#
+# @return Generator of LocalCommit objects in git log order
+###############################################################################
+def parse_log(i_lines, i_url):
+    l_header = None
+    l_fields = None
+    l_additions = l_deletions = 0
+    l_files = []
+    l_filename = None
+    l_patch_lines = None
+
+    def make_commit():
+        _finish_file(l_files, l_filename, l_patch_lines)
+        l_sha, l_author, l_message = l_fields[0], l_fields[1], l_fields[2]
+        return LocalCommit(l_sha, l_message.rstrip('\n'), l_author,
+                           i_url(l_sha), l_additions, l_deletions, l_files)
+
+    for l_line in i_lines:
+        if l_line.startswith(RECORD_SEP):
+            if l_fields is not None:
+                yield make_commit()
+            l_header = l_line[1:]
+            l_fields = None
+            l_additions = l_deletions = 0
+            l_files = []
+            l_filename = None
+            l_patch_lines = None
+        elif l_fields is None:
+            l_header += '\n' + l_line
+        elif l_line.startswith('diff --git '):
+            _finish_file(l_files, l_filename, l_patch_lines)
+            l_filename = l_line.split(' b/', 1)[-1]
+            l_patch_lines = None
+        elif l_filename is not None:
+            if l_line.startswith('@@'):
+                l_patch_lines = l_patch_lines or []
+            if l_patch_lines is not None:
+                l_patch_lines.append(l_line)
+        else:
+            # numstat lines come before the first diff
+            l_stat = l_line.split('\t', 2)
+            if len(l_stat) == 3:
+                if l_stat[0].isdigit():
+                    l_additions += int(l_stat[0])
+                if l_stat[1].isdigit():
+                    l_deletions += int(l_stat[1])
+
+        if l_fields is None and l_header is not None \
+                and l_header.count(FIELD_SEP) >= 3:
+            l_fields = l_header.split(FIELD_SEP, 3)
+
+    if l_fields is not None:
+        yield make_commit()
+
+
+###############################################################################
+# @brief Gets the commits between two references from a local mirror in a
+#        single git log pass (commits, author, summary, numstat, patches)
+#
+# @param i_mirror_dir   : Directory holding the mirrors
+# @param i_repo_uri     : URI of the repo the range belongs to
+# @param i_begin_commit : Reference to the oldest commit, excluded
+# @param i_end_commit   : Reference to the newest commit, included. Names are
+#                         read as the mirror has them, as of its last fetch,
+#                         crn.py gives SHAs resolved with the API
+#
+# @return A list of LocalCommit objects oldest first, or None when there is
+#         no mirror or it doesn't hold the range, so the caller can fall back
+#         to the API
+###############################################################################
+def mirror_commits(i_mirror_dir, i_repo_uri, i_begin_commit, i_end_commit):
+    l_git_dir = mirror_path(i_mirror_dir, i_repo_uri)
+    if l_git_dir is None:
+        logging.info('no mirror for {}'.format(i_repo_uri))
+        return None
+
+    for l_ref in (i_begin_commit, i_end_commit):
+        if not has_commit(l_git_dir, l_ref):
+            logging.warning('mirror {} is missing {}, using the API'
+                            .format(l_git_dir, l_ref))
+            return None
+
+    l_host, l_org, l_repo = split_repo_uri(i_repo_uri)
+
+    def url(i_sha):
+        return api_commit_url(l_host, l_org, l_repo, i_sha)
+
+    git_args = ['git', '--git-dir', l_git_dir, 'log', '--reverse',
+                '--no-color', '--no-ext-diff', '--diff-merges=first-parent',
+                '--numstat', '-p',
+                '--format=' + '%x1e%H%x1f%an%x1f%B%x1f',
+                '{}..{}'.format(i_begin_commit, i_end_commit), '--']
+    logging.info(' '.join(git_args))
+
+    with profiling.span('git', 'log'):
+        process = subprocess.Popen(git_args, stdout=PIPE, stderr=PIPE)
+        l_lines = (l_line.decode('utf-8', 'replace').rstrip('\n')
+                   for l_line in process.stdout)
+        l_commits = list(parse_log(l_lines, url))
+        stderroutput = process.communicate()[1]
+    if process.returncode != 0:
+        logging.warning('git log failed in {}: {}'.format(
+            l_git_dir, stderroutput.decode('utf-8', 'replace')))
+        return None
+
+    l_missing = [l_commit for l_commit in l_commits
+                 if not commitidentity.change_id(l_commit.commit.message)]
+    if l_missing:
+        l_patch_ids = mirror_patch_ids(l_git_dir, i_begin_commit,
+                                       i_end_commit)
+        for l_commit in l_missing:
+            l_commit.patch_id = l_patch_ids.get(l_commit.sha)
+
+    return l_commits
+
+
+###############################################################################
+# @brief Stable patch ids of the commits of a range, git log piped into git
+#        patch-id so the diffs aren't held in memory
+#
+# @return Dict of sha : patch id, empty when git failed
+###############################################################################
+def mirror_patch_ids(i_git_dir, i_begin_commit, i_end_commit):
+    git_args = ['git', '--git-dir', i_git_dir, 'log', '-p', '--no-color',
+                '--no-ext-diff', '--diff-merges=first-parent',
+                '--format=commit %H',
+                '{}..{}'.format(i_begin_commit, i_end_commit), '--']
+    with profiling.span('git', 'patch-id'), open(os.devnull, 'w') as l_null:
+        l_log = subprocess.Popen(git_args, stdout=PIPE, stderr=l_null)
+        process = subprocess.Popen(['git', 'patch-id', '--stable'],
+                                   stdin=l_log.stdout, stdout=PIPE,
+                                   stderr=l_null)
+        l_log.stdout.close()
+        stdoutput = process.communicate()[0]
+        l_log.wait()
+    if l_log.returncode != 0 or process.returncode != 0:
+        logging.warning('git patch-id of {}..{} failed in {}'.format(
+            i_begin_commit, i_end_commit, i_git_dir))
+        return dict()
+    l_ids = dict()
+    for l_line in stdoutput.decode('utf-8', 'replace').splitlines():
+        l_fields = l_line.split()
+        if len(l_fields) == 2:
+            l_ids[l_fields[1]] = l_fields[0]
+    return l_ids
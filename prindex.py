@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file prindex
+# @brief Persistent, incrementally updated index of the merged PRs of a repo
+#
+# For each merged PR the index keeps its number, merge and head SHAs, the
+# SHAs of its commits, its body, its comments and updated_at. A refresh only
+# pages closed PRs back to the updated_at cursor of the previous refresh, so
+# crn can find the PR of a commit with a local lookup.
+###############################################################################
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+DEFAULT_BACKFILL_DAYS = 90
+
+# Cursors and updated_at are kept as UTC ISO strings, GitHub's own format,
+# so they compare as strings
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+###############################################################################
+# @brief UTC ISO string of a time. PyGithub before 2.0 gives naive times in
+#        UTC, later ones aware times
+###############################################################################
+def format_time(i_time):
+    if i_time.tzinfo is None:
+        i_time = i_time.replace(tzinfo=timezone.utc)
+    return i_time.astimezone(timezone.utc).strftime(TIME_FORMAT)
+
+
+###############################################################################
+# @class PullIndex
+# @brief SQLite backed sha -> PR and number -> PR index of merged PRs
+###############################################################################
+class PullIndex(object):
+    def __init__(self, i_cache_dir, i_backfill_days=DEFAULT_BACKFILL_DAYS):
+        if not os.path.isdir(i_cache_dir):
+            os.makedirs(i_cache_dir)
+        self.path = os.path.join(i_cache_dir, 'prindex.sqlite')
+        self.backfill_days = i_backfill_days
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._refreshed = dict()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS pulls (host TEXT, repo TEXT, '
+            'number INTEGER, merge_sha TEXT, head_sha TEXT, body TEXT, '
+            'comments TEXT, updated_at TEXT, '
+            'PRIMARY KEY (host, repo, number))')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS pull_commits (host TEXT, repo TEXT, '
+            'sha TEXT, number INTEGER, PRIMARY KEY (host, repo, sha, number))')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS cursors (host TEXT, repo TEXT, '
+            'updated_at TEXT, PRIMARY KEY (host, repo))')
+        self._db.commit()
+
+    def _store(self, i_host, i_repo_name, i_pull):
+        l_comments = [l_comment.body for l_comment
+                      in i_pull.get_issue_comments()]
+        l_shas = [l_commit.sha for l_commit in i_pull.get_commits()]
+        l_shas.extend([i_pull.merge_commit_sha, i_pull.head.sha])
+        with self._lock:
+            self._forget(i_host, i_repo_name, i_pull.number)
+            self._db.execute(
+                'INSERT INTO pulls VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (i_host, i_repo_name, i_pull.number, i_pull.merge_commit_sha,
+                 i_pull.head.sha, i_pull.body, json.dumps(l_comments),
+                 format_time(i_pull.updated_at)))
+            self._db.executemany(
+                'INSERT OR IGNORE INTO pull_commits VALUES (?, ?, ?, ?)',
+                [(i_host, i_repo_name, l_sha, i_pull.number)
+                 for l_sha in l_shas if l_sha])
+            self._db.commit()
+
+    def _forget(self, i_host, i_repo_name, i_number):
+        for l_table in ('pulls', 'pull_commits'):
+            self._db.execute(
+                'DELETE FROM {} WHERE host = ? AND repo = ? AND number = ?'
+                .format(l_table), (i_host, i_repo_name, i_number))
+
+    ###########################################################################
+    # @brief Pages the closed PRs of a repo, most recently updated first,
+    #        back to the cursor of the last refresh (back DEFAULT_BACKFILL_DAYS
+    #        on the first one) and stores the merged ones
+    #
+    # @param i_host : github.com or github.ibm.com
+    # @param i_repo : PyGithub Repository
+    #
+    # @return The number of PRs stored
+    ###########################################################################
+    def refresh(self, i_host, i_repo):
+        l_repo_name = i_repo.full_name
+        with self._lock:
+            l_row = self._db.execute(
+                'SELECT updated_at FROM cursors WHERE host = ? AND repo = ?',
+                (i_host, l_repo_name)).fetchone()
+        if l_row:
+            l_cursor = l_row[0]
+        else:
+            l_cursor = format_time(datetime.now(timezone.utc)
+                                   - timedelta(days=self.backfill_days))
+
+        l_newest = None
+        l_count = 0
+        pulls = i_repo.get_pulls(state='closed', sort='updated',
+                                 direction='desc')
+        for pr in pulls:
+            l_updated_at = format_time(pr.updated_at)
+            if l_updated_at <= l_cursor:
+                break
+            if l_newest is None:
+                l_newest = l_updated_at
+            logging.info('indexing {} PR {}'.format(l_repo_name, pr.number))
+            if pr.merged_at:
+                self._store(i_host, l_repo_name, pr)
+                l_count += 1
+            else:
+                with self._lock:
+                    self._forget(i_host, l_repo_name, pr.number)
+
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO cursors VALUES (?, ?, ?)',
+                             (i_host, l_repo_name, l_newest or l_cursor))
+            self._db.commit()
+        logging.info('{} PRs of {} indexed'.format(l_count, l_repo_name))
+        return l_count
+
+    ###########################################################################
+    # @brief Refreshes a repo the first time it is asked for in this process
+    ###########################################################################
+    def ensure_fresh(self, i_host, i_repo):
+        l_key = (i_host, i_repo.full_name)
+        with self._lock:
+            l_done = self._refreshed.get(l_key)
+            if l_done is None:
+                l_done = self._refreshed[l_key] = threading.Event()
+                l_owner = True
+            else:
+                l_owner = False
+        if not l_owner:
+            l_done.wait()
+            return
+        try:
+            self.refresh(i_host, i_repo)
+        except Exception as e:
+            logging.warning('Unable to refresh PR index of {}: {}'
+                            .format(i_repo.full_name, e))
+        finally:
+            l_done.set()
+
+    ###########################################################################
+    # @brief Lets the next ensure_fresh of every repo refresh it again, for
+    #        processes that outlive a run
+    ###########################################################################
+    def expire(self):
+        with self._lock:
+            self._refreshed = dict()
+
+    def _pull(self, i_host, i_repo_name, i_number):
+        l_row = self._db.execute(
+            'SELECT number, merge_sha, head_sha, body, comments, updated_at '
+            'FROM pulls WHERE host = ? AND repo = ? AND number = ?',
+            (i_host, i_repo_name, i_number)).fetchone()
+        if l_row is None:
+            return None
+        return {'number': l_row[0], 'merge_sha': l_row[1],
+                'head_sha': l_row[2], 'body': l_row[3],
+                'comments': json.loads(l_row[4]), 'updated_at': l_row[5]}
+
+    ###########################################################################
+    # @brief Gets a merged PR by number
+    #
+    # @return A dict with number, merge_sha, head_sha, body, comments (list
+    #         of comment bodies) and updated_at, or None if it isn't indexed
+    ###########################################################################
+    def get_pull(self, i_host, i_repo_name, i_number):
+        with self._lock:
+            l_pull = self._pull(i_host, i_repo_name, i_number)
+            if l_pull is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return l_pull
+
+    ###########################################################################
+    # @brief Gets the merged PRs a commit belongs to
+    #
+    # @return A list of PR dicts as returned by get_pull, or None if the
+    #         commit isn't in any indexed PR
+    ###########################################################################
+    def get_pulls_for_commit(self, i_host, i_repo_name, i_sha):
+        with self._lock:
+            l_numbers = [l_row[0] for l_row in self._db.execute(
+                'SELECT number FROM pull_commits WHERE host = ? AND repo = ? '
+                'AND sha = ? ORDER BY number', (i_host, i_repo_name, i_sha))]
+            if not l_numbers:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return [self._pull(i_host, i_repo_name, l_number)
+                    for l_number in l_numbers]
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file profiling
+# @brief Phase timing and cProfile dump for the --profile option of crn.py,
+#        ab.py and commitTracker.py
+#
+# The tools mark their phases with span blocks (compare walk, enrichment,
+# subrepo, cq/ewm, render, git). Spans nest, a subrepo span is named after
+# its repo, so the breakdown shows which bump a slow phase was under. Work
+# handed to another thread keeps its place in the tree when it is started
+# through wrap.
+#
+# At the end the cProfile statistics are dumped for pstats and the wall
+# clock time of every phase and span path is written out. The profiler sees
+# the main thread, and from python 3.12 on every thread; the spans are timed
+# in all of them.
+#
+# Nothing is recorded until start() is called. Used with both pythons.
+###############################################################################
+
+import cProfile
+import sys
+import threading
+import time
+
+enabled = False
+_lock = threading.Lock()
+_local = threading.local()
+# Tuple of span labels from the outermost one : [calls, seconds]
+_spans = dict()
+# Phase name : [calls, seconds], only the outermost span of a phase counts
+# so recursion isn't counted twice
+_phases = dict()
+_profiler = None
+_start = time.time()
+
+
+def _stack():
+    l_stack = getattr(_local, 'stack', None)
+    if l_stack is None:
+        l_stack = _local.stack = []
+    return l_stack
+
+
+###############################################################################
+# @class span
+# @brief Context manager timing the block as a phase
+#
+# @param i_name   : The phase (compare walk, subrepo, git, ...)
+# @param i_detail : Optional repo name or command, shown with the phase in
+#                   the span tree
+###############################################################################
+class span(object):
+    def __init__(self, i_name, i_detail=None):
+        self.name = i_name
+        self.label = i_name if i_detail is None \
+            else '{} {}'.format(i_name, i_detail)
+        self._start = None
+
+    def __enter__(self):
+        if enabled:
+            _stack().append((self.name, self.label))
+            self._start = time.time()
+        return self
+
+    def __exit__(self, i_type, i_value, i_traceback):
+        if self._start is None:
+            return False
+        l_seconds = time.time() - self._start
+        l_stack = _stack()
+        l_path = tuple(l_label for l_name, l_label in l_stack)
+        l_outermost = all(l_name != self.name for l_name, l_label
+                          in l_stack[:-1])
+        l_stack.pop()
+        with _lock:
+            l_span = _spans.setdefault(l_path, [0, 0.0])
+            l_span[0] += 1
+            l_span[1] += l_seconds
+            if l_outermost:
+                l_phase = _phases.setdefault(self.name, [0, 0.0])
+                l_phase[0] += 1
+                l_phase[1] += l_seconds
+        return False
+
+
+###############################################################################
+# @brief Binds a call to the spans open where it is made, for running it on
+#        another thread
+#
+# @return A function without arguments running i_function(*args)
+###############################################################################
+def wrap(i_function, *args):
+    l_parent = list(_stack()) if enabled else []
+
+    def run():
+        l_saved = getattr(_local, 'stack', None)
+        _local.stack = list(l_parent)
+        try:
+            return i_function(*args)
+        finally:
+            _local.stack = l_saved
+    return run
+
+
+def start():
+    global enabled, _profiler, _start
+    enabled = True
+    _start = time.time()
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+
+
+def format_breakdown():
+    l_wall = time.time() - _start
+    l_lines = ['Phases of the last {:.1f}s:'.format(l_wall),
+               '  {:<40} {:>7} {:>10} {:>6}'.format('phase', 'calls',
+                                                    'seconds', 'run')]
+    with _lock:
+        for l_name, (l_calls, l_seconds) in sorted(
+                _phases.items(), key=lambda i_item: -i_item[1][1]):
+            l_lines.append('  {:<40} {:>7} {:>10.2f} {:>6.0%}'.format(
+                l_name, l_calls, l_seconds, l_seconds / l_wall
+                if l_wall else 0))
+        l_lines.append('Spans:')
+        for l_path, (l_calls, l_seconds) in sorted(_spans.items()):
+            l_lines.append('  {:<40} {:>7} {:>10.2f}'.format(
+                '  ' * (len(l_path) - 1) + l_path[-1], l_calls, l_seconds))
+    return '\n'.join(l_lines) + '\n'
+
+
+###############################################################################
+# @brief Stops the profiler, dumps its statistics and writes the phase
+#        breakdown to stderr and next to the dump
+#
+# @param i_file : File name of the pstats dump, the breakdown goes to
+#                 <i_file>.txt
+###############################################################################
+def report(i_file):
+    if _profiler is None:
+        return
+    _profiler.disable()
+    _profiler.dump_stats(i_file)
+    l_breakdown = format_breakdown()
+    sys.stderr.write(l_breakdown)
+    sys.stderr.write('Profile in {}, see python -m pstats {}\n'.format(
+        i_file, i_file))
+    with open(i_file + '.txt', 'w') as l_file:
+        l_file.write(l_breakdown)
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file ratelimit
+# @brief Rate limit aware scheduling of the GitHub traffic of one host over a
+#        pool of tokens
+#
+# Every request of a host goes through its TokenPool, which hands out the
+# token with the most quota left, reads X-RateLimit-Remaining/-Reset and
+# Retry-After off the answers and paces the requests:
+#   - a token that ran out, or hit a secondary rate limit, is paused until
+#     its reset time (or Retry-After) and the request goes again on another
+#     token; when all tokens are paused the callers wait for the first one
+#     to come back instead of failing
+#   - when a token gets low, requests are spread over the time left until
+#     its reset
+#   - every secondary rate limit doubles a pause kept between two requests,
+#     every request that goes through shrinks it again
+###############################################################################
+
+import logging
+import threading
+import time
+
+import requests
+
+import callstats
+
+# Quota left under which requests are spread until the reset time
+PACE_BELOW = 200
+# Longest pause kept between two requests after secondary rate limits
+MAX_INTERVAL = 10.0
+# Wait after a secondary rate limit that comes without Retry-After
+SECONDARY_WAIT = 60
+# Sends of one request, first one included, before its answer is given back
+MAX_ATTEMPTS = 10
+
+
+def header_int(i_response, i_name):
+    try:
+        return int(i_response.headers.get(i_name))
+    except (TypeError, ValueError):
+        return None
+
+
+###############################################################################
+# @class TokenState
+# @brief What is known about the quota of one token
+###############################################################################
+class TokenState(object):
+    def __init__(self, i_token):
+        self.token = i_token
+        self.remaining = None
+        self.reset = 0
+        self.paused_until = 0
+
+    def __repr__(self):
+        # Never log the token itself
+        return 'TokenState(remaining={}, reset={})'.format(self.remaining,
+                                                          self.reset)
+
+
+###############################################################################
+# @class TokenPool
+# @brief The tokens of a host and the pacing of its requests
+###############################################################################
+class TokenPool(object):
+    def __init__(self, i_host, i_tokens):
+        self.host = i_host
+        l_tokens = [l_token for l_token in i_tokens if l_token] or [None]
+        self.tokens = [TokenState(l_token) for l_token in l_tokens]
+        self.interval = 0
+        self.pauses = 0
+        self._next_time = 0
+        self._cond = threading.Condition()
+
+    def _pace(self, i_state, i_now):
+        l_pace = self.interval
+        if i_state.remaining is not None and i_state.remaining < PACE_BELOW \
+                and i_state.reset > i_now:
+            l_pace = max(l_pace, (i_state.reset - i_now)
+                         / max(i_state.remaining, 1))
+        return l_pace
+
+    ###########################################################################
+    # @brief Waits until a token may be used and it is the caller's turn
+    #
+    # @return The TokenState to send the request with
+    ###########################################################################
+    def acquire(self):
+        l_start = time.time()
+        with self._cond:
+            while True:
+                l_now = time.time()
+                l_ready = [l_state for l_state in self.tokens
+                           if l_state.paused_until <= l_now]
+                if l_ready:
+                    break
+                l_until = min(l_state.paused_until for l_state in self.tokens)
+                logging.warning('all {} tokens are rate limited, resuming at {}'
+                                .format(self.host, time.strftime(
+                                    '%H:%M:%S', time.localtime(l_until))))
+                self._cond.wait(l_until - l_now)
+
+            # Unknown quota first, so every token gets looked at
+            l_state = max(l_ready, key=lambda i_state: float('inf')
+                          if i_state.remaining is None else i_state.remaining)
+            l_at = max(l_now, self._next_time)
+            self._next_time = l_at + self._pace(l_state, l_now)
+            if l_state.remaining:
+                l_state.remaining -= 1
+
+        if l_at > l_now:
+            time.sleep(l_at - l_now)
+        callstats.count('{} seconds waited for a token'.format(self.host),
+                        time.time() - l_start)
+        return l_state
+
+    ###########################################################################
+    # @brief Takes in the rate limit headers of an answer
+    #
+    # @return True if the request was rate limited and has to go again
+    ###########################################################################
+    def update(self, i_state, i_response):
+        l_now = time.time()
+        l_remaining = header_int(i_response, 'X-RateLimit-Remaining')
+        l_reset = header_int(i_response, 'X-RateLimit-Reset')
+        l_retry_after = header_int(i_response, 'Retry-After')
+
+        with self._cond:
+            if l_remaining is not None:
+                i_state.remaining = l_remaining
+            if l_reset is not None:
+                i_state.reset = l_reset
+
+            if i_response.status_code not in (403, 429):
+                if self.interval:
+                    self.interval *= 0.9
+                    if self.interval < 0.05:
+                        self.interval = 0
+                return False
+
+            if l_retry_after is not None:
+                l_until = l_now + l_retry_after
+                self.interval = min(max(self.interval * 2, 1), MAX_INTERVAL)
+            elif l_remaining == 0:
+                l_until = max(i_state.reset, l_now) + 1
+            elif 'rate limit' in i_response.text.lower():
+                l_until = l_now + SECONDARY_WAIT
+                self.interval = min(max(self.interval * 2, 1), MAX_INTERVAL)
+            else:
+                # A plain permission error
+                return False
+
+            i_state.paused_until = max(i_state.paused_until, l_until)
+            self.pauses += 1
+            self._cond.notify_all()
+        callstats.count('{} rate limit pauses'.format(self.host))
+        logging.info('{} token rate limited until {}'.format(
+            self.host, time.strftime('%H:%M:%S', time.localtime(l_until))))
+        return True
+
+
+###############################################################################
+# @class SchedulerAdapter
+# @brief requests transport adapter sending every request through a
+#        TokenPool, it sets the Authorization header of each request
+###############################################################################
+class SchedulerAdapter(requests.adapters.HTTPAdapter):
+    def __init__(self, i_pool, **kwargs):
+        super(SchedulerAdapter, self).__init__(**kwargs)
+        self.pool = i_pool
+
+    def send(self, request, **kwargs):
+        for l_attempt in range(MAX_ATTEMPTS):
+            l_state = self.pool.acquire()
+            if l_state.token:
+                request.headers['Authorization'] = 'token ' + l_state.token
+            l_response = super(SchedulerAdapter, self).send(request, **kwargs)
+            if not self.pool.update(l_state, l_response):
+                return l_response
+            if l_attempt + 1 < MAX_ATTEMPTS:
+                l_response.close()
+        return l_response
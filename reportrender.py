@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file reportrender
+# @brief Writes report trees to the console, wiki and HTML files
+#
+# render_reports walks the trees once, without recursion, and hands every
+# report and its depth to each renderer, which writes the report's line
+# straight to its file. Nothing is put together in memory, so the cost stays
+# linear however many commits a subrepo bump brings in.
+#
+# Reports only need repo_uri, repo_name, sha, nice_name, summary and
+# subreports, author_name is written when they have one. A report with a
+# duplicate_of (repo_uri, repo_name, sha, nice_name) is written as a
+# reference to that commit. Used by crn.py and commitTracker.py, so it has
+# to work with both pythons.
+###############################################################################
+
+import re
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+# Colors for the console
+RED = '\033[31m'
+BLUE = '\033[94m'
+ENDC = '\033[0m'
+
+
+def one_line(i_text):
+    return WHITESPACE_RE.sub(' ', i_text)
+
+
+###############################################################################
+# @brief Walks report trees depth first, every report before its subreports
+#
+# @return Generator of (report, level) pairs, level 0 for i_reports
+###############################################################################
+def walk_reports(i_reports):
+    l_todo = [(l_report, 0) for l_report in reversed(list(i_reports))]
+    while l_todo:
+        l_report, l_level = l_todo.pop()
+        yield l_report, l_level
+        l_todo.extend((l_sub, l_level + 1)
+                      for l_sub in reversed(l_report.subreports))
+
+
+###############################################################################
+# @brief Writes report trees with all renderers in one walk
+###############################################################################
+def render_reports(i_reports, i_renderers):
+    for l_report, l_level in walk_reports(i_reports):
+        for l_renderer in i_renderers:
+            l_renderer.write_report(l_report, l_level)
+
+
+###############################################################################
+# @class TextRenderer
+# @brief One line per commit, subrepo commits indented, as in the wiki
+###############################################################################
+class TextRenderer(object):
+    REPO_START = ''
+    COMMIT_START = ''
+    END = ''
+
+    def __init__(self, i_file):
+        self.file = i_file
+
+    def write_report(self, i_report, i_level):
+        l_parts = ['  ' * i_level, self.REPO_START, i_report.repo_name,
+                   self.END, ' ', self.COMMIT_START, i_report.nice_name,
+                   self.END, ' ']
+        l_first = getattr(i_report, 'duplicate_of', None)
+        if l_first is not None:
+            l_parts.extend(['same change as ', self.REPO_START, l_first[1],
+                            self.END, ' ', self.COMMIT_START, l_first[3],
+                            self.END, '\n'])
+            self.file.write(''.join(l_parts))
+            return
+        l_author = getattr(i_report, 'author_name', None)
+        if l_author is not None:
+            l_parts.extend([l_author, ' '])
+        l_parts.extend([one_line(i_report.summary), '\n'])
+        self.file.write(''.join(l_parts))
+
+
+###############################################################################
+# @class ConsoleRenderer
+# @brief The wiki lines with the repo name in red and the commit in blue
+###############################################################################
+class ConsoleRenderer(TextRenderer):
+    REPO_START = RED
+    COMMIT_START = BLUE
+    END = ENDC
+
+
+###############################################################################
+# @class HtmlRenderer
+# @brief One div per commit, linking the repo and the commit
+#
+# @param i_repo_url : Function giving the web URL of a repo URI, called once
+#                     per repo
+###############################################################################
+class HtmlRenderer(object):
+    def __init__(self, i_file, i_repo_url=None):
+        self.file = i_file
+        self.repo_url = i_repo_url
+        self._urls = dict()
+
+    def url(self, i_repo_uri):
+        l_url = self._urls.get(i_repo_uri)
+        if l_url is None:
+            l_url = i_repo_uri
+            if self.repo_url:
+                l_url = self.repo_url(i_repo_uri)
+            self._urls[i_repo_uri] = l_url
+        return l_url
+
+    def write_report(self, i_report, i_level):
+        l_repo_url = self.url(i_report.repo_uri)
+        l_parts = [
+            '<div style="margin-left: ', str(i_level * 20), 'px">',
+            '<a href="', l_repo_url, '" target="_blank" ',
+            'style="color: red">', i_report.repo_name, '</a>&nbsp;',
+            '<a href="', l_repo_url, '/commit/', i_report.sha,
+            '" target="_blank" style="color: blue">', i_report.nice_name,
+            '</a>&nbsp;']
+        l_first = getattr(i_report, 'duplicate_of', None)
+        if l_first is not None:
+            l_first_url = self.url(l_first[0])
+            l_parts.extend([
+                '<span>same change as </span>',
+                '<a href="', l_first_url, '" target="_blank" ',
+                'style="color: red">', l_first[1], '</a>&nbsp;',
+                '<a href="', l_first_url, '/commit/', l_first[2],
+                '" target="_blank" style="color: blue">', l_first[3],
+                '</a></div>\n'])
+            self.file.write(''.join(l_parts))
+            return
+        l_author = getattr(i_report, 'author_name', None)
+        if l_author is not None:
+            l_parts.extend(['<span style="color: green">', one_line(l_author),
+                            '</span>', ' '])
+        l_parts.extend(['<span>', one_line(i_report.summary), '</span>',
+                        '</div>\n'])
+        self.file.write(''.join(l_parts))
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file reportstore
+# @brief Stored report trees of the ranges crn.py has already been run on
+#
+# Every run saves its report tree (commits, subreports, closed issues, notes
+# and STGDefects) as <release_dir>/.crn-reports/<begin>..<end>.json, begin
+# and end being the references given on the command line. Tags are
+# sequential, so the tree of a later range can be put together out of the
+# stored ones, chained begin to end, and only the commits after the last
+# stored tag have to be walked.
+#
+# A branch name doesn't stay on one commit, so the file also holds the SHAs
+# begin and end were at, begin_sha and end_sha. A stored range is only the
+# range of the references when they are still at those SHAs.
+###############################################################################
+
+import json
+import logging
+import os
+
+STORE_DIR_NAME = '.crn-reports'
+RANGE_SEP = '..'
+SUFFIX = '.json'
+
+
+def quote_ref(i_ref):
+    return i_ref.replace('%', '%25').replace('/', '%2F')
+
+
+def unquote_ref(i_ref):
+    return i_ref.replace('%2F', '/').replace('%25', '%')
+
+
+###############################################################################
+# @class ReportStore
+# @brief Directory of stored report trees, one JSON file per range
+###############################################################################
+class ReportStore(object):
+    def __init__(self, i_release_dir):
+        self.dir = os.path.join(i_release_dir, STORE_DIR_NAME)
+
+    def path(self, i_begin, i_end):
+        return os.path.join(self.dir, quote_ref(i_begin) + RANGE_SEP
+                            + quote_ref(i_end) + SUFFIX)
+
+    ###########################################################################
+    # @brief Lists the stored ranges
+    #
+    # @return A list of (begin, end) references
+    ###########################################################################
+    def ranges(self):
+        if not os.path.isdir(self.dir):
+            return []
+        l_ranges = []
+        for l_name in sorted(os.listdir(self.dir)):
+            if not l_name.endswith(SUFFIX) or RANGE_SEP not in l_name:
+                continue
+            l_begin, l_end = l_name[:-len(SUFFIX)].split(RANGE_SEP, 1)
+            l_ranges.append((unquote_ref(l_begin), unquote_ref(l_end)))
+        return l_ranges
+
+    ###########################################################################
+    # @brief Finds the chains of stored ranges starting at a reference
+    #
+    # @param i_begin : Reference the chains start at
+    #
+    # @return Dict of reference : shortest list of (begin, end) ranges
+    #         leading from i_begin to it
+    ###########################################################################
+    def chains(self, i_begin):
+        l_next = dict()
+        for l_begin, l_end in self.ranges():
+            l_next.setdefault(l_begin, []).append(l_end)
+
+        l_chains = {i_begin: []}
+        l_todo = [i_begin]
+        while l_todo:
+            l_ref = l_todo.pop(0)
+            for l_end in l_next.get(l_ref, []):
+                if l_end not in l_chains:
+                    l_chains[l_end] = l_chains[l_ref] + [(l_ref, l_end)]
+                    l_todo.append(l_end)
+        del l_chains[i_begin]
+        return l_chains
+
+    ###########################################################################
+    # @brief Loads a stored range
+    #
+    # @return Dict of repo_uri, begin, end, begin_sha, end_sha and reports,
+    #         the list of report dicts. None if the range isn't stored for
+    #         this repo or can't be read
+    ###########################################################################
+    def load(self, i_repo_uri, i_begin, i_end):
+        l_path = self.path(i_begin, i_end)
+        try:
+            with open(l_path) as l_file:
+                l_stored = json.load(l_file)
+        except (IOError, OSError, ValueError) as e:
+            logging.warning('Unable to read {}: {}'.format(l_path, e))
+            return None
+        if l_stored.get('repo_uri') != i_repo_uri:
+            return None
+        return l_stored
+
+    def save(self, i_repo_uri, i_begin, i_end, i_begin_sha, i_end_sha,
+             i_reports):
+        l_writer = self.writer(i_repo_uri, i_begin, i_end, i_begin_sha,
+                               i_end_sha)
+        for l_report in i_reports:
+            l_writer.add(l_report)
+        l_writer.close()
+
+    ###########################################################################
+    # @brief Starts storing a range report by report, so the whole tree never
+    #        has to be in memory
+    #
+    # @param i_begin_sha : SHA i_begin is at
+    # @param i_end_sha   : SHA i_end is at
+    #
+    # @return A ReportWriter, the range is only stored once it is closed
+    ###########################################################################
+    def writer(self, i_repo_uri, i_begin, i_end, i_begin_sha, i_end_sha):
+        if not os.path.isdir(self.dir):
+            os.makedirs(self.dir)
+        return ReportWriter(self.path(i_begin, i_end), i_repo_uri, i_begin,
+                            i_end, i_begin_sha, i_end_sha)
+
+
+###############################################################################
+# @class ReportWriter
+# @brief Writes the stored file of a range one report at a time
+###############################################################################
+class ReportWriter(object):
+    def __init__(self, i_path, i_repo_uri, i_begin, i_end, i_begin_sha,
+                 i_end_sha):
+        self.path = i_path
+        self._count = 0
+        self._file = open(i_path + '.tmp', 'w')
+        l_header = json.dumps({'repo_uri': i_repo_uri, 'begin': i_begin,
+                               'end': i_end, 'begin_sha': i_begin_sha,
+                               'end_sha': i_end_sha})
+        # Same document as json.dump of the header with a reports list
+        self._file.write(l_header[:-1] + ', "reports": [')
+
+    def add(self, i_report):
+        if self._count:
+            self._file.write(', ')
+        json.dump(i_report, self._file)
+        self._count += 1
+
+    def close(self):
+        self._file.write(']}')
+        self._file.close()
+        os.replace(self.path + '.tmp', self.path)
+        logging.info('stored {} reports in {}'.format(self._count, self.path))
+
+    def discard(self):
+        self._file.close()
+        os.remove(self.path + '.tmp')
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file runbundle
+# @brief Offline data bundle of a crn.py run, see --export-bundle and
+#        --from-bundle
+#
+# A run with --export-bundle keeps everything it fetched: the GitHub answers
+# (compares, commits with their stats and patches, PRs, PR comments, GraphQL
+# queries), the output of every cqcmd.pl call and the EWM work items it
+# displayed. At exit they are written into one zip file:
+#   bundle.json : the crn.py arguments of the run and what the bundle holds
+#   index.json  : request key : the http/ entries answering it, in order
+#   http/<n>    : one GitHub answer, its status, headers and content
+#   cqcmd.json  : the arguments and output of every cqcmd.pl call
+#   ewm.json    : the work items displayed, as fakes/ewm.py reads them
+#
+# A run with --from-bundle gets the same answers out of the bundle and makes
+# no calls. The ghclient sessions are given a transport adapter reading the
+# bundle, so PyGithub and the raw requests work as usual. A request that
+# isn't in the bundle gets a 404 and is counted as a miss.
+#
+# bench/crn_bench.py records its cases as bundles too, and replays them
+# through a local HTTP server to time the network path as well.
+###############################################################################
+
+import collections
+import copy
+import json
+import logging
+import os
+import threading
+import zipfile
+from datetime import datetime
+from http.client import responses
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+import requests.adapters
+from requests.structures import CaseInsensitiveDict
+
+import config
+import ghclient
+
+FORMAT = 1
+INFO_FILE = 'bundle.json'
+INDEX_FILE = 'index.json'
+HTTP_DIR = 'http/'
+CQCMD_FILE = 'cqcmd.json'
+EWM_FILE = 'ewm.json'
+
+# Answer headers worth keeping. The rate limit ones are left out so the
+# token pools don't pace a bench replay after the quota of the recording
+KEPT_HEADERS = ['Content-Type', 'Link', 'ETag', 'Last-Modified', 'Location']
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+BUNDLE_OPTIONS = ['--export-bundle', '--from-bundle']
+
+
+###############################################################################
+# @brief scheme://netloc of a URL, without the port when it is the default
+#        one. PyGithub puts :443 in its URLs, requests doesn't
+###############################################################################
+def url_origin(i_url):
+    l_url = urlsplit(i_url)
+    l_netloc = l_url.netloc
+    if l_url.port == DEFAULT_PORTS.get(l_url.scheme):
+        l_netloc = l_url.hostname
+    return '{}://{}'.format(l_url.scheme, l_netloc)
+
+
+def to_text(i_data):
+    if i_data is None or isinstance(i_data, str):
+        return i_data
+    return i_data.decode('utf-8', 'surrogateescape')
+
+
+def to_bytes(i_text):
+    return i_text.encode('utf-8', 'surrogateescape')
+
+
+###############################################################################
+# @brief Key an answer is looked up by: method, origin, path, the query with
+#        its parameters in order, and the body
+###############################################################################
+def exchange_key(i_method, i_netloc, i_path, i_query, i_body):
+    l_query = urlencode(sorted(parse_qsl(i_query, keep_blank_values=True)))
+    return '{} {}{}?{} {}'.format(i_method, i_netloc, i_path, l_query,
+                                  i_body or '')
+
+
+def request_key(i_request):
+    l_url = urlsplit(i_request.url)
+    return exchange_key(i_request.method,
+                        urlsplit(url_origin(i_request.url)).netloc,
+                        l_url.path, l_url.query, to_text(i_request.body))
+
+
+def command_key(i_args):
+    return json.dumps(list(i_args))
+
+
+###############################################################################
+# @brief The crn.py arguments of a run without --export-bundle and
+#        --from-bundle, the ones to give for reading the bundle back
+###############################################################################
+def run_args(i_args):
+    l_args = []
+    l_skip = False
+    for l_arg in i_args:
+        if l_skip:
+            l_skip = False
+        elif l_arg in BUNDLE_OPTIONS:
+            l_skip = True
+        elif l_arg.split('=', 1)[0] not in BUNDLE_OPTIONS:
+            l_args.append(l_arg)
+    return l_args
+
+
+###############################################################################
+# @class BundleWriter
+# @brief Collects what a run fetches and writes it out as a bundle
+###############################################################################
+class BundleWriter(object):
+    def __init__(self, i_file, i_args, i_range):
+        self.file = i_file
+        self.args = run_args(i_args)
+        self.range = list(i_range)
+        # (request key, answer) in the order the answers came
+        self.exchanges = []
+        self.commands = []
+        self.workitems = dict()
+        self._lock = threading.Lock()
+
+    ###########################################################################
+    # @brief Hooks the writer into the ghclient sessions, crn.py hands it the
+    #        cqcmd.pl output and the EWM work items itself
+    ###########################################################################
+    def install(self):
+        for l_host in ghclient.HOSTS:
+            ghclient.get_session(l_host).hooks['response'].append(
+                self.record_response)
+
+    def record_response(self, i_response, *args, **kwargs):
+        l_answer = {
+            'status': i_response.status_code,
+            'headers': dict((l_name, i_response.headers[l_name])
+                            for l_name in KEPT_HEADERS
+                            if l_name in i_response.headers),
+            'content': to_text(i_response.content),
+        }
+        l_key = request_key(i_response.request)
+        with self._lock:
+            self.exchanges.append((l_key, l_answer))
+
+    ###########################################################################
+    # @brief Keeps the output of a cqcmd.pl call, None when it failed
+    ###########################################################################
+    def add_command(self, i_args, i_output):
+        with self._lock:
+            self.commands.append({'args': list(i_args), 'output': i_output})
+
+    ###########################################################################
+    # @brief Keeps an EWM work item, or the error displaying it raised
+    ###########################################################################
+    def add_workitem(self, i_id, i_workitem, i_error=None):
+        with self._lock:
+            if i_error is not None:
+                self.workitems[str(i_id)] = {'error': str(i_error)}
+            else:
+                self.workitems[str(i_id)] = i_workitem
+
+    def save(self):
+        with self._lock:
+            l_exchanges = list(self.exchanges)
+            l_commands = list(self.commands)
+            l_workitems = dict(self.workitems)
+        l_index = collections.OrderedDict()
+        l_temp_file = self.file + '.tmp'
+        with zipfile.ZipFile(l_temp_file, 'w', zipfile.ZIP_DEFLATED) as l_zip:
+            for l_number, (l_key, l_answer) in enumerate(l_exchanges):
+                l_name = '{}{}'.format(HTTP_DIR, l_number)
+                l_index.setdefault(l_key, []).append(l_name)
+                l_zip.writestr(l_name, json.dumps(l_answer))
+            l_zip.writestr(INDEX_FILE, json.dumps(l_index))
+            l_zip.writestr(CQCMD_FILE, json.dumps(l_commands, indent=1))
+            l_zip.writestr(EWM_FILE, json.dumps(
+                {'display': l_workitems}, indent=1, sort_keys=True,
+                default=str))
+            l_zip.writestr(INFO_FILE, json.dumps({
+                'format': FORMAT, 'args': self.args, 'range': self.range,
+                'created': datetime.now().isoformat(),
+                'answers': len(l_exchanges), 'commands': len(l_commands),
+                'workitems': len(l_workitems)}, indent=1))
+        os.replace(l_temp_file, self.file)
+        print('Wrote bundle {}: {} answers, {} cqcmd.pl calls, {} work '
+              'items'.format(self.file, len(l_exchanges), len(l_commands),
+                             len(l_workitems)))
+
+
+###############################################################################
+# @class BundleReader
+# @brief Answers the calls of a run out of a bundle
+#
+# A request made several times gets the answers kept for it in order, then
+# the last one again. The same goes for cqcmd.pl calls.
+###############################################################################
+class BundleReader(object):
+    def __init__(self, i_file):
+        self.file = i_file
+        self._zip = zipfile.ZipFile(i_file)
+        self.info = self._read_json(INFO_FILE)
+        if self.info.get('format') != FORMAT:
+            raise ValueError('{} is a bundle of format {}, not {}'.format(
+                i_file, self.info.get('format'), FORMAT))
+        self._index = self._read_json(INDEX_FILE)
+        self._commands = collections.defaultdict(list)
+        for l_command in self._read_json(CQCMD_FILE):
+            self._commands[command_key(l_command['args'])].append(
+                l_command['output'])
+        self._workitems = self._read_json(EWM_FILE).get('display', {})
+        self._served = collections.Counter()
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def _read_json(self, i_name):
+        return json.loads(self._zip.read(i_name).decode('utf-8'))
+
+    def _next(self, i_key, i_answers):
+        l_count = self._served[i_key]
+        self._served[i_key] += 1
+        return i_answers[min(l_count, len(i_answers) - 1)]
+
+    ###########################################################################
+    # @return Dict of request key : the answers kept for it, in order
+    ###########################################################################
+    def answers(self):
+        with self._lock:
+            return dict((l_key, [json.loads(self._zip.read(l_name).decode(
+                'utf-8')) for l_name in l_names])
+                for l_key, l_names in self._index.items())
+
+    ###########################################################################
+    # @brief Writes one of the files of the bundle (CQCMD_FILE, EWM_FILE)
+    #        into a directory, for the fakes/ stand-ins to read
+    #
+    # @return Path of the written file
+    ###########################################################################
+    def extract(self, i_name, i_dir):
+        with self._lock:
+            return self._zip.extract(i_name, i_dir)
+
+    ###########################################################################
+    # @brief Sends the requests of the ghclient sessions to the bundle, has
+    #        to be called before the first request
+    ###########################################################################
+    def install(self):
+        l_adapter = BundleAdapter(self)
+        for l_host, (l_base_url, l_token_name) in ghclient.HOSTS.items():
+            # The bundle takes any token, replays don't need credentials
+            if not getattr(config, l_token_name, None):
+                setattr(config, l_token_name, 'bundle')
+            l_session = ghclient.get_session(l_host)
+            l_session.mount('https://', l_adapter)
+            l_session.mount('http://', l_adapter)
+
+    ###########################################################################
+    # @return The answer kept for a request, None if there is none
+    ###########################################################################
+    def answer(self, i_request):
+        l_key = request_key(i_request)
+        with self._lock:
+            l_names = self._index.get(l_key)
+            if not l_names:
+                self.misses += 1
+                return None
+            return json.loads(self._zip.read(
+                self._next(l_key, l_names)).decode('utf-8'))
+
+    ###########################################################################
+    # @return The output of a cqcmd.pl call, None when it failed or isn't in
+    #         the bundle
+    ###########################################################################
+    def command(self, i_args):
+        l_key = command_key(i_args)
+        with self._lock:
+            l_outputs = self._commands.get(l_key)
+            if not l_outputs:
+                self.misses += 1
+                logging.warning('cqcmd.pl {} isn\'t in the bundle'.format(
+                    ' '.join(i_args[:2])))
+                return None
+            return self._next(l_key, l_outputs)
+
+    ###########################################################################
+    # @brief ewm display out of the bundle, raises what it raised
+    ###########################################################################
+    def workitem(self, i_id):
+        l_item = self._workitems.get(str(i_id))
+        if l_item is None:
+            with self._lock:
+                self.misses += 1
+            raise LookupError('work item {} isn\'t in the bundle'.format(i_id))
+        if 'error' in l_item and len(l_item) == 1:
+            raise Exception(l_item['error'])
+        return copy.deepcopy(l_item)
+
+    def close(self):
+        if self.misses:
+            logging.warning('{} calls weren\'t in {}, the output is missing '
+                            'what they would have found'.format(self.misses,
+                                                                self.file))
+        self._zip.close()
+
+
+###############################################################################
+# @class BundleAdapter
+# @brief Transport adapter answering requests out of a BundleReader
+###############################################################################
+class BundleAdapter(requests.adapters.BaseAdapter):
+    def __init__(self, i_bundle):
+        super(BundleAdapter, self).__init__()
+        self.bundle = i_bundle
+
+    def send(self, request, **kwargs):
+        l_answer = self.bundle.answer(request)
+        if l_answer is None:
+            logging.warning('{} {} isn\'t in the bundle'.format(
+                request.method, request.url))
+            l_answer = {'status': 404,
+                        'headers': {'Content-Type': 'application/json'},
+                        'content': json.dumps({
+                            'message': 'Not Found',
+                            'documentation_url': 'not in the bundle'})}
+        l_response = requests.Response()
+        l_response.status_code = l_answer['status']
+        l_response.reason = responses.get(l_answer['status'], '')
+        l_response.headers = CaseInsensitiveDict(l_answer['headers'])
+        l_response._content = to_bytes(l_answer['content'] or '')
+        l_response.encoding = 'utf-8'
+        l_response.url = request.url
+        l_response.request = request
+        l_response.connection = self
+        return l_response
+
+    def close(self):
+        pass
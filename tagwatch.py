@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+###############################################################################
+# @file tagwatch
+# @brief Watches the tag repo of crn.py and does the fetching for the
+#        release notes of every new tag as soon as it is pushed
+#
+# The tags of the tag repo are polled with conditional requests: the ETag
+# of the last answer goes out as If-None-Match, and an unchanged tag list
+# costs a 304 that GitHub doesn't count against the rate limit. A new tag
+# is prewarmed from the tag before it in its release (fw1020.00-57.9 for
+# fw1020.00-57.10) with the crn.py options given after --, see
+# crn.prewarm_release. Running crn.py for it with the same options then
+# reads the report tree and the commits back from the report store and the
+# commit cache.
+#
+# The tags there at the first poll are only taken note of. A tag whose
+# prewarm failed is tried again at the next poll. What the watcher knows is
+# kept in --state, so a restart doesn't prewarm old tags.
+###############################################################################
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import time
+
+import commitcache
+import crn
+import ghclient
+import gitmirror
+
+DEFAULT_STATE_FILE = os.path.join(commitcache.DEFAULT_CACHE_DIR,
+                                  'tagwatch.json')
+TAGS_PREFIX = 'refs/tags/'
+
+
+###############################################################################
+# @brief Lists the tags of a repo starting with a prefix, when they changed
+#        since the last poll
+#
+# @param i_repo_uri : URI of the tag repo
+# @param i_prefix   : Start of the tag names to list
+# @param io_state   : Dict keeping the ETag from one poll to the next
+#
+# @return Dict of tag name : sha of the ref, None when nothing changed
+###############################################################################
+def poll_tags(i_repo_uri, i_prefix, io_state):
+    l_host, l_owner, l_name = gitmirror.split_repo_uri(i_repo_uri)
+    l_url = '{}/repos/{}/{}/git/matching-refs/tags/{}'.format(
+        ghclient.HOSTS[l_host][0], l_owner, l_name, i_prefix)
+    l_session = ghclient.get_session(l_host)
+    l_headers = dict()
+    if io_state.get('etag'):
+        l_headers['If-None-Match'] = io_state['etag']
+    l_response = l_session.get(l_url, headers=l_headers,
+                               params={'per_page': ghclient.PAGE_SIZE})
+    if l_response.status_code == 304:
+        return None
+    l_response.raise_for_status()
+    l_refs = l_response.json()
+
+    # The ETag is the one of the first page, a tag added to a later page
+    # wouldn't change it. Lists of several pages are polled in full
+    l_etag = l_response.headers.get('ETag')
+    l_next = l_response.links.get('next')
+    while l_next:
+        l_etag = None
+        l_response = l_session.get(l_next['url'])
+        l_response.raise_for_status()
+        l_refs.extend(l_response.json())
+        l_next = l_response.links.get('next')
+    io_state['etag'] = l_etag
+
+    return dict((l_ref['ref'][len(TAGS_PREFIX):], l_ref['object']['sha'])
+                for l_ref in l_refs if l_ref['ref'].startswith(TAGS_PREFIX))
+
+
+###############################################################################
+# @brief The tag before a tag in its release: the newest known tag with the
+#        same release prefix that sorts before it
+#
+# @param i_release_re : Regex matching the release prefix of the tag names
+#
+# @return The tag name, None when the tag is the first of its release
+###############################################################################
+def previous_tag(i_tag, i_tags, i_release_re):
+    l_match = i_release_re.match(i_tag)
+    if l_match is None:
+        return None
+    l_key = crn.natural_key(i_tag)
+    l_earlier = [l_tag for l_tag in i_tags
+                 if l_tag.startswith(l_match.group(0))
+                 and crn.natural_key(l_tag) < l_key]
+    if not l_earlier:
+        return None
+    return max(l_earlier, key=crn.natural_key)
+
+
+def load_state(i_file, i_repo_uri):
+    if not os.path.exists(i_file):
+        return dict()
+    try:
+        with open(i_file) as l_file:
+            return json.load(l_file).get(i_repo_uri, dict())
+    except Exception as e:
+        logging.warning('Unable to read {}: {}'.format(i_file, e))
+        return dict()
+
+
+def save_state(i_file, i_repo_uri, i_state):
+    l_states = dict()
+    if os.path.exists(i_file):
+        try:
+            with open(i_file) as l_file:
+                l_states = json.load(l_file)
+        except Exception as e:
+            logging.warning('Unable to read {}: {}'.format(i_file, e))
+    l_states[i_repo_uri] = i_state
+    l_dir = os.path.dirname(i_file)
+    if l_dir and not os.path.isdir(l_dir):
+        os.makedirs(l_dir)
+    with open(i_file + '.tmp', 'w') as l_file:
+        json.dump(l_states, l_file, indent=1, sort_keys=True)
+    os.replace(i_file + '.tmp', i_file)
+
+
+###############################################################################
+# @brief Prewarms the range of a new tag
+#
+# @return True when it is done, False when it should be tried again
+###############################################################################
+def prewarm(i_args, i_tag, i_previous):
+    l_crn_args = crn.parse_arguments(i_args.crn_args + [i_previous, i_tag])
+    # One range, crn.py takes a list of tags for batches
+    l_crn_args.latest_commit = i_tag
+    l_start = time.time()
+    try:
+        # The tag may not be in repo_uri yet, the range ends at its commit
+        l_latest_commit = crn.get_repo(
+            i_args.tag_repo_uri).get_commit(i_tag).sha
+        l_totals = crn.prewarm_release(l_crn_args, l_latest_commit)
+    except Exception as e:
+        logging.warning('Unable to prewarm {}..{}: {}'.format(
+            i_previous, i_tag, e))
+        return False
+    if l_totals is None:
+        return False
+    print('Prewarmed {}..{}: {} commits, {} STGDefects in {:.0f}s'.format(
+        i_previous, i_tag, l_totals.commits, len(l_totals.stgDefects),
+        time.time() - l_start))
+    sys.stdout.flush()
+    return True
+
+
+###############################################################################
+# @brief Polls once and prewarms the new tags
+#
+# @param io_state : Dict of etag, tags (tag name : ref sha) and pending (the
+#                   tags still to prewarm)
+###############################################################################
+def watch_once(i_args, io_state):
+    l_tags = poll_tags(i_args.tag_repo_uri, i_args.prefix, io_state)
+    if l_tags is not None:
+        l_known = io_state.get('tags')
+        l_new = sorted((l_tag for l_tag in l_tags
+                        if l_known is not None and l_tag not in l_known),
+                       key=crn.natural_key)
+        if l_known is None:
+            logging.info('watching {} tags of {}'.format(
+                len(l_tags), i_args.tag_repo_uri))
+        io_state['tags'] = l_tags
+        io_state['pending'] = io_state.get('pending', []) + l_new
+
+    l_release_re = re.compile(i_args.release)
+    for l_tag in list(io_state.get('pending', [])):
+        l_previous = previous_tag(l_tag, io_state['tags'], l_release_re)
+        if l_previous is None:
+            logging.info('{} is the first tag of its release, nothing to '
+                         'prewarm'.format(l_tag))
+        elif not prewarm(i_args, l_tag, l_previous):
+            continue
+        io_state['pending'].remove(l_tag)
+
+
+def parse_arguments(i_args):
+    l_parser = argparse.ArgumentParser(
+        description='Prewarm the crn.py caches for every new tag')
+    l_parser.add_argument(
+        '-t', '--tag_repo_uri', default='github.ibm.com/rfrandse/openbmc',
+        help='The URI of the repo the tags are pushed to ' \
+             +'(default github.ibm.com/rfrandse/openbmc)')
+    l_parser.add_argument(
+        '--prefix', default='fw',
+        help='Only watch the tags starting with this (default fw)')
+    l_parser.add_argument(
+        '--release', default=r'fw\d{4}\.\d+-',
+        help='Regex matching the release part of a tag name, a new tag is ' \
+             +'prewarmed from the newest tag of its release before it ' \
+             +'(default fw\\d{4}\\.\\d+-)')
+    l_parser.add_argument(
+        '--interval', type=int, default=60,
+        help='Seconds between two polls (default 60)')
+    l_parser.add_argument(
+        '--once', action='store_true',
+        help='Poll once and exit, for running from cron')
+    l_parser.add_argument(
+        '--state', default=DEFAULT_STATE_FILE,
+        help='File keeping the known tags and the ETag of the last poll ' \
+             +'(default {})'.format(DEFAULT_STATE_FILE))
+    l_parser.add_argument(
+        '-v', '--verbose', dest='loglevel', action='store_const',
+        const=logging.INFO, default=logging.WARNING, help='Be verbose')
+    l_parser.add_argument(
+        'crn_args', nargs=argparse.REMAINDER,
+        help='-- followed by the crn.py options of the runs to prewarm ' \
+             +'for (-R, -D, -j, --graphql, --pr-index, --ewm-cache-ttl, ...)')
+    l_args = l_parser.parse_args(i_args)
+    if l_args.crn_args[0:1] == ['--']:
+        l_args.crn_args = l_args.crn_args[1:]
+    return l_args
+
+
+def main(i_args):
+    l_args = parse_arguments(i_args)
+    logging.basicConfig(level=l_args.loglevel)
+
+    # The ranges are filled in per tag, these only set up the caches
+    crn.configure(crn.parse_arguments(l_args.crn_args + ['-', '-']))
+
+    l_state = load_state(l_args.state, l_args.tag_repo_uri)
+    while True:
+        try:
+            watch_once(l_args, l_state)
+        except Exception as e:
+            logging.warning('Unable to poll the tags of {}: {}'.format(
+                l_args.tag_repo_uri, e))
+        save_state(l_args.state, l_args.tag_repo_uri, l_state)
+        if l_args.once:
+            return
+        time.sleep(l_args.interval)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
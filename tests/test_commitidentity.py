@@ -0,0 +1,162 @@
+###############################################################################
+# @file test_commitidentity
+# @brief Patch ids of API commits, and when they are worked out
+#
+#   python3 -m unittest discover tests
+###############################################################################
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(TESTS_DIR)]
+
+import commitcache  # noqa: E402
+import commitidentity  # noqa: E402
+import gitmirror  # noqa: E402
+from test_ghclient import git  # noqa: E402
+
+
+class File(object):
+    def __init__(self, i_filename, i_status, i_patch, i_changes=1):
+        self.filename = i_filename
+        self.status = i_status
+        self.patch = i_patch
+        self.changes = i_changes
+
+
+class Commit(object):
+    def __init__(self, i_sha, i_message, i_files):
+        self.sha = i_sha
+        self.commit = gitmirror.LocalGitCommit(
+            i_message, gitmirror.LocalAuthor('dev'), 'url')
+        self.stats = gitmirror.LocalStats(1, 1)
+        self.files = i_files
+
+
+class PatchIdTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        git(self.dir, 'init', '-q')
+
+    def git_commit(self, i_name, i_text, i_mode=None):
+        with open(os.path.join(self.dir, i_name), 'w') as l_file:
+            l_file.write(i_text)
+        if i_mode is not None:
+            os.chmod(os.path.join(self.dir, i_name), i_mode)
+        git(self.dir, 'add', i_name)
+        git(self.dir, 'commit', '-q', '-m', i_name)
+        l_sha = git(self.dir, 'rev-parse', 'HEAD')
+        l_diff = git(self.dir, 'show', '--format=commit %H', l_sha)
+        return l_sha, commitidentity.patch_ids(l_diff + '\n').get(l_sha)
+
+    def api_commit(self, i_sha, i_name, i_status):
+        # The API gives the hunks of a file as its patch
+        l_diff = git(self.dir, 'show', '--format=', i_sha)
+        l_patch = l_diff[l_diff.index('@@'):]
+        return Commit(i_sha, i_name, [File(i_name, i_status, l_patch)])
+
+    def test_same_as_git(self):
+        l_sha, l_git_id = self.git_commit('a', 'one\n')
+        self.assertEqual(commitidentity.patch_id(
+            self.api_commit(l_sha, 'a', 'added')), l_git_id)
+        l_sha, l_git_id = self.git_commit('a', 'one\ntwo\n')
+        self.assertEqual(commitidentity.patch_id(
+            self.api_commit(l_sha, 'a', 'modified')), l_git_id)
+
+    def test_added_executable_is_taken_as_regular(self):
+        l_sha, l_git_id = self.git_commit('run', 'echo\n', 0o755)
+        l_patch_id = commitidentity.patch_id(
+            self.api_commit(l_sha, 'run', 'added'))
+        self.assertIsNotNone(l_patch_id)
+        self.assertNotEqual(l_patch_id, l_git_id)
+
+    def test_file_without_patch(self):
+        l_commit = Commit('1' * 40, 'mode', [
+            File('a', 'modified', '@@ -1 +1 @@\n-a\n+b'),
+            File('run', 'modified', None, 0)])
+        self.assertIsNone(commitidentity.commit_diff(l_commit))
+        self.assertIsNone(commitidentity.patch_id(l_commit))
+        l_commit = Commit('2' * 40, 'rename', [File('b', 'renamed', None, 0)])
+        self.assertIsNotNone(commitidentity.commit_diff(l_commit))
+
+
+class CommitCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.patch_ids = commitidentity.patch_ids
+        self.addCleanup(setattr, commitidentity, 'patch_ids', self.patch_ids)
+
+    ###########################################################################
+    # commitTracker.py puts commits in the cache and never asks for their
+    # patch ids
+    ###########################################################################
+    def test_record_without_patch_id(self):
+        def patch_ids(i_diff):
+            raise AssertionError('git patch-id ran')
+        commitidentity.patch_ids = patch_ids
+
+        l_commit = Commit('3' * 40, 'change', [
+            File('a', 'modified', '@@ -1 +1 @@\n-a\n+b')])
+        l_record = commitcache.commit_to_record(l_commit)
+        self.assertNotIn('patch_id', l_record)
+        l_cached = commitcache.record_to_commit(l_commit.sha, l_record)
+        self.assertIs(l_cached.patch_id, commitidentity.UNKNOWN)
+        self.assertIsNone(commitidentity.patch_id(l_cached))
+
+    def test_record_with_patch_id(self):
+        l_commit = Commit('4' * 40, 'change', [
+            File('a', 'modified', '@@ -1 +1 @@\n-a\n+b')])
+        l_patch_id = commitidentity.patch_id(l_commit)
+        self.assertIsNotNone(l_patch_id)
+        l_cached = commitcache.record_to_commit(
+            l_commit.sha, commitcache.commit_to_record(l_commit))
+        self.assertEqual(commitidentity.patch_id(l_cached), l_patch_id)
+
+
+class IdentityIndexTest(unittest.TestCase):
+    def ref(self, i_repo_uri, i_sha):
+        return (i_repo_uri, i_repo_uri.split('/')[-1], i_sha, i_sha[:7])
+
+    ###########################################################################
+    # The same diff is one change only when a different bump of the same repo
+    # reached it
+    ###########################################################################
+    def test_same_diff(self):
+        l_commit = Commit('5' * 40, 'fix', [
+            File('a', 'modified', '@@ -1 +1 @@\n-a\n+b')])
+        l_pldm = commitidentity.identity('github.com/openbmc/pldm', l_commit)
+        l_bios = commitidentity.identity('github.com/openbmc/bios', l_commit)
+        self.assertNotEqual(l_pldm, l_bios)
+
+        l_index = commitidentity.IdentityIndex()
+        l_first = self.ref('github.com/openbmc/pldm', '5' * 40)
+        l_bump = ('github.com/openbmc/openbmc', 'a' * 40)
+        self.assertIsNone(l_index.claim(l_pldm, l_first, l_bump))
+        self.assertIsNone(l_index.claim(
+            l_bios, self.ref('github.com/openbmc/bios', '6' * 40), l_bump))
+        self.assertIsNone(l_index.claim(
+            l_pldm, self.ref('github.com/openbmc/pldm', '7' * 40), l_bump))
+        self.assertEqual(l_index.claim(l_pldm, l_first, l_bump), l_first)
+        self.assertEqual(l_index.claim(
+            l_pldm, self.ref('github.com/openbmc/pldm', '8' * 40),
+            ('github.com/openbmc/openbmc', 'b' * 40)), l_first)
+        self.assertIsNone(l_index.first(l_pldm))
+
+    def test_change_id(self):
+        l_identity = commitidentity.change_identity(
+            'fix\n\nChange-Id: I0123456789abcdef')
+        l_index = commitidentity.IdentityIndex()
+        l_first = self.ref('github.com/openbmc/pldm', '5' * 40)
+        self.assertIsNone(l_index.claim(l_identity, l_first))
+        self.assertEqual(l_index.first(l_identity), l_first)
+        self.assertEqual(l_index.claim(
+            l_identity, self.ref('github.com/openbmc/pldm', '6' * 40)),
+            l_first)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,376 @@
+###############################################################################
+# @file test_crn
+# @brief Report trees of crn.py walked on local mirrors
+#
+#   python3 -m unittest discover tests
+#
+# The fake GitHub repo only answers what the mirrors can't, the issues of
+# every commit are made up from its sha.
+###############################################################################
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+# fakes/ewm.py stands in for the ewm module crn.py connects with at import
+sys.path[:0] = [os.path.join(REPO_DIR, 'fakes'), REPO_DIR]
+
+import crn  # noqa: E402
+import ghclient  # noqa: E402
+import gitmirror  # noqa: E402
+import reportstore  # noqa: E402
+from test_ghclient import git  # noqa: E402
+
+OPENBMC_URI = 'github.com/openbmc/openbmc'
+
+RECIPE = '''SUMMARY = "{}"
+SRC_URI = "git://github.com/openbmc/pldm;branch=master"
+SRCREV = "{}"
+'''
+
+
+class Comparison(object):
+    def __init__(self, i_ahead_by, i_behind_by):
+        self.ahead_by = i_ahead_by
+        self.behind_by = i_behind_by
+
+
+class Commit(object):
+    def __init__(self, i_sha):
+        self.sha = i_sha
+
+
+###############################################################################
+# @class FakeRepo
+# @brief The API of a source repo, its commit lists are read from an up to
+#        date mirror of it
+###############################################################################
+class FakeRepo(object):
+    id = 1
+
+    def __init__(self, i_test, i_uri):
+        self.test = i_test
+        self.uri = i_uri
+        self.git_dir = i_test.source(i_uri)
+
+    def get_commit(self, i_ref):
+        return Commit(git(self.git_dir, 'rev-parse', i_ref + '^{commit}'))
+
+    def compare(self, i_base, i_head):
+        return Comparison(
+            int(git(self.git_dir, 'rev-list', '--count',
+                    i_base + '..' + i_head)),
+            int(git(self.git_dir, 'rev-list', '--count',
+                    i_head + '..' + i_base)))
+
+    def compare_commits(self, i_base, i_head):
+        self.test.compares.append((self.uri, i_base, i_head))
+        l_server_dir = os.path.join(self.test.dir, 'server')
+        self.test.update_mirrors(l_server_dir)
+        return gitmirror.mirror_commits(l_server_dir, self.uri, i_base,
+                                        i_head)
+
+
+class CrnTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        for l_name in ['mirror_dir', 'commit_cache', 'report_store',
+                       'subrepo_executor', 'graphql_enrichment', 'pr_index',
+                       'get_repo', 'get_closed_issues', 'subrepo_reports']:
+            self.addCleanup(setattr, crn, l_name, getattr(crn, l_name))
+        self.addCleanup(setattr, ghclient, 'compare_commits',
+                        ghclient.compare_commits)
+        crn.mirror_dir = os.path.join(self.dir, 'mirrors')
+        crn.commit_cache = None
+        crn.report_store = None
+        crn.subrepo_executor = None
+        crn.graphql_enrichment = False
+        crn.pr_index = None
+        crn.get_repo = lambda i_uri: FakeRepo(self, i_uri)
+        crn.get_closed_issues = lambda i_repo, i_commit: (
+            [], ['note ' + i_commit.sha[:7]], [])
+        self.compares = []
+        self.mirror_lock = threading.Lock()
+        ghclient.compare_commits = lambda i_repo, i_base, i_head: \
+            i_repo.compare_commits(i_base, i_head)
+
+        self.pldm = self.repo('pldm')
+        self.pldm_base = self.commit(self.pldm, 'base', {'pldm.c': 'base\n'})
+        self.openbmc = self.repo('openbmc')
+        self.commit(self.openbmc, 'base', {
+            'a/pldm_git.bb': RECIPE.format('a', self.pldm_base),
+            'b/pldm_git.bb': RECIPE.format('b', self.pldm_base)})
+        git(self.openbmc, 'tag', 'base')
+
+    def repo(self, i_name):
+        l_dir = self.source(i_name)
+        os.makedirs(l_dir)
+        git(l_dir, 'init', '-q', '-b', 'master')
+        return l_dir
+
+    def source(self, i_uri):
+        return os.path.join(self.dir, 'src', i_uri.split('/')[-1])
+
+    def commit(self, i_dir, i_message, i_files):
+        for l_name, l_text in i_files.items():
+            l_path = os.path.join(i_dir, l_name)
+            if not os.path.isdir(os.path.dirname(l_path)):
+                os.makedirs(os.path.dirname(l_path))
+            with open(l_path, 'w') as l_file:
+                l_file.write(l_text)
+            git(i_dir, 'add', l_name)
+        git(i_dir, 'commit', '-q', '-m', i_message)
+        return git(i_dir, 'rev-parse', 'HEAD')
+
+    ###########################################################################
+    # @brief Mirrors the source repos as they are now
+    #
+    # @param i_mirror_dir : Directory of the mirrors, crn.mirror_dir by
+    #                       default
+    ###########################################################################
+    def update_mirrors(self, i_mirror_dir=None):
+        with self.mirror_lock:
+            for l_name in ['openbmc', 'pldm']:
+                l_mirror = os.path.join(i_mirror_dir or crn.mirror_dir,
+                                        'github.com', 'openbmc',
+                                        l_name + '.git')
+                if os.path.isdir(l_mirror):
+                    git(l_mirror, 'fetch', '-q', '--force', 'origin',
+                        '+refs/*:refs/*')
+                else:
+                    git(self.dir, 'clone', '-q', '--mirror',
+                        self.source(l_name), l_mirror)
+
+    def reports(self, i_end, i_jobs=1):
+        if i_jobs > 1:
+            crn.subrepo_executor = ThreadPoolExecutor(max_workers=i_jobs)
+        try:
+            return [l_report.to_dict() for l_report in
+                    crn.generate_release_reports(OPENBMC_URI, 'base', i_end,
+                                                 i_end)]
+        finally:
+            if crn.subrepo_executor is not None:
+                crn.subrepo_executor.shutdown()
+            crn.subrepo_executor = None
+
+
+class DuplicateChangeTest(CrnTest):
+    ###########################################################################
+    # Both recipes bump pldm over the same commits. The second bump finishes
+    # first with -j 8, the tree still has the first one keep the changes
+    ###########################################################################
+    def test_jobs_give_the_same_tree(self):
+        l_pldm_end = self.commit(self.pldm, 'fix', {'pldm.c': 'fix\n'})
+        l_pldm_end = self.commit(self.pldm, 'feature', {'pldm.c': 'more\n'})
+        self.commit(self.openbmc, 'bump a', {
+            'a/pldm_git.bb': RECIPE.format('a', l_pldm_end)})
+        self.commit(self.openbmc, 'bump b', {
+            'b/pldm_git.bb': RECIPE.format('b', l_pldm_end)})
+        self.update_mirrors()
+
+        l_subrepo_reports = crn.subrepo_reports
+        l_lock = threading.Lock()
+        l_calls = []
+
+        def subrepo_reports(*args):
+            with l_lock:
+                l_calls.append(args)
+                l_first = len(l_calls) == 1
+            if l_first:
+                time.sleep(0.5)
+            return l_subrepo_reports(*args)
+
+        crn.subrepo_reports = subrepo_reports
+        l_serial = self.reports('master')
+        del l_calls[:]
+        l_parallel = self.reports('master', 8)
+
+        self.assertEqual(l_parallel, l_serial)
+        l_bump_a, l_bump_b = l_serial
+        self.assertEqual(l_bump_a['summary'], 'bump a')
+        self.assertEqual([l_sub['duplicate_of'] for l_sub
+                          in l_bump_a['subreports']], [None, None])
+        self.assertEqual([l_sub['duplicate_of'][2] for l_sub
+                          in l_bump_b['subreports']],
+                         [l_sub['sha'] for l_sub in l_bump_a['subreports']])
+        self.assertEqual(l_bump_b['subreports'][0]['notes'], [])
+
+    ###########################################################################
+    # The recipes follow two branches of pldm, the fix is cherry-picked from
+    # one to the other. The cherry-pick refers to the first commit and keeps
+    # what its own PR fixes
+    ###########################################################################
+    def cherry_pick(self, i_message):
+        l_fix = self.commit(self.pldm, i_message, {'fix.c': 'fix\n'})
+        git(self.pldm, 'checkout', '-q', '-b', 'release', self.pldm_base)
+        self.commit(self.pldm, 'release only', {'pldm.c': 'release\n'})
+        git(self.pldm, 'cherry-pick', l_fix)
+        l_pick = git(self.pldm, 'rev-parse', 'HEAD')
+        git(self.pldm, 'checkout', '-q', 'master')
+        self.commit(self.openbmc, 'bump a', {
+            'a/pldm_git.bb': RECIPE.format('a', l_fix)})
+        self.commit(self.openbmc, 'bump b', {
+            'b/pldm_git.bb': RECIPE.format('b', l_pick)})
+        self.update_mirrors()
+
+        l_bump_a, l_bump_b = self.reports('master')
+        self.assertEqual([l_sub['sha'] for l_sub in l_bump_a['subreports']],
+                         [l_fix])
+        l_release, l_copy = l_bump_b['subreports']
+        self.assertEqual(l_release['duplicate_of'], None)
+        self.assertEqual(l_copy['sha'], l_pick)
+        self.assertEqual(l_copy['duplicate_of'][2], l_fix)
+        self.assertEqual(l_copy['notes'], ['note ' + l_pick[:7]])
+
+    def test_cherry_pick_with_change_id(self):
+        self.cherry_pick('fix\n\nChange-Id: I0123456789abcdef')
+
+    def test_cherry_pick_without_change_id(self):
+        self.cherry_pick('fix')
+
+    ###########################################################################
+    # The same diff twice in one range is a change of its own each time
+    ###########################################################################
+    def test_reapply(self):
+        self.commit(self.openbmc, 'change', {'README': 'change\n'})
+        git(self.openbmc, 'revert', '--no-edit', 'HEAD')
+        git(self.openbmc, 'revert', '--no-edit', 'HEAD')
+        self.update_mirrors()
+
+        l_reports = self.reports('master')
+        self.assertEqual(len(l_reports), 3)
+        self.assertEqual([l_report['duplicate_of'] for l_report in l_reports],
+                         [None, None, None])
+        self.assertEqual(l_reports[0]['identity'], l_reports[2]['identity'])
+
+
+class StaleMirrorTest(CrnTest):
+    ###########################################################################
+    # The branch moved on after the last fetch of the mirror, which still has
+    # it at the old commit. The range is the one of the server
+    ###########################################################################
+    def test_branch_ahead_of_the_mirror(self):
+        self.commit(self.openbmc, 'first', {'README': 'one\n'})
+        self.update_mirrors()
+        l_second = self.commit(self.openbmc, 'second', {'README': 'two\n'})
+
+        self.assertEqual([l_report['summary'] for l_report
+                          in self.reports('master')], ['first', 'second'])
+        self.assertEqual(self.compares, [
+            (OPENBMC_URI, git(self.openbmc, 'rev-parse', 'base'), l_second)])
+
+    def test_mirror_up_to_date(self):
+        self.commit(self.openbmc, 'first', {'README': 'one\n'})
+        self.update_mirrors()
+
+        self.assertEqual([l_report['summary'] for l_report
+                          in self.reports('master')], ['first'])
+        self.assertEqual(self.compares, [])
+
+
+class ReportStoreTest(CrnTest):
+    def setUp(self):
+        super(ReportStoreTest, self).setUp()
+        crn.report_store = reportstore.ReportStore(self.dir)
+        self.addCleanup(setattr, crn, 'generate_commit_reports',
+                        crn.generate_commit_reports)
+        self.walks = []
+        l_generate_commit_reports = crn.generate_commit_reports
+
+        def generate_commit_reports(i_repo_uri, i_begin_commit, *args):
+            if i_repo_uri == OPENBMC_URI:
+                self.walks.append(i_begin_commit)
+            return l_generate_commit_reports(i_repo_uri, i_begin_commit,
+                                             *args)
+
+        crn.generate_commit_reports = generate_commit_reports
+
+    ###########################################################################
+    # The range of a branch is stored under its name, the next run after the
+    # branch moved walks the new commits instead of reusing the old range
+    ###########################################################################
+    def test_branch_moves(self):
+        l_first = self.commit(self.openbmc, 'first', {'README': 'one\n'})
+        self.update_mirrors()
+        self.assertEqual([l_report['summary']
+                          for l_report in self.reports('master')], ['first'])
+        self.assertEqual(self.walks, [git(self.openbmc, 'rev-parse', 'base')])
+
+        del self.walks[:]
+        self.assertEqual([l_report['summary']
+                          for l_report in self.reports('master')], ['first'])
+        self.assertEqual(self.walks, [])
+
+        self.commit(self.openbmc, 'second', {'README': 'two\n'})
+        self.update_mirrors()
+        del self.walks[:]
+        self.assertEqual([l_report['summary'] for l_report
+                          in self.reports('master')], ['first', 'second'])
+        self.assertEqual(self.walks, [l_first])
+
+        # Moved back, the stored range is ahead of it
+        git(self.openbmc, 'reset', '-q', '--hard', l_first)
+        self.update_mirrors()
+        del self.walks[:]
+        self.assertEqual([l_report['summary']
+                          for l_report in self.reports('master')], ['first'])
+        self.assertEqual(self.walks, [git(self.openbmc, 'rev-parse', 'base')])
+
+
+class CqUpdateTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.addCleanup(setattr, crn, 'cqcmd', crn.cqcmd)
+        crn.cqcmd = os.path.join(REPO_DIR, 'fakes', 'cqcmd.pl')
+        self.data_file = os.path.join(self.dir, 'cq.json')
+        l_environ = dict(os.environ)
+        self.addCleanup(os.environ.clear)
+        self.addCleanup(os.environ.update, l_environ)
+        os.environ['CQCMD_FAKE_DATA'] = self.data_file
+
+    def defects(self):
+        with open(self.data_file) as l_file:
+            return json.load(l_file)['defect']
+
+    ###########################################################################
+    # The fields of a defect go out in one -fields argument, a value with
+    # its separators in it would write other fields
+    ###########################################################################
+    def test_values_with_field_separators(self):
+        l_defects = {
+            'SW000001': {'Notes_Log': 'old note', 'keywords': 'kw',
+                         'Priority_Justification': 'why'},
+            'SW000002': {'Notes_Log': '', 'keywords': 'a~~Headline::gone',
+                         'Priority_Justification': ''},
+            'SW000003': {'Notes_Log': '', 'keywords': 'Merged',
+                         'Priority_Justification': 'see::this'},
+        }
+        with open(self.data_file, 'w') as l_file:
+            json.dump({'defect': l_defects}, l_file)
+
+        l_changes = crn.update_cq_bulk(sorted(l_defects), 'fw1020.00-57.10')
+
+        self.assertEqual(l_changes, {
+            'SW000001': ['Note_Entry', 'Priority_Justification', 'Keywords'],
+            'SW000002': None, 'SW000003': None})
+        l_after = self.defects()
+        self.assertEqual(l_after['SW000001'], {
+            'Notes_Log': 'old note\nOPENBMC_TAG:fw1020.00-57.10',
+            'keywords': 'kw\nMerged',
+            'Priority_Justification': 'OPENBMC_TAG:fw1020.00-57.10\nwhy'})
+        self.assertEqual(l_after['SW000002'], l_defects['SW000002'])
+        self.assertEqual(l_after['SW000003'], l_defects['SW000003'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+###############################################################################
+# @file test_ghclient
+# @brief Walking a range on the commit list, for servers that don't page
+#        compare answers
+#
+#   python3 -m unittest discover tests
+###############################################################################
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+sys.path[:0] = [os.path.join(REPO_DIR, 'fakes'), REPO_DIR]
+
+import ghclient  # noqa: E402
+
+
+def git(i_dir, *i_args, **i_kwargs):
+    l_env = dict(os.environ, GIT_AUTHOR_NAME='dev', GIT_AUTHOR_EMAIL='dev@x',
+                 GIT_COMMITTER_NAME='dev', GIT_COMMITTER_EMAIL='dev@x')
+    if 'date' in i_kwargs:
+        l_env['GIT_AUTHOR_DATE'] = l_env['GIT_COMMITTER_DATE'] = \
+            i_kwargs['date'] + ' +0000'
+    return subprocess.check_output(['git', '-C', i_dir] + list(i_args),
+                                   env=l_env).decode().strip()
+
+
+class Repo(object):
+    url = 'https://api.github.com/repos/owner/repo'
+
+
+class WalkCommitListTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.page_size = ghclient.PAGE_SIZE
+        self.get_json = ghclient.get_json
+        self.addCleanup(setattr, ghclient, 'PAGE_SIZE', self.page_size)
+        self.addCleanup(setattr, ghclient, 'get_json', self.get_json)
+
+    def commit(self, i_name, i_date):
+        git(self.dir, 'commit', '-q', '--allow-empty', '-m', i_name,
+            date=i_date)
+        return git(self.dir, 'rev-parse', 'HEAD')
+
+    def serve(self, i_page_size):
+        l_items = []
+        for l_line in git(self.dir, 'log', '--format=%H|%P',
+                          'HEAD').splitlines():
+            l_sha, l_parents = l_line.split('|')
+            l_items.append({'sha': l_sha, 'parents': [
+                {'sha': l_parent} for l_parent in l_parents.split()]})
+
+        def get_json(i_host, i_url, i_params):
+            l_start = (i_params['page'] - 1) * i_params['per_page']
+            return l_items[l_start:l_start + i_params['per_page']]
+
+        ghclient.PAGE_SIZE = i_page_size
+        ghclient.get_json = get_json
+
+    ###########################################################################
+    # A side branch of the range merged an old commit of the main line. The
+    # commit list has it well before the oldest commit of the range
+    ###########################################################################
+    def test_merge_of_an_ancestor_of_the_merge_base(self):
+        git(self.dir, 'init', '-q', '-b', 'master')
+        self.commit('a0', '2020-01-01T00:00:00')
+        l_fork = self.commit('a1', '2020-01-02T00:00:00')
+        for l_count in range(2, 40):
+            self.commit('a{}'.format(l_count),
+                        '2020-01-03T00:{:02}:00'.format(l_count))
+        l_merge_base = git(self.dir, 'rev-parse', 'HEAD')
+        l_old = git(self.dir, 'rev-parse', 'HEAD~20')
+
+        git(self.dir, 'checkout', '-q', '-b', 'side', l_fork)
+        self.commit('s1', '2020-01-02T01:00:00')
+        git(self.dir, 'merge', '-q', '--no-ff', '-m', 'sync', l_old,
+            date='2021-01-01T00:00:00')
+        self.commit('s2', '2021-01-02T00:00:00')
+        git(self.dir, 'checkout', '-q', 'master')
+        self.commit('c1', '2021-01-03T00:00:00')
+        git(self.dir, 'merge', '-q', '--no-ff', '-m', 'merge', 'side',
+            date='2021-01-04T00:00:00')
+
+        l_range = git(self.dir, 'rev-list', '--reverse',
+                      l_merge_base + '..HEAD').split()
+        self.assertEqual(len(l_range), 5)
+        for l_page_size in [3, 7, 100]:
+            self.serve(l_page_size)
+            l_found = ghclient.walk_commit_list(
+                'github.com', Repo(), 'master', l_merge_base, len(l_range))
+            self.assertEqual([l_item['sha'] for l_item in l_found], l_range)
+
+    def test_total_not_in_the_list(self):
+        git(self.dir, 'init', '-q', '-b', 'master')
+        l_merge_base = self.commit('a0', '2020-01-01T00:00:00')
+        self.commit('a1', '2020-01-02T00:00:00')
+        self.serve(100)
+        with self.assertRaises(ValueError):
+            ghclient.walk_commit_list('github.com', Repo(), 'master',
+                                      l_merge_base, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()